@@ -0,0 +1,133 @@
+from VMWriter import Op, Segment, Instruction
+
+# Code for array element loads (a[i] in an expression) and stores (let a[i] = value)
+# The plain code computes the element's address:
+#   load:  index; push a; add; pop pointer 1; push that 0
+#   store: index; push a; add; value; pop temp 0; pop pointer 1; push temp 0; pop that 0
+# The address of a store stays on the stack while the value is computed, since the value may
+# call a subroutine that uses pointer 1 and the temps itself.
+# With optimize (-O):
+#  - a constant index c isn't added, pointer 1 is set to a and the element is 'that c'
+#  - a store whose value has no calls and no array loads sets pointer 1 first and pops the value
+#    straight into the element
+#  - an address already in pointer 1 earlier in the statement is reused, e.g. a[i] + a[i] and
+#    let a[i] = a[i] + 1 compute the address of a[i] once
+POP_POINTER_1 = Instruction(Op.POP, Segment.POINTER, 1)
+
+# True if code reads that before it sets pointer 1, i.e. relies on an address set before it
+def readsThatFirst(code):
+    for instruction in code:
+        if instruction == POP_POINTER_1:
+            return False
+        if instruction.arg1 == Segment.THAT:
+            return True
+    return False
+
+# True if code may change pointer 1: it sets it or calls a subroutine (which may be inlined, see Inliner)
+def changesPointer(code):
+    return any(instruction.op == Op.CALL or instruction == POP_POINTER_1 for instruction in code)
+
+class ArrayAccessWriter:
+    # vmWriter: the code generator's VMWriter
+    # optimize: specialize the code as above
+    # stats: the code generator's optimization counters
+    def __init__(self, vmWriter, optimize, stats):
+        self.vmWriter = vmWriter
+        self.optimize = optimize
+        self.stats = stats
+        # (key, position): pointer 1 holds the address of key since position, see __address
+        self.__pointer = None
+
+    # Forgets what pointer 1 points at, called at the start of every statement
+    def reset(self):
+        self.__pointer = None
+
+    def __count(self, key):
+        self.stats[key] = self.stats.get(key, 0) + 1
+
+    # Identifies the address of an element whose index code was written since indexStart
+    # Returns (key, offset): pointer 1 = the address identified by key (None if it can't be
+    # identified, the index has calls) and the element is 'that offset'.
+    # A constant index is dropped and its key is the array's base address
+    def __address(self, symbol, indexStart, indexValue):
+        if indexValue is not None and 0 <= indexValue <= 32767:
+            self.vmWriter.truncate(indexStart)
+            self.__count("array constant indexes folded")
+            return (symbol.segment, symbol.index, None), indexValue
+        indexCode = tuple(self.vmWriter.instructions[indexStart:])
+        if any(instruction.op == Op.CALL for instruction in indexCode):
+            return None, 0
+        return (symbol.segment, symbol.index, indexCode), 0
+
+    # True if pointer 1 still holds the address of key, set since position atLeast
+    def __holds(self, key, atLeast=0):
+        if key is None or self.__pointer is None or self.__pointer[0] != key:
+            return False
+        code = self.vmWriter.instructions
+        position = self.__pointer[1]
+        if position < atLeast or position > len(code) or code[position - 1] != POP_POINTER_1:
+            return False
+        return not changesPointer(code[position:])
+
+    # Writes pointer 1 = the address, after the array's index code
+    def __writeAddress(self, symbol, key):
+        self.vmWriter.writePush(symbol.segment, symbol.index)
+        if key is None or key[2] is not None:
+            self.vmWriter.writeArithmetic("ADD")
+        self.vmWriter.writePop("POINTER", 1)
+        self.__pointer = (key, self.vmWriter.position()) if key is not None else None
+
+    # Writes the load of symbol[index], the index code was written since indexStart
+    # indexValue: the index if it is a compile time constant, None otherwise
+    def writeLoad(self, symbol, indexStart, indexValue):
+        if not self.optimize:
+            self.vmWriter.writePush(symbol.segment, symbol.index)
+            self.vmWriter.writeArithmetic("ADD")
+            self.vmWriter.writePop("POINTER", 1)
+            self.vmWriter.writePush("THAT", 0)
+            return
+        key, offset = self.__address(symbol, indexStart, indexValue)
+        if self.__holds(key):
+            # the index code has no calls, so it can go
+            self.vmWriter.truncate(indexStart)
+            self.__count("array pointer reuses")
+        else:
+            self.__writeAddress(symbol, key)
+        self.vmWriter.writePush("THAT", offset)
+
+    # Writes the first half of a store to symbol[index], after the index code written since indexStart
+    # Returns the target to pass to writeStore once the value's code has been written
+    def writeStoreAddress(self, symbol, indexStart, indexValue):
+        if not self.optimize:
+            key, offset = None, 0
+        else:
+            key, offset = self.__address(symbol, indexStart, indexValue)
+        addressStart = self.vmWriter.position()
+        self.vmWriter.writePush(symbol.segment, symbol.index)
+        if key is None or key[2] is not None:
+            self.vmWriter.writeArithmetic("ADD")
+        return (key, offset, indexStart if key is not None and key[2] is not None else addressStart)
+
+    # Writes the second half of a store, the value's code was written since valueStart
+    def writeStore(self, target, valueStart):
+        key, offset, addressStart = target
+        value = self.vmWriter.instructions[valueStart:]
+        if self.optimize:
+            if self.__holds(key, valueStart) and not readsThatFirst(value):
+                # the value loaded the element itself, e.g. let a[i] = a[i] + 1
+                self.vmWriter.truncate(addressStart)
+                self.vmWriter.writeInstructions(value)
+                self.vmWriter.writePop("THAT", offset)
+                self.__count("array pointer reuses")
+                return
+            if not changesPointer(value) and not any(instruction.arg1 == Segment.THAT for instruction in value):
+                self.vmWriter.truncate(valueStart)
+                self.vmWriter.writePop("POINTER", 1)
+                self.vmWriter.writeInstructions(value)
+                self.vmWriter.writePop("THAT", offset)
+                self.__count("array stores without spill")
+                return
+        self.vmWriter.writePop("TEMP", 0)
+        self.vmWriter.writePop("POINTER", 1)
+        self.vmWriter.writePush("TEMP", 0)
+        self.vmWriter.writePop("THAT", offset)
@@ -0,0 +1,251 @@
+import sys
+from collections import deque
+from JackTokenizer import EOF_TOKEN, KEYWORD, SYMBOL, IDENTIFIER, INT_CONST, STRING_CONST
+from JackAST import (ClassNode, VarDec, SubroutineNode, LetStatement, IfStatement, WhileStatement, DoStatement, ReturnStatement,
+                     Expression, IntegerConstant, StringConstant, KeywordConstant, VarRef, ArrayAccess, SubroutineCall, UnaryOp)
+
+# Parses the tokens of a Jack class into a JackAST.ClassNode. Only the syntax is checked here,
+# names are resolved by CodeGenerator
+class AstParser:
+    # tokenList: JackTokenizer.Token records, or any iterable of them
+    # sourceName: name of the jack source, used in error messages
+    def __init__(self, tokenList, sourceName=""):
+        self.sourceName = sourceName
+        self.__tokens = iter(tokenList)
+        self.__lookAhead = deque()
+        self.__tokenIdx = -1
+        self.currentToken = EOF_TOKEN
+        self.__typeKeywords = set(["int", "char", "boolean"])
+        self.__keywordConstants = set(["true", "false", "null", "this"])
+        self.__opSymbols = set(["+", "-", "*", "/", "&", "|", "<", ">", "="])
+        self.__unaryOps = set(["-", "~"])
+        self.__advanceToken()
+
+    def __advanceToken(self):
+        token = self.__lookAhead.popleft() if self.__lookAhead else next(self.__tokens, None)
+        if token is not None:
+            self.__tokenIdx = self.__tokenIdx + 1
+            self.currentToken = token
+        else:
+            self.currentToken = EOF_TOKEN
+
+    # Returns the token k positions after the current one without moving, EOF_TOKEN past the end
+    def peek(self, k=1):
+        while len(self.__lookAhead) < k:
+            token = next(self.__tokens, None)
+            if token is None:
+                return EOF_TOKEN
+            self.__lookAhead.append(token)
+        return self.__lookAhead[k - 1]
+
+    # detail: optional explanation appended to the message
+    def __exitError(self, detail=None):
+        sys.exit("ERROR: Token " + str(self.__tokenIdx + 1) + " Invalid token '" + self.currentToken.text + "' in " + self.sourceName
+                 + ("" if detail is None else ": " + detail))
+
+    def __isSymbol(self, text):
+        return self.currentToken.kind == SYMBOL and self.currentToken.text == text
+
+    def __isKeyword(self, *texts):
+        return self.currentToken.kind == KEYWORD and self.currentToken.text in texts
+
+    # Consumes the current token, which must be of kind (and be text, if given)
+    # Returns its text
+    def __expect(self, kind, text=None):
+        token = self.currentToken
+        if token.kind != kind or (text is not None and token.text != text):
+            self.__exitError("expected " + (text if text is not None else "a name"))
+        self.__advanceToken()
+        return token.text
+
+    # 'int' | 'char' | 'boolean' | className, and 'void' when allowVoid
+    def __parseType(self, allowVoid=False):
+        if self.currentToken.kind == KEYWORD and (self.currentToken.text in self.__typeKeywords or (allowVoid and self.currentToken.text == "void")):
+            text = self.currentToken.text
+            self.__advanceToken()
+            return text
+        return self.__expect(IDENTIFIER)
+
+    def parseClass(self):
+        self.__expect(KEYWORD, "class")
+        name = self.__expect(IDENTIFIER)
+        self.__expect(SYMBOL, "{")
+        classVarDecs = []
+        while self.__isKeyword("static", "field"):
+            classVarDecs.append(self.__parseVarDec())
+        subroutines = []
+        while self.__isKeyword("constructor", "function", "method"):
+            subroutines.append(self.__parseSubroutine())
+        self.__expect(SYMBOL, "}")
+        return ClassNode(name, classVarDecs, subroutines)
+
+    # ('static' | 'field' | 'var') type varName (',' varName)* ';'
+    def __parseVarDec(self):
+        kind = self.currentToken.text
+        self.__advanceToken()
+        varType = self.__parseType()
+        names = [self.__expect(IDENTIFIER)]
+        while self.__isSymbol(","):
+            self.__advanceToken()
+            names.append(self.__expect(IDENTIFIER))
+        self.__expect(SYMBOL, ";")
+        return VarDec(kind, varType, names)
+
+    def __parseSubroutine(self):
+        kind = self.currentToken.text
+        self.__advanceToken()
+        returnType = self.__parseType(allowVoid=True)
+        name = self.__expect(IDENTIFIER)
+        self.__expect(SYMBOL, "(")
+        parameters = []
+        if not self.__isSymbol(")"):
+            parameters.append((self.__parseType(), self.__expect(IDENTIFIER)))
+            while self.__isSymbol(","):
+                self.__advanceToken()
+                parameters.append((self.__parseType(), self.__expect(IDENTIFIER)))
+        self.__expect(SYMBOL, ")")
+        self.__expect(SYMBOL, "{")
+        varDecs = []
+        while self.__isKeyword("var"):
+            varDecs.append(self.__parseVarDec())
+        statements = self.__parseStatements()
+        if not self.__isSymbol("}"):
+            self.__exitError("subroutines must be defined as variable declarations followed by statements followed by a } symbol.")
+        self.__advanceToken()
+        return SubroutineNode(kind, returnType, name, parameters, varDecs, statements)
+
+    def __parseStatements(self):
+        statements = []
+        while self.currentToken.kind == KEYWORD:
+            keyword = self.currentToken.text
+            if keyword == "let":
+                statements.append(self.__parseLet())
+            elif keyword == "if":
+                statements.append(self.__parseIf())
+            elif keyword == "while":
+                statements.append(self.__parseWhile())
+            elif keyword == "do":
+                statements.append(self.__parseDo())
+            elif keyword == "return":
+                statements.append(self.__parseReturn())
+            else:
+                self.__exitError()
+        return statements
+
+    # '{' statements '}'
+    def __parseBlock(self):
+        self.__expect(SYMBOL, "{")
+        statements = self.__parseStatements()
+        self.__expect(SYMBOL, "}")
+        return statements
+
+    # '(' expression ')'
+    def __parseCondition(self):
+        self.__expect(SYMBOL, "(")
+        condition = self.__parseExpression()
+        self.__expect(SYMBOL, ")")
+        return condition
+
+    def __parseLet(self):
+        self.__advanceToken() # let
+        name = self.__expect(IDENTIFIER)
+        index = None
+        if self.__isSymbol("["):
+            self.__advanceToken()
+            index = self.__parseExpression()
+            self.__expect(SYMBOL, "]")
+        self.__expect(SYMBOL, "=")
+        value = self.__parseExpression()
+        self.__expect(SYMBOL, ";")
+        return LetStatement(name, index, value)
+
+    def __parseIf(self):
+        self.__advanceToken() # if
+        condition = self.__parseCondition()
+        statements = self.__parseBlock()
+        elseStatements = None
+        if self.__isKeyword("else"):
+            self.__advanceToken()
+            elseStatements = self.__parseBlock()
+        return IfStatement(condition, statements, elseStatements)
+
+    def __parseWhile(self):
+        self.__advanceToken() # while
+        condition = self.__parseCondition()
+        return WhileStatement(condition, self.__parseBlock())
+
+    def __parseDo(self):
+        self.__advanceToken() # do
+        if self.currentToken.kind != IDENTIFIER:
+            self.__exitError("expected a subroutine call")
+        call = self.__parseSubroutineCall()
+        self.__expect(SYMBOL, ";")
+        return DoStatement(call)
+
+    def __parseReturn(self):
+        self.__advanceToken() # return
+        value = None
+        if not self.__isSymbol(";"):
+            value = self.__parseExpression()
+        self.__expect(SYMBOL, ";")
+        return ReturnStatement(value)
+
+    # term (op term)*
+    def __parseExpression(self):
+        terms = [self.__parseTerm()]
+        ops = []
+        while self.currentToken.kind == SYMBOL and self.currentToken.text in self.__opSymbols:
+            ops.append(self.currentToken.text)
+            self.__advanceToken()
+            terms.append(self.__parseTerm())
+        return Expression(terms, ops)
+
+    def __parseTerm(self):
+        token = self.currentToken
+        if token.kind == INT_CONST:
+            self.__advanceToken()
+            return IntegerConstant(int(token.text))
+        elif token.kind == STRING_CONST:
+            self.__advanceToken()
+            return StringConstant(token.text)
+        elif token.kind == KEYWORD and token.text in self.__keywordConstants:
+            self.__advanceToken()
+            return KeywordConstant(token.text)
+        elif token.kind == IDENTIFIER:
+            nextToken = self.peek()
+            if nextToken.kind == SYMBOL and (nextToken.text == "(" or nextToken.text == "."):
+                return self.__parseSubroutineCall()
+            self.__advanceToken()
+            if nextToken.kind == SYMBOL and nextToken.text == "[":
+                self.__advanceToken() # [
+                index = self.__parseExpression()
+                self.__expect(SYMBOL, "]")
+                return ArrayAccess(token.text, index)
+            return VarRef(token.text)
+        elif token.kind == SYMBOL and token.text == "(":
+            self.__advanceToken()
+            expression = self.__parseExpression()
+            self.__expect(SYMBOL, ")")
+            return expression
+        elif token.kind == SYMBOL and token.text in self.__unaryOps:
+            self.__advanceToken()
+            return UnaryOp(token.text, self.__parseTerm())
+        self.__exitError("expected a term")
+
+    # subroutineName '(' expressionList ')' | (className | varName) '.' subroutineName '(' expressionList ')'
+    def __parseSubroutineCall(self):
+        receiver = None
+        name = self.__expect(IDENTIFIER)
+        if self.__isSymbol("."):
+            self.__advanceToken()
+            receiver = name
+            name = self.__expect(IDENTIFIER)
+        self.__expect(SYMBOL, "(")
+        arguments = []
+        if not self.__isSymbol(")"):
+            arguments.append(self.__parseExpression())
+            while self.__isSymbol(","):
+                self.__advanceToken()
+                arguments.append(self.__parseExpression())
+        self.__expect(SYMBOL, ")")
+        return SubroutineCall(receiver, name, arguments)
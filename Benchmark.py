@@ -0,0 +1,131 @@
+import sys, os, time, json, tempfile, shutil, subprocess, argparse
+import JackCompiler, CompilationEngine, JackGenerator
+
+# Compiler throughput benchmark over generated corpora (see JackGenerator.py).
+# Every preset runs in a fresh interpreter so its peak RSS is its own. Results are printed
+# (or written with --output) as a JSON list with one record per preset:
+#   python3 Benchmark.py --preset small medium deep-expressions --output bench.json
+
+PRESETS = {
+    "tiny": {"classes": 10, "functions": 2, "statements": 6},
+    "small": {"classes": 100},
+    "medium": {"classes": 1000},
+    "large": {"classes": 10000},
+    "deep-expressions": {"classes": 10, "depth": 120},
+    "long-strings": {"classes": 10, "stringLength": 4000},
+    "heavy-comments": {"classes": 100, "comments": 8}
+}
+
+# Peak resident set size of this process in KiB, None where the resource module is missing
+def peakRssKiB():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KiB elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+# Generates the preset's corpus and compiles it file by file, timing each phase
+# Returns the result record
+def runPreset(name, settings):
+    directory = tempfile.mkdtemp(prefix="jackbench-")
+    try:
+        generator = JackGenerator.JackGenerator(settings)
+        paths = generator.write(directory)
+        sourceBytes = sum(os.path.getsize(path) for path in paths)
+
+        phases = {"tokenize": 0.0, "parse": 0.0, "write": 0.0}
+        tokenCount = 0
+        instructionCount = 0
+        for path in paths:
+            start = time.perf_counter()
+            with open(path, "r", encoding="utf-8") as file:
+                tokens = JackCompiler.tokenize(file)
+            parseStart = time.perf_counter()
+            engine = CompilationEngine.CompilationEngine(tokens, JackCompiler.vmPathFor(path), path)
+            engine.compileClass(writeOutput=False)
+            writeStart = time.perf_counter()
+            engine.vmWriter.close()
+            end = time.perf_counter()
+
+            phases["tokenize"] += parseStart - start
+            phases["parse"] += writeStart - parseStart
+            phases["write"] += end - writeStart
+            tokenCount += len(tokens)
+            instructionCount += len(engine.vmWriter.instructions)
+
+        total = sum(phases.values())
+        return {
+            "preset": name,
+            "settings": generator.settings,
+            "files": len(paths),
+            "sourceBytes": sourceBytes,
+            "tokens": tokenCount,
+            "instructions": instructionCount,
+            "seconds": {phase: round(seconds, 6) for phase, seconds in phases.items()},
+            "totalSeconds": round(total, 6),
+            "tokensPerSecond": round(tokenCount / total, 1) if total > 0 else None,
+            "tokenizeTokensPerSecond": round(tokenCount / phases["tokenize"], 1) if phases["tokenize"] > 0 else None,
+            "filesPerSecond": round(len(paths) / total, 2) if total > 0 else None,
+            "peakRssKiB": peakRssKiB(),
+            "python": sys.version.split()[0]
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+# Compares results with an earlier run, prints the throughput ratio per preset
+# Returns the names of the presets that got slower by more than tolerance (a fraction)
+def compare(results, baselinePath, tolerance):
+    with open(baselinePath, "r", encoding="utf-8") as file:
+        baseline = {record["preset"]: record for record in json.load(file)}
+    regressions = []
+    for record in results:
+        before = baseline.get(record["preset"])
+        if before is None or not before["tokensPerSecond"] or not record["tokensPerSecond"]:
+            continue
+        ratio = record["tokensPerSecond"] / before["tokensPerSecond"]
+        print(record["preset"] + ": " + format(ratio, ".2f") + "x tokens/s of baseline", file=sys.stderr)
+        if ratio < 1 - tolerance:
+            regressions.append(record["preset"])
+    return regressions
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description="Benchmarks compiler throughput on generated Jack corpora")
+    parser.add_argument("--preset", nargs="+", default=["tiny", "small", "deep-expressions", "long-strings", "heavy-comments"],
+                        choices=sorted(PRESETS), help="corpora to run (default: all but medium and large)")
+    parser.add_argument("--output", help="write the JSON results to this file instead of printing them")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON output of an earlier run, exit with an error if a preset got slower")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown for --compare as a fraction (default: 0.2)")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main():
+    args = parseArgs(sys.argv[1:])
+    if args.run_one is not None:
+        # child process: run a single preset and print its record
+        print(json.dumps(runPreset(args.run_one, PRESETS[args.run_one])))
+        return
+
+    results = []
+    for name in args.preset:
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-one", name], capture_output=True, text=True)
+        if child.returncode != 0:
+            sys.exit("ERROR: preset " + name + " failed" + os.linesep + child.stderr)
+        results.append(json.loads(child.stdout))
+        print(name + ": " + str(results[-1]["tokensPerSecond"]) + " tokens/s, " + str(results[-1]["filesPerSecond"]) + " files/s", file=sys.stderr)
+
+    report = json.dumps(results, indent=2)
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(report + os.linesep)
+    else:
+        print(report)
+
+    if args.compare is not None:
+        regressions = compare(results, args.compare, args.tolerance)
+        if len(regressions) > 0:
+            sys.exit("ERROR: slower than baseline: " + ", ".join(regressions))
+
+if __name__ == "__main__":
+    main()
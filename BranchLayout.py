@@ -0,0 +1,170 @@
+from VMWriter import Op, Segment, Instruction, constantInstructions
+
+# Layout of if and while statements
+# The code generators compile the parts of a statement (condition, blocks) one after the other
+# and the functions here rearrange them. The plain layout is
+#   if:    cond; not; if-goto ELSE; then; goto END; label ELSE; else; label END
+#   while: label START; cond; not; if-goto END; body; goto START; label END
+# not is bitwise, so the plain layout runs the then block (or the loop body) only when the
+# condition is exactly -1 (true), any other value counts as false.
+# With optimize (-O) the condition is complemented where that costs nothing (a comparison
+# followed by not, '=', '<' and '>' with a constant) and empty blocks get no jumps or labels.
+# When the condition can only be 0 or -1 (see isBoolean), an if/else whose condition can't be
+# complemented branches to its then block instead, and while loops are rotated so an iteration
+# runs the condition and a single if-goto:
+#   if:    cond'; if-goto END; then; label END
+#          cond'; if-goto ELSE; then; goto END; label ELSE; else; label END
+#          cond; if-goto THEN; else; goto END; label THEN; then; label END
+#   while: goto TEST; label START; body; label TEST; cond; if-goto START
+
+COMPARISONS = (Op.EQ, Op.GT, Op.LT)
+
+# Recognizes a constant operand ending just before code[end]: 'push constant c' or 'push constant c; neg'
+# Returns (value, length) or None
+def constantBefore(code, end):
+    if end >= 2 and code[end - 1].op == Op.NEG and code[end - 2].op == Op.PUSH and code[end - 2].arg1 == Segment.CONSTANT:
+        return (-code[end - 2].arg2, 2)
+    if end >= 1 and code[end - 1].op == Op.PUSH and code[end - 1].arg1 == Segment.CONSTANT:
+        return (code[end - 1].arg2, 1)
+    return None
+
+# Whether the code of a Jack expression can only leave 0 or -1: a comparison, true or false, or
+# &, | and ~ over such values. Anything else (a variable, a call, x & 1) may leave another value,
+# which if-goto would treat as true where the plain layout's not treats it as false
+def isBoolean(condition):
+    # per stack entry: True (0 or -1), a constant value, or None (unknown)
+    stack = []
+    for instruction in condition:
+        op = instruction.op
+        if op == Op.PUSH:
+            stack.append(instruction.arg2 if instruction.arg1 == Segment.CONSTANT else None)
+            continue
+        if op == Op.LABEL or op == Op.GOTO or op == Op.IF_GOTO or op == Op.RETURN or op == Op.FUNCTION:
+            return False
+        if op == Op.CALL:
+            popped = instruction.arg2
+        elif op == Op.POP or op == Op.NEG or op == Op.NOT:
+            popped = 1
+        else:
+            popped = 2
+        if len(stack) < popped:
+            return False
+        operands = stack[len(stack) - popped:]
+        del stack[len(stack) - popped:]
+        if op == Op.POP:
+            continue
+        if op in COMPARISONS:
+            result = True
+        elif op == Op.NOT:
+            result = operands[0] if operands[0] is True or operands[0] is None else ~operands[0]
+        elif op == Op.NEG:
+            result = -operands[0] if operands[0] is not None and operands[0] is not True else None
+        elif op == Op.AND or op == Op.OR:
+            result = True if all(operand is True or operand in (0, -1) for operand in operands) else None
+        else:
+            result = None
+        stack.append(result)
+    return len(stack) == 1 and (stack[0] is True or stack[0] in (0, -1))
+
+# Code leaving a value that is true (non-zero) exactly when condition is false
+# condition: the code of a Jack expression
+# Returns (code, free), free when the code is no longer than the condition's
+def complementCondition(condition):
+    last = len(condition) - 1
+    if last >= 1 and condition[last].op == Op.NOT and condition[last - 1].op in COMPARISONS:
+        # not (x < y) is false exactly when x < y is true
+        return condition[:last], True
+    if last >= 2 and condition[last].op == Op.EQ and condition[last - 1] == Instruction(Op.PUSH, Segment.CONSTANT, 0):
+        # x = 0 is false exactly when x is non-zero
+        return condition[:last - 1], True
+    if last >= 2 and condition[last].op == Op.EQ:
+        # x = y is false exactly when x - y is non-zero
+        return condition[:last] + [Instruction(Op.SUB, None, None)], True
+    if last >= 2 and condition[last].op in (Op.LT, Op.GT):
+        constant = constantBefore(condition, last)
+        if constant is not None and last > constant[1]:
+            value, length = constant
+            # x < c is false when x > c - 1, x > c is false when x < c + 1
+            bound = value - 1 if condition[last].op == Op.LT else value + 1
+            replacement = constantInstructions(bound) if -32767 <= bound <= 32767 else None
+            if replacement is not None and len(replacement) <= length:
+                flipped = Op.GT if condition[last].op == Op.LT else Op.LT
+                return condition[:last - length] + replacement + [Instruction(flipped, None, None)], True
+    return condition + [Instruction(Op.NOT, None, None)], False
+
+# Rewrites an if statement whose parts were written to vmWriter one after the other
+# optimize: use the optimized layouts, see above
+# labelPrefix, number: the labels are labelPrefix + "else_", "endIf_" and "then_" + number
+# condStart, thenStart: positions of the condition and the then block's code
+# elseStart: position of the else block's code, None when there is no else
+def layoutIf(vmWriter, optimize, labelPrefix, number, condStart, thenStart, elseStart):
+    parts = vmWriter.truncate(condStart)
+    condition = parts[:thenStart - condStart]
+    thenBlock = parts[thenStart - condStart:len(parts) if elseStart is None else elseStart - condStart]
+    elseBlock = [] if elseStart is None else parts[elseStart - condStart:]
+    elseLabel = labelPrefix + "else_" + str(number)
+    endIfLabel = labelPrefix + "endIf_" + str(number)
+
+    if not optimize:
+        vmWriter.writeInstructions(condition)
+        vmWriter.writeArithmetic("NOT")
+        vmWriter.writeIf(elseLabel)
+        vmWriter.writeInstructions(thenBlock)
+        vmWriter.writeGoto(endIfLabel)
+        vmWriter.writeLabel(elseLabel)
+        vmWriter.writeInstructions(elseBlock)
+        vmWriter.writeLabel(endIfLabel)
+        return
+
+    complement, free = complementCondition(condition)
+    boolean = isBoolean(condition)
+    if len(elseBlock) == 0:
+        vmWriter.writeInstructions(complement)
+        vmWriter.writeIf(endIfLabel)
+        vmWriter.writeInstructions(thenBlock)
+    elif len(thenBlock) == 0 and boolean:
+        vmWriter.writeInstructions(condition)
+        vmWriter.writeIf(endIfLabel)
+        vmWriter.writeInstructions(elseBlock)
+    elif free or not boolean:
+        vmWriter.writeInstructions(complement)
+        vmWriter.writeIf(elseLabel)
+        vmWriter.writeInstructions(thenBlock)
+        vmWriter.writeGoto(endIfLabel)
+        vmWriter.writeLabel(elseLabel)
+        vmWriter.writeInstructions(elseBlock)
+    else:
+        thenLabel = labelPrefix + "then_" + str(number)
+        vmWriter.writeInstructions(condition)
+        vmWriter.writeIf(thenLabel)
+        vmWriter.writeInstructions(elseBlock)
+        vmWriter.writeGoto(endIfLabel)
+        vmWriter.writeLabel(thenLabel)
+        vmWriter.writeInstructions(thenBlock)
+    vmWriter.writeLabel(endIfLabel)
+
+# Rewrites a while statement whose parts were written to vmWriter one after the other
+# optimize: use the rotated layout, see above, when the condition can only be 0 or -1
+# startLabel: label of the loop, the other labels are startLabel + "_end" and "_test"
+# condStart, bodyStart: positions of the condition and the body's code
+def layoutWhile(vmWriter, optimize, startLabel, condStart, bodyStart):
+    parts = vmWriter.truncate(condStart)
+    condition = parts[:bodyStart - condStart]
+    body = parts[bodyStart - condStart:]
+
+    if not optimize or not isBoolean(condition):
+        vmWriter.writeLabel(startLabel)
+        vmWriter.writeInstructions(condition)
+        vmWriter.writeArithmetic("NOT")
+        vmWriter.writeIf(startLabel + "_end")
+        vmWriter.writeInstructions(body)
+        vmWriter.writeGoto(startLabel)
+        vmWriter.writeLabel(startLabel + "_end")
+        return
+
+    vmWriter.writeGoto(startLabel + "_test")
+    vmWriter.writeLabel(startLabel)
+    vmWriter.writeInstructions(body)
+    vmWriter.writeLabel(startLabel + "_test")
+    vmWriter.writeInstructions(condition)
+    vmWriter.writeIf(startLabel)
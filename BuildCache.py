@@ -0,0 +1,100 @@
+import os, json, hashlib, time
+
+# Bumped whenever a change to the compiler changes the generated VM code,
+# so that cached entries from an older compiler are not trusted
+COMPILER_VERSION = "1.10"
+
+# Seconds a cache hit may leave an entry's last use unchanged. Recency only orders entries for
+# the size cap, so a build that compiled nothing doesn't rewrite the manifest just to move it
+RECENCY_RESOLUTION = 24 * 60 * 60
+
+class BuildCache:
+    # Creates a cache backed by the manifest at manifestPath, loading it if it exists
+    # maxEntries: manifest size cap, the least recently used entries are dropped past it
+    # options: string describing compile options that change the output, part of every key
+    def __init__(self, manifestPath, maxEntries=4096, options=""):
+        self.manifestPath = manifestPath
+        self.__directory = os.path.dirname(os.path.abspath(manifestPath))
+        self.__maxEntries = maxEntries
+        self.__options = options
+        self.__entries = {}
+        self.__dirty = False
+        try:
+            with open(manifestPath, "r", encoding="utf-8") as manifest:
+                data = json.load(manifest)
+            if data.get("version") == COMPILER_VERSION:
+                self.__entries = data.get("entries", {})
+            else:
+                self.__dirty = True
+        except (OSError, ValueError):
+            self.__entries = {}
+
+    # Entries are stored relative to the manifest so a project can be moved or checked out elsewhere
+    def __entryName(self, sourcePath):
+        return os.path.relpath(os.path.abspath(sourcePath), self.__directory)
+
+    # Hashes a file's bytes, returns None if it cannot be read
+    def __fileHash(self, path):
+        try:
+            with open(path, "rb") as file:
+                return hashlib.sha256(file.read()).hexdigest()
+        except OSError:
+            return None
+
+    # Key for a source file: its content, the compiler version and the compile options
+    def sourceKey(self, sourcePath):
+        digest = hashlib.sha256()
+        digest.update((COMPILER_VERSION + "\0" + self.__options + "\0").encode("utf-8"))
+        try:
+            with open(sourcePath, "rb") as file:
+                digest.update(file.read())
+        except OSError:
+            return None
+        return digest.hexdigest()
+
+    # True if sourcePath compiled to outputPath with key and outputPath is untouched since
+    # key: sourceKey(sourcePath), taken before the file is compiled and passed to record afterwards
+    def isUpToDate(self, sourcePath, outputPath, key):
+        entry = self.__entries.get(self.__entryName(sourcePath))
+        if entry is None or key is None or entry["key"] != key:
+            return False
+        if entry["output"] != self.__fileHash(outputPath):
+            return False
+        now = time.time()
+        if now - entry["used"] >= RECENCY_RESOLUTION:
+            entry["used"] = now
+            self.__dirty = True
+        return True
+
+    # Records a successful compile of sourcePath into outputPath
+    # key: the sourceKey taken before compiling. Hashing the source again here would pair the
+    # output with a newer source when the file was saved during the build
+    def record(self, sourcePath, outputPath, key):
+        output = self.__fileHash(outputPath)
+        if key is None or output is None:
+            return
+        self.__entries[self.__entryName(sourcePath)] = {"key": key, "output": output, "used": time.time()}
+        self.__dirty = True
+
+    # Removes entries for sources that no longer exist, then trims to the size cap
+    def prune(self):
+        for name in list(self.__entries):
+            if not os.path.exists(os.path.join(self.__directory, name)):
+                del self.__entries[name]
+                self.__dirty = True
+        if len(self.__entries) > self.__maxEntries:
+            byAge = sorted(self.__entries, key=lambda name: self.__entries[name]["used"], reverse=True)
+            for name in byAge[self.__maxEntries:]:
+                del self.__entries[name]
+            self.__dirty = True
+
+    # Prunes and writes the manifest back to disk if anything changed
+    def save(self):
+        self.prune()
+        if not self.__dirty:
+            return
+        tempPath = self.manifestPath + ".tmp"
+        with open(tempPath, "w", encoding="utf-8") as manifest:
+            json.dump({"version": COMPILER_VERSION, "entries": self.__entries}, manifest, indent=1, sort_keys=True)
+        os.replace(tempPath, self.manifestPath)
+        self.__dirty = False
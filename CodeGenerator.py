@@ -0,0 +1,234 @@
+import SymbolTable, VMWriter, StrengthReduction, BranchLayout, ArrayAccessWriter, StringConstants
+from JackAST import NodeVisitor
+from ConstantFolding import foldBinary, foldConstant
+
+# Generates VM code from a JackAST.ClassNode. The code is the same, instruction for
+# instruction, as CompilationEngine generates from the tokens of the class, including the
+# constant folding and string pooling options.
+# Visiting an expression or term returns its value if it is a compile time constant, None otherwise
+class CodeGenerator(NodeVisitor):
+    # compiledFilePath: path of the .vm file to write
+    # sourceName: name of the jack source, used in error messages
+    # optimizer, foldConstants, poolStrings, multiplyCost, optimizeBranches, optimizeArrays: as in CompilationEngine
+    def __init__(self, compiledFilePath, sourceName="", optimizer=None, foldConstants=False, poolStrings=False, multiplyCost=None, optimizeBranches=False,
+                 optimizeArrays=False):
+        self.sourceName = sourceName
+        self.optimizer = optimizer
+        self.foldConstants = foldConstants
+        self.poolStrings = poolStrings
+        self.multiplyCost = multiplyCost
+        self.optimizeBranches = optimizeBranches
+        self.stats = {}
+        self.vmWriter = VMWriter.VMWriter(compiledFilePath)
+        self.__arrays = ArrayAccessWriter.ArrayAccessWriter(self.vmWriter, optimizeArrays, self.stats)
+        self.__classSymbolTable = SymbolTable.SymbolTable()
+        self.__subroutineSymbolTable = SymbolTable.SymbolTable(self.__classSymbolTable)
+        self.__stringPool = {} # literal -> static index
+        self.__className = ""
+        self.__subroutineName = ""
+        self.__labelCounter = 0
+        self.__binaryCommands = {"+": "ADD", "-": "SUB", "=": "EQ", ">": "GT", "<": "LT", "&": "AND", "|": "OR"}
+        self.__osOperators = {"*": "Math.multiply", "/": "Math.divide"}
+
+    # Generates the code of a class
+    # writeOutput: write the .vm file when done, as in CompilationEngine.compileClass
+    def generate(self, classNode, writeOutput=True):
+        self.visit(classNode)
+        if self.optimizer is not None:
+            self.vmWriter.instructions = self.optimizer.optimize(self.vmWriter.instructions, self.stats)
+        if writeOutput:
+            self.vmWriter.close()
+
+    def __label(self, kind):
+        label = self.__className + "_" + self.__subroutineName + "_" + kind + str(self.__labelCounter)
+        self.__labelCounter += 1
+        return label
+
+    # Resolves a name that must be a variable, exits with an error if it isn't defined
+    def __resolveVariable(self, name):
+        return self.__subroutineSymbolTable.resolveVariable(name, self.sourceName)
+
+    # Replaces the code written since start with the push of value, see ConstantFolding
+    def __foldConstant(self, start, value):
+        if self.foldConstants:
+            foldConstant(self.vmWriter, start, value, self.stats)
+
+    def __visitStatements(self, statements):
+        for statement in statements:
+            self.__arrays.reset()
+            self.visit(statement)
+
+    def visitClassNode(self, node):
+        self.__className = node.name
+        for varDec in node.classVarDecs:
+            for name in varDec.names:
+                self.__classSymbolTable.define(name, varDec.type, varDec.kind)
+        for x in range(self.__classSymbolTable.varCount("STATIC")):
+            self.vmWriter.writePush("CONST", 0)
+            self.vmWriter.writePop("STATIC", x)
+        for subroutine in node.subroutines:
+            self.visit(subroutine)
+
+    def visitSubroutineNode(self, node):
+        symbols = self.__subroutineSymbolTable
+        symbols.startSubroutine()
+        self.__subroutineName = node.name
+        if node.kind == "method":
+            symbols.define("that", "pointer", "ARG")
+        for paramType, name in node.parameters:
+            symbols.define(name, paramType, "ARG")
+        for varDec in node.varDecs:
+            for name in varDec.names:
+                symbols.define(name, varDec.type, "VAR")
+
+        self.vmWriter.writeFunction(self.__className + "." + node.name, symbols.varCount("VAR"))
+        if node.kind == "constructor":
+            fieldCount = self.__classSymbolTable.varCount("FIELD")
+            self.vmWriter.writePush("CONST", fieldCount)
+            self.vmWriter.writeCall("Memory.alloc", 1)
+            self.vmWriter.writePop("POINTER", 0)
+            for x in range(fieldCount):
+                self.vmWriter.writePush("CONST", 0)
+                self.vmWriter.writePop("FIELD", x)
+        elif node.kind == "method":
+            self.vmWriter.writePush("ARG", 0)
+            self.vmWriter.writePop("POINTER", 0)
+        for x in range(symbols.varCount("VAR")):
+            self.vmWriter.writePush("CONST", 0)
+            self.vmWriter.writePop("LOCAL", x)
+        self.__visitStatements(node.statements)
+
+    def visitLetStatement(self, node):
+        if node.index is not None:
+            indexStart = self.vmWriter.position()
+            indexValue = self.visit(node.index)
+            target = self.__arrays.writeStoreAddress(self.__resolveVariable(node.name), indexStart, indexValue)
+            valueStart = self.vmWriter.position()
+            self.visit(node.value)
+            self.__arrays.writeStore(target, valueStart)
+        else:
+            self.visit(node.value)
+            symbol = self.__resolveVariable(node.name)
+            self.vmWriter.writePop(symbol.segment, symbol.index)
+
+    def visitIfStatement(self, node):
+        labelNumber = self.__labelCounter
+        self.__labelCounter += 1
+        condStart = self.vmWriter.position()
+        self.visit(node.condition)
+        thenStart = self.vmWriter.position()
+        self.__visitStatements(node.statements)
+        elseStart = None
+        if node.elseStatements is not None:
+            elseStart = self.vmWriter.position()
+            self.__visitStatements(node.elseStatements)
+        BranchLayout.layoutIf(self.vmWriter, self.optimizeBranches, self.__className + "_" + self.__subroutineName + "_", labelNumber,
+                              condStart, thenStart, elseStart)
+
+    def visitWhileStatement(self, node):
+        startLabel = self.__label("while_")
+        condStart = self.vmWriter.position()
+        self.visit(node.condition)
+        bodyStart = self.vmWriter.position()
+        self.__visitStatements(node.statements)
+        BranchLayout.layoutWhile(self.vmWriter, self.optimizeBranches, startLabel, condStart, bodyStart)
+
+    def visitDoStatement(self, node):
+        self.visit(node.call)
+        self.vmWriter.writePop("TEMP", 0) # ignore VOID return value
+
+    def visitReturnStatement(self, node):
+        if node.value is not None:
+            self.visit(node.value)
+        else:
+            self.vmWriter.writePush("CONST", 0)
+        self.vmWriter.writeReturn()
+
+    # Jack has no operator precedence, so the value is folded left to right like the generated code
+    def visitExpression(self, node):
+        start = self.vmWriter.position()
+        value = self.visit(node.terms[0])
+        self.__foldConstant(start, value)
+        for op, term in zip(node.ops, node.terms[1:]):
+            termStart = self.vmWriter.position()
+            termValue = self.visit(term)
+            if op == "*" and StrengthReduction.reduceMultiply(self.vmWriter, start, termStart, value, termValue, self.multiplyCost, self.stats):
+                pass # written as adds
+            elif op in self.__osOperators:
+                self.vmWriter.writeCall(self.__osOperators[op], 2)
+            else:
+                self.vmWriter.writeArithmetic(self.__binaryCommands[op])
+            value = foldBinary(op, value, termValue)
+            # fold the constant prefix now, later terms may not be constant
+            self.__foldConstant(start, value)
+        return value
+
+    def visitIntegerConstant(self, node):
+        self.vmWriter.writePush("CONST", node.value)
+        return node.value
+
+    def visitFoldedConstant(self, node):
+        self.vmWriter.writeInstructions(VMWriter.constantInstructions(node.value))
+        return node.value
+
+    def visitStringConstant(self, node):
+        if self.poolStrings:
+            StringConstants.writePooledString(self.vmWriter, self.__stringPool, self.__classSymbolTable.varCount("STATIC"), node.value,
+                                              self.__label("strPool_"), self.stats)
+        else:
+            StringConstants.writeString(self.vmWriter, node.value)
+        return None
+
+    def visitKeywordConstant(self, node):
+        if node.value == "true":
+            self.vmWriter.writePush("CONST", 1)
+            self.vmWriter.writeArithmetic("NEG")
+            return -1
+        elif node.value == "this":
+            self.vmWriter.writePush("POINTER", 0)
+            return None
+        self.vmWriter.writePush("CONST", 0) # false, null
+        return 0
+
+    # A name that isn't a variable is a class name, which pushes nothing
+    def visitVarRef(self, node):
+        symbol = self.__subroutineSymbolTable.resolve(node.name)
+        if symbol is not None:
+            self.vmWriter.writePush(symbol.segment, symbol.index)
+        return None
+
+    def visitArrayAccess(self, node):
+        symbol = self.__resolveVariable(node.name)
+        indexStart = self.vmWriter.position()
+        indexValue = self.visit(node.index)
+        self.__arrays.writeLoad(symbol, indexStart, indexValue)
+        return None
+
+    def visitUnaryOp(self, node):
+        termValue = self.visit(node.term)
+        if node.op == "-":
+            self.vmWriter.writeArithmetic("NEG")
+            return VMWriter.toWord(-termValue) if termValue is not None else None
+        self.vmWriter.writeArithmetic("NOT")
+        return ~termValue if termValue is not None else None
+
+    def visitSubroutineCall(self, node):
+        if node.receiver is None:
+            # a method of this object
+            self.vmWriter.writePush("POINTER", 0)
+            for argument in node.arguments:
+                self.visit(argument)
+            self.vmWriter.writeCall(self.__className + "." + node.name, len(node.arguments) + 1)
+            return None
+        symbol = self.__subroutineSymbolTable.resolve(node.receiver)
+        if symbol is not None:
+            # a method of the object in a variable
+            self.vmWriter.writePush(symbol.segment, symbol.index)
+            for argument in node.arguments:
+                self.visit(argument)
+            self.vmWriter.writeCall(symbol.type + "." + node.name, len(node.arguments) + 1)
+        else:
+            for argument in node.arguments:
+                self.visit(argument)
+            self.vmWriter.writeCall(node.receiver + "." + node.name, len(node.arguments))
+        return None
@@ -1,21 +1,43 @@
-import xml.etree.ElementTree as ElementTree
-from xml.sax.saxutils import escape, unescape
-import copy
-import SymbolTable, VMWriter
+import SymbolTable, VMWriter, StrengthReduction, BranchLayout, ArrayAccessWriter, StringConstants
+from ConstantFolding import foldBinary, foldConstant
+from collections import deque
+from JackTokenizer import TAG_NAMES, EOF_TOKEN, KEYWORD, SYMBOL, IDENTIFIER, INT_CONST, STRING_CONST
 import sys
 
 class CompilationEngine:
-    def __init__(self, tokenFile, compiledFilePath):
-        self.tokenFile = tokenFile
+    # tokenList: JackTokenizer.Token records as produced by JackCompiler.tokenize, or any iterable
+    #   of them (e.g. JackTokenizer.tokens()); tokens are pulled one at a time
+    # compiledFilePath: path of the .vm file to write
+    # sourceName: name of the jack source, used in error messages
+    # optimizer: optional PeepholeOptimizer run over the generated code before it is written
+    # foldConstants: replace constant expressions with the push of their value
+    # poolStrings: build each distinct string literal once into a static slot and reuse it
+    # multiplyCost: rewrite multiplications by a constant into adds when that adds at most this many
+    #   instructions (see StrengthReduction), None to always call Math.multiply
+    # optimizeBranches: lay out if and while statements with fewer jumps (see BranchLayout)
+    # optimizeArrays: specialize array loads and stores (see ArrayAccessWriter)
+    # streaming: optimize and write out every subroutine as soon as it is compiled, so only one
+    #   subroutine's code is held in memory (see VMWriter streaming)
+    def __init__(self, tokenList, compiledFilePath, sourceName="", optimizer=None, foldConstants=False, poolStrings=False, streaming=False, multiplyCost=None, optimizeBranches=False,
+                 optimizeArrays=False):
+        self.sourceName = sourceName
+        self.optimizer = optimizer
+        self.foldConstants = foldConstants
+        self.poolStrings = poolStrings
+        self.multiplyCost = multiplyCost
+        self.optimizeBranches = optimizeBranches
+        self.__stringPool = {} # literal -> static index
+        # optimization counters, e.g. instructions removed per peephole rule
+        self.stats = {}
         self.compiledFile = compiledFilePath
-        self.vmWriter = VMWriter.VMWriter(compiledFilePath)
-        self.__tokenList = []
-        # The token xml file is flat. There is no recursion needed to get the information
-        for child in ElementTree.parse(self.tokenFile).getroot():
-            self.__tokenList.append({"tag": child.tag, "text": unescape(child.text[1:-1])})
+        self.streaming = streaming
+        self.vmWriter = VMWriter.VMWriter(compiledFilePath, streaming)
+        self.__arrays = ArrayAccessWriter.ArrayAccessWriter(self.vmWriter, optimizeArrays, self.stats)
+        self.__tokens = iter(tokenList)
+        self.__lookAhead = deque() # tokens peeked at but not consumed yet
         self.currentToken = None
         self.__classSymbolTable = SymbolTable.SymbolTable()
-        self.__subroutineSymbolTable = SymbolTable.SymbolTable()
+        self.__subroutineSymbolTable = SymbolTable.SymbolTable(self.__classSymbolTable)
         self.__tokenIdx = -1
         self.__className = ""
         self.__subroutineName = ""
@@ -24,7 +46,7 @@ class CompilationEngine:
         self.__subroutineKeywords = set(["constructor", "method", "function"])
         self.__statementKeywords = set(["let","do","if","while","return"])
         self.__typeKeywords = set(["boolean","int","char"])
-        self.__tagConstants = set(["integerConstant", "stringConstant"])
+        self.__constantKinds = set([INT_CONST, STRING_CONST])
         self.__keywordConstants = set(["true", "false", "null", "this"])
         self.__lookAheadSymbols = set(["[","(","."])
         self.__unaryOps = set(["-","~"])
@@ -34,23 +56,30 @@ class CompilationEngine:
 
 
     def __advanceToken(self):
-        if self.__tokenIdx != (len(self.__tokenList) - 1):
+        token = self.__lookAhead.popleft() if self.__lookAhead else next(self.__tokens, None)
+        if token is not None:
             self.__tokenIdx = self.__tokenIdx + 1
-            self.currentToken = self.__tokenList[self.__tokenIdx]
-
-    def __regressToken(self):
-        if self.__tokenIdx > 0:
-            self.__tokenIdx = self.__tokenIdx - 1
-            self.currentToken = self.__tokenList[self.__tokenIdx]
+            self.currentToken = token
         else:
-            sys.exit("ERROR: cannot get token with index "  + str((self.__tokenIdx - 1)))
-        
-    def __exitError(self):
-        sys.exit("ERROR: Token " + str(self.__tokenIdx + 1) + " Invalid token '" + self.currentToken["text"] + "' in " + self.tokenFile.name)
+            self.currentToken = EOF_TOKEN
+
+    # Returns the token k positions after the current one without moving, EOF_TOKEN past the end
+    def peek(self, k=1):
+        while len(self.__lookAhead) < k:
+            token = next(self.__tokens, None)
+            if token is None:
+                return EOF_TOKEN
+            self.__lookAhead.append(token)
+        return self.__lookAhead[k - 1]
+
+    # detail: optional explanation appended to the message
+    def __exitError(self, detail=None):
+        sys.exit("ERROR: Token " + str(self.__tokenIdx + 1) + " Invalid token '" + self.currentToken.text + "' in " + self.sourceName
+                 + ("" if detail is None else ": " + detail))
 
     def __isSubroutineDecKeyword(self, token):
-        if token["tag"] == "keyword":
-            if token["text"] in self.__subroutineKeywords:
+        if token.kind == KEYWORD:
+            if token.text in self.__subroutineKeywords:
                 return True
             else:
                 return False
@@ -58,8 +87,8 @@ class CompilationEngine:
             return False
 
     def __isStatementKeyword(self, token):
-        if token["tag"] == "keyword":
-            if token["text"] in self.__statementKeywords:
+        if token.kind == KEYWORD:
+            if token.text in self.__statementKeywords:
                 return True
             else:
                 return False
@@ -67,10 +96,10 @@ class CompilationEngine:
             return False
         
     def __isConstant(self, token):
-        if token["tag"] in self.__tagConstants:
+        if token.kind in self.__constantKinds:
             return True
-        elif token["tag"] == "keyword":
-            if token["text"] in self.__keywordConstants:
+        elif token.kind == KEYWORD:
+            if token.text in self.__keywordConstants:
                 return True
             else:
                 return False  
@@ -78,9 +107,9 @@ class CompilationEngine:
             return False
 
     def __isLookAheadExpression(self, tokenOne, tokenTwo):
-        if tokenOne["tag"] == "identifier":
-            if tokenTwo["tag"] == "symbol":
-                if tokenTwo["text"] in self.__lookAheadSymbols:
+        if tokenOne.kind == IDENTIFIER:
+            if tokenTwo.kind == SYMBOL:
+                if tokenTwo.text in self.__lookAheadSymbols:
                     return True
                 else:
                     return False
@@ -92,10 +121,10 @@ class CompilationEngine:
     def __isTerm(self,token):
         if self.__isConstant(token):
             return True
-        elif token["tag"] == "identifier":
+        elif token.kind == IDENTIFIER:
             return True
-        elif token["tag"] == "symbol":
-            if token["text"] == "(" or token["text"] == "[":
+        elif token.kind == SYMBOL:
+            if token.text == "(" or token.text == "[":
                 return True
             elif self.__isUnaryOp(token):
                 return True
@@ -105,8 +134,8 @@ class CompilationEngine:
             return False
             
     def __isUnaryOp(self, token):
-        if token["tag"] == "symbol":
-            if token["text"] in self.__unaryOps:
+        if token.kind == SYMBOL:
+            if token.text in self.__unaryOps:
                 return True
             else:
                 return False
@@ -114,8 +143,8 @@ class CompilationEngine:
             return False
         
     def __isOp(self, token):
-        if token["tag"] == "symbol":
-            if token["text"] in self.__opSymbols:
+        if token.kind == SYMBOL:
+            if token.text in self.__opSymbols:
                 return True
             else: 
                 return False
@@ -123,20 +152,20 @@ class CompilationEngine:
             return False
     
     def __isCloseCurlyBrace(self,token):
-        return token["tag"] == "symbol" and token["text"] == "}"
+        return token.kind == SYMBOL and token.text == "}"
 
 
     def __isClassScope(self, category):
         return category in self.__classVarDecKeywords
 
     def __writeType(self):
-        if self.currentToken["text"] in self.__typeKeywords or self.currentToken["text"] == "void":
+        if self.currentToken.text in self.__typeKeywords or self.currentToken.text == "void":
             writtenType = self.currentToken
             self.__advanceToken()
             return writtenType
         else:
             userDefinedType = self.currentToken
-            self.__writeIdentifier(self.currentToken["text"], "class")
+            self.__writeIdentifier(self.currentToken.text, "class")
             return userDefinedType
 
     def __writeIdentifier(self, name, category, varType=None):
@@ -153,35 +182,15 @@ class CompilationEngine:
                 currentTable.define(name, varType, category.upper())
         self.__advanceToken()
 
-    #searches all symbol tables, starting with subroutine
-    #Returns Kind if found, None if not found in either table
-    def __findSymbolKind(self, name):
-        if self.__subroutineSymbolTable.kindOf(name) != None:
-            return self.__subroutineSymbolTable.kindOf(name)
-        elif self.__classSymbolTable.kindOf(name) != None:
-            return self.__classSymbolTable.kindOf(name)
-        else:
-            return None
-
-    #searches all symbol tables, starting with subroutine
-    #Returns index int if found, -1 if not found in either table 
-    def __findSymbolIdx(self, name):
-        if self.__subroutineSymbolTable.indexOf(name) != -1:
-            return self.__subroutineSymbolTable.indexOf(name)
-        elif self.__classSymbolTable.indexOf(name) != -1:
-            return self.__classSymbolTable.indexOf(name)
-        else:
-            return -1
-    #searches all symbol tables, starting with subroutine
-    #Returns type as string if found, None if not found in either table 
-    def __findSymbolType(self, name):
-        if self.__subroutineSymbolTable.typeOf(name) != None:
-            return self.__subroutineSymbolTable.typeOf(name)
-        elif self.__classSymbolTable.typeOf(name) != None:
-            return self.__classSymbolTable.typeOf(name)
-        else:
-            return None
-    
+    # Resolves a name in the subroutine scope, then the class scope
+    # Returns the SymbolTable.Symbol, or None if the name is not a variable (e.g. a class name)
+    def __resolve(self, name):
+        return self.__subroutineSymbolTable.resolve(name)
+
+    # Resolves a name that must be a variable, exits with an error if it isn't defined
+    def __resolveVariable(self, name):
+        return self.__subroutineSymbolTable.resolveVariable(name, self.sourceName)
+
     # converts op symbol to binary arithmetic (takes two off stack, returns one) VM command
     def __convertToArithVmCommand(self, opSymbol):
         if opSymbol == "+":
@@ -210,6 +219,11 @@ class CompilationEngine:
         else:
             sys.exit("Cannot convert symbol to unary operation: " + opSymbol)
 
+    # Replaces the code written since start with the push of value, see ConstantFolding
+    def __foldConstant(self, start, value):
+        if self.foldConstants:
+            foldConstant(self.vmWriter, start, value, self.stats)
+
     # writes a call to an OS-defined operation function into the VM
     def __callOsMath(self, symbol):
         if symbol == "*":
@@ -220,54 +234,81 @@ class CompilationEngine:
             sys.exit("ERROR: unknown symbol " + symbol)
 
     def __addToSymbolTable(self):
-        segment = self.currentToken["text"]
+        segment = self.currentToken.text
         self.__advanceToken()
         varType = self.__writeType() # var | field | static | className
-        self.__writeIdentifier(self.currentToken["text"],segment,varType["text"]) # identifier
-
+        self.__writeVarName(segment, varType.text) # identifier
 
         # (',' identifier)* zero or more consecutive varNames, comma delimited
-        if self.currentToken["tag"] == "symbol" and self.currentToken["text"] == ",":
-            while self.currentToken["text"] != ";":
-                self.__advanceToken() # ,
-                self.__writeIdentifier(self.currentToken["text"],segment,varType["text"]) # identifier
-        
-        self.__advanceToken() # ;        
+        while self.currentToken.kind == SYMBOL and self.currentToken.text == ",":
+            self.__advanceToken() # ,
+            self.__writeVarName(segment, varType.text) # identifier
+
+        if self.currentToken.kind != SYMBOL or self.currentToken.text != ";":
+            self.__exitError("expected ;")
+        self.__advanceToken() # ;
+
+    # Defines the variable named by the current token, which has to be an identifier
+    def __writeVarName(self, segment, varType):
+        if self.currentToken.kind != IDENTIFIER:
+            self.__exitError("expected a name")
+        self.__writeIdentifier(self.currentToken.text, segment, varType)
 
-    #sets THAT 0 to address of array item (array pointer + index)
-    def __setThatToArrayItem(self,variable):
+    # Compiles '[' expression ']' after an array name
+    # Returns (position of the index code, value of the index if it is a compile time constant)
+    def __compileArrayIndex(self):
         self.__advanceToken() # [
-        self.compileExpression() 
+        indexStart = self.vmWriter.position()
+        indexValue = self.compileExpression()
         self.__advanceToken() # ]
-        # push arr pointer to stack
-        self.vmWriter.writePush(self.__findSymbolKind(variable),self.__findSymbolIdx(variable))
-        self.vmWriter.writeArithmetic("ADD") # add base address + pointer
-        # pop to pointer 1 segment, our special array buddy
-        self.vmWriter.writePop("POINTER",1)
-
-    def compileClass(self):
+        return indexStart, indexValue
+
+    # writeOutput: write the .vm file when done. When False the code is left in
+    # self.vmWriter.instructions for whole-program passes, which write it themselves
+    def compileClass(self, writeOutput=True):
+        try:
+            self.__compileClassBody()
+        except BaseException:
+            # don't leave a partly streamed output behind
+            self.vmWriter.discard()
+            raise
+        if writeOutput:
+            self.vmWriter.close()
+
+    def __compileClassBody(self):
         finishedClassCompile = False
         self.__advanceToken()
         self.__advanceToken() # class
 
-        self.__className = self.currentToken["text"] # class
-        self.__writeIdentifier(self.currentToken["text"], "class") # className
+        self.__className = self.currentToken.text # class
+        self.__writeIdentifier(self.currentToken.text, "class") # className
         self.__advanceToken() # {
-        while self.currentToken["tag"] == "keyword" and (self.currentToken["text"] == "static" or self.currentToken["text"] == "field"):
+        while self.currentToken.kind == KEYWORD and (self.currentToken.text == "static" or self.currentToken.text == "field"):
             self.__addToSymbolTable()
 
         self.compileClassVarDec()
+        self.__flushCode()
         while not finishedClassCompile:
             if self.__isSubroutineDecKeyword(self.currentToken):
                 self.compileSubroutine() 
+                self.__flushCode()
             elif self.__isCloseCurlyBrace(self.currentToken): # THE LAST TOKEN IN A JACK FILE
                 self.__advanceToken() # }
                 finishedClassCompile = True
             else:
                 self.__exitError()
 
+        if self.optimizer is not None and not self.streaming:
+            self.vmWriter.instructions = self.optimizer.optimize(self.vmWriter.instructions, self.stats)
 
-        self.vmWriter.close()
+    # Streaming mode: optimizes and writes out the code compiled since the last flush,
+    # the class's static initialization or one subroutine
+    def __flushCode(self):
+        if not self.streaming:
+            return
+        if self.optimizer is not None:
+            self.vmWriter.instructions = self.optimizer.optimize(self.vmWriter.instructions, self.stats)
+        self.vmWriter.flush()
 
 
     def compileClassVarDec(self):
@@ -286,12 +327,12 @@ class CompilationEngine:
 
     def compileSubroutine(self):
         self.__subroutineSymbolTable.startSubroutine()
-        subroutineKind = self.currentToken["text"]
+        subroutineKind = self.currentToken.text
         self.__advanceToken() # 'constructor' | 'function' | 'method'
         
         subroutineReturnType = self.__writeType() # 'void' | type
-        self.__subroutineName = self.currentToken["text"]
-        self.__writeIdentifier(self.currentToken["text"],"subroutine",subroutineReturnType["text"]) # subroutineName
+        self.__subroutineName = self.currentToken.text
+        self.__writeIdentifier(self.currentToken.text,"subroutine",subroutineReturnType.text) # subroutineName
         self.__advanceToken() # (
         self.compileParameterList(subroutineKind == "method")
         self.__advanceToken() # )
@@ -299,7 +340,7 @@ class CompilationEngine:
         self.__advanceToken() # {
         
         # varDec* 
-        while self.currentToken["tag"] == "keyword" and self.currentToken["text"] == "var":
+        while self.currentToken.kind == KEYWORD and self.currentToken.text == "var":
             self.__addToSymbolTable()
 
         # So we know the number of vars in the fn defition signature
@@ -317,12 +358,11 @@ class CompilationEngine:
         if self.__isStatementKeyword(self.currentToken):
             self.compileStatements()
 
-        if self.currentToken["tag"] == "symbol" and self.currentToken["text"] == "}":
+        if self.currentToken.kind == SYMBOL and self.currentToken.text == "}":
             self.__advanceToken() # }
 
         else:
-            print("ERROR: subroutines must be defined as variable declarations followed by statements followed by a } symbol.")
-            self.__exitError()
+            self.__exitError("subroutines must be defined as variable declarations followed by statements followed by a } symbol.")
 
     def compileVarDec(self):
         for x in range(self.__subroutineSymbolTable.varCount("VAR")): 
@@ -334,39 +374,39 @@ class CompilationEngine:
         if method:
             self.__subroutineSymbolTable.define("that", "pointer", "ARG")
         # ((type varName) (',' type varName)*)?
-        if self.currentToken["tag"] == "symbol" and self.currentToken["text"] == ")":
+        if self.currentToken.kind == SYMBOL and self.currentToken.text == ")":
             return
         else:
             argType = self.__writeType() # type
-            self.__writeIdentifier(self.currentToken["text"],"ARG",argType["text"]) # varName
+            self.__writeIdentifier(self.currentToken.text,"ARG",argType.text) # varName
             nLocals = 1
             loopCount = 0
 
-            while not(self.currentToken["tag"] == "symbol" and self.currentToken["text"] == ")"):
+            while not(self.currentToken.kind == SYMBOL and self.currentToken.text == ")"):
                 nLocals += 1
                 self.__advanceToken() # ,
                 argType = self.__writeType() # type
-                self.__writeIdentifier(self.currentToken["text"],"ARG",argType["text"]) # varName
+                self.__writeIdentifier(self.currentToken.text,"ARG",argType.text) # varName
                 loopCount += 1
 
                 if loopCount > 25:
-                    print("Stuck in infinite loop, improperly formed parameter list")
-                    self.__exitError()
+                    self.__exitError("improperly formed parameter list")
 
     def compileStatements(self):
 
-        if self.currentToken["tag"] != "keyword" and not(self.__isCloseCurlyBrace(self.currentToken)):
+        if self.currentToken.kind != KEYWORD and not(self.__isCloseCurlyBrace(self.currentToken)):
             sys.exit("ERROR: Statement must begin with keyword")
         while self.__isStatementKeyword(self.currentToken):
-            if self.currentToken["text"] == "let":
+            self.__arrays.reset()
+            if self.currentToken.text == "let":
                 self.compileLet() 
-            elif self.currentToken["text"] == "if":
+            elif self.currentToken.text == "if":
                 self.compileIf() 
-            elif self.currentToken["text"] == "while":
+            elif self.currentToken.text == "while":
                 self.compileWhile() 
-            elif self.currentToken["text"] == "do":
+            elif self.currentToken.text == "do":
                 self.compileDo() 
-            elif self.currentToken["text"] == "return":
+            elif self.currentToken.text == "return":
                 self.compileReturn() 
             else:
                 self.__exitError()
@@ -374,64 +414,62 @@ class CompilationEngine:
     def compileLet(self):
 
         self.__advanceToken() # let
-        variable = self.currentToken["text"]
-        self.__writeIdentifier(self.currentToken["text"], self.__findSymbolKind(self.currentToken["text"])) # identifier
+        variable = self.currentToken.text
+        self.__writeIdentifier(self.currentToken.text, "variable") # identifier
 
-        if self.currentToken["tag"] == "symbol" and self.currentToken["text"] == "[":
+        if self.currentToken.kind == SYMBOL and self.currentToken.text == "[":
             
-            self.__setThatToArrayItem(variable) 
-            self.vmWriter.writePush("POINTER",1)
-            self.vmWriter.writePop("TEMP",1) # temporarily store the THAT pointer for variable assignment in TEMP
+            indexStart, indexValue = self.__compileArrayIndex()
+            # the address stays on the stack while the value is computed
+            target = self.__arrays.writeStoreAddress(self.__resolveVariable(variable), indexStart, indexValue)
             self.__advanceToken() # =
+            valueStart = self.vmWriter.position()
             self.compileExpression()
-            self.vmWriter.writePush("TEMP",1) # retrieve destination var's pointer from TEMP
-            self.vmWriter.writePop("POINTER",1)
-            self.vmWriter.writePop("THAT",0)
+            self.__arrays.writeStore(target, valueStart)
 
         else:
             self.__advanceToken() # =
             self.compileExpression()
-            self.vmWriter.writePop(self.__findSymbolKind(variable),self.__findSymbolIdx(variable))
+            symbol = self.__resolveVariable(variable)
+            self.vmWriter.writePop(symbol.segment, symbol.index)
         self.__advanceToken() # ;
 
     def compileIf(self):
-        elseLabel = self.__className + "_" + self.__subroutineName + "_" + "else_" + str(self.__labelCounter)
-        endIfLabel = self.__className + "_" + self.__subroutineName + "_" + "endIf_" + str(self.__labelCounter)
+        labelNumber = self.__labelCounter
         self.__labelCounter += 1
         self.__advanceToken() # if
         self.__advanceToken() # (
+        condStart = self.vmWriter.position()
         self.compileExpression() 
         self.__advanceToken() # )
-        self.vmWriter.writeArithmetic("NOT")
-        self.vmWriter.writeIf(elseLabel)
         self.__advanceToken() # {
+        thenStart = self.vmWriter.position()
         self.compileStatements()
-        self.vmWriter.writeGoto(endIfLabel)
         self.__advanceToken() # }
-        self.vmWriter.writeLabel(elseLabel)
-        if self.currentToken["tag"] == "keyword" and self.currentToken["text"] == "else":
+        elseStart = None
+        if self.currentToken.kind == KEYWORD and self.currentToken.text == "else":
             self.__advanceToken() # else
             self.__advanceToken() # {
+            elseStart = self.vmWriter.position()
             self.compileStatements()
             self.__advanceToken() # }
-        self.vmWriter.writeLabel(endIfLabel)
+        # the jumps and labels go around the parts now that they are compiled
+        BranchLayout.layoutIf(self.vmWriter, self.optimizeBranches, self.__className + "_" + self.__subroutineName + "_", labelNumber,
+                              condStart, thenStart, elseStart)
 
     def compileWhile(self):
         startLabel = self.__className + "_" + self.__subroutineName + "_" + "while_" + str(self.__labelCounter)
-        endLabel = startLabel + "_end"
         self.__labelCounter += 1
         self.__advanceToken() # while
-        self.vmWriter.writeLabel(startLabel)
         self.__advanceToken() # (
+        condStart = self.vmWriter.position()
         self.compileExpression() 
         self.__advanceToken() # )
-        self.vmWriter.writeArithmetic("NOT")
-        self.vmWriter.writeIf(endLabel)
         self.__advanceToken() # {
+        bodyStart = self.vmWriter.position()
         self.compileStatements()
         self.__advanceToken() # }
-        self.vmWriter.writeGoto(startLabel)
-        self.vmWriter.writeLabel(endLabel)
+        BranchLayout.layoutWhile(self.vmWriter, self.optimizeBranches, startLabel, condStart, bodyStart)
 
 
     #Do statements are always used with void return functions
@@ -447,58 +485,70 @@ class CompilationEngine:
 
         self.__advanceToken() # return
 
-        if self.currentToken["tag"] != "symbol" and self.currentToken["text"] != ";":
+        if self.__isTerm(self.currentToken):
             self.compileExpression()
+        elif self.currentToken.kind != SYMBOL or self.currentToken.text != ";":
+            self.__exitError("expected a term")
         else:
             self.vmWriter.writePush("CONST","0")
 
         self.vmWriter.writeReturn()
+        if self.currentToken.kind != SYMBOL or self.currentToken.text != ";":
+            self.__exitError("expected ;")
         self.__advanceToken() # ;
 
 
+    # Returns the value of the expression if it is a compile time constant, None otherwise
+    # Jack has no operator precedence, so the value is folded left to right like the generated code
     def compileExpression(self):
-        while self.__isTerm(self.currentToken) or self.__isOp(self.currentToken):
-            if self.__isTerm(self.currentToken):
-                self.compileTerm()
-
-            if self.__isOp(self.currentToken):
-                arithmeticOperator = self.currentToken["text"]
-                self.__advanceToken()
-                self.compileTerm()
-                if arithmeticOperator in self.__osOperators:
-                    self.__callOsMath(arithmeticOperator)
-                elif arithmeticOperator in self.__primitiveOperators:
-                    self.vmWriter.writeArithmetic(self.__convertToArithVmCommand(arithmeticOperator))
-                else:
-                    print("Unknown operator " + arithmeticOperator)
+        start = self.vmWriter.position()
+        value = None
+        if not self.__isTerm(self.currentToken):
+            self.__exitError("expected a term")
+        value = self.compileTerm()
+        self.__foldConstant(start, value)
+
+        # term (op term)*, a '-' after a term is always the binary operator
+        while self.__isOp(self.currentToken):
+            arithmeticOperator = self.currentToken.text
+            self.__advanceToken()
+            termStart = self.vmWriter.position()
+            termValue = self.compileTerm()
+            if arithmeticOperator == "*" and StrengthReduction.reduceMultiply(self.vmWriter, start, termStart, value, termValue, self.multiplyCost, self.stats):
+                pass # written as adds
+            elif arithmeticOperator in self.__osOperators:
+                self.__callOsMath(arithmeticOperator)
+            else:
+                self.vmWriter.writeArithmetic(self.__convertToArithVmCommand(arithmeticOperator))
+            value = foldBinary(arithmeticOperator, value, termValue)
+            # fold the constant prefix now, later terms may not be constant
+            self.__foldConstant(start, value)
+
+        return value
 
     def compileExpressionList(self):
         argCount = 0
         while self.__isTerm(self.currentToken):
             self.compileExpression()
             argCount += 1
-            if self.currentToken["tag"] == "symbol" and self.currentToken["text"] == ")":
+            if self.currentToken.kind == SYMBOL and self.currentToken.text == ")":
                 break
             self.__advanceToken() # ,
             if argCount > 25:
-                print("Stuck in infinite loop, improperly formed expression list")
-                self.__exitError()
+                self.__exitError("improperly formed expression list")
         return argCount
 
-    def __stringConstantAssignment(self, value):
-        self.vmWriter.writePush("CONST", str(len(value))) # get len of str
-        self.vmWriter.writeCall("String.new", 1) # construct String obj
-        self.vmWriter.writePop("TEMP", 0) # Save new string pointer
-        for char in value.encode("ascii"):
-            self.vmWriter.writePush("TEMP", 0) # Push new string pointer onto stack (THIS)
-            self.vmWriter.writePush("CONST",char) # Push char code onto stack
-            self.vmWriter.writeCall("String.appendChar", 2) # appendChar
-        
     # compiles constant to VM language equivalent
-    def __compileConstant(self, constantTag, constantValue):
-        if constantTag == "stringConstant":
-            self.__stringConstantAssignment(constantValue)
-        elif constantTag == "integerConstant":
+    def __compileConstant(self, constantKind, constantValue):
+        if constantKind == STRING_CONST:
+            if self.poolStrings:
+                builtLabel = self.__className + "_" + self.__subroutineName + "_" + "strPool_" + str(self.__labelCounter)
+                self.__labelCounter += 1
+                StringConstants.writePooledString(self.vmWriter, self.__stringPool, self.__classSymbolTable.varCount("STATIC"), constantValue,
+                                                  builtLabel, self.stats)
+            else:
+                StringConstants.writeString(self.vmWriter, constantValue)
+        elif constantKind == INT_CONST:
             self.vmWriter.writePush("CONST", constantValue)
         elif constantValue == "true":
             self.vmWriter.writePush("CONST","1")
@@ -508,99 +558,97 @@ class CompilationEngine:
         elif constantValue == "this":
             self.vmWriter.writePush("POINTER","0")
         else:
-            sys.exit("ERROR: Unknown constant '" + constantValue + "' of type " + constantTag)
+            sys.exit("ERROR: Unknown constant '" + constantValue + "' of type " + TAG_NAMES[constantKind])
 
+    # Returns the value of the term if it is a compile time constant, None otherwise
     def compileTerm(self):
-        previousToken = copy.deepcopy(self.currentToken)
-        self.__advanceToken()
-        
-        if self.__isLookAheadExpression(previousToken, self.currentToken):
-            if self.currentToken["text"] == "(" or self.currentToken["text"] == ".":
-                self.__regressToken()
+        value = None
+        nextToken = self.peek()
+
+        if self.__isLookAheadExpression(self.currentToken, nextToken):
+            if nextToken.text == "(" or nextToken.text == ".":
                 self.__compileSubroutineCall()
-            elif self.currentToken["text"] == "[" :
-                self.__regressToken()
-                symbolKind = self.__findSymbolKind(self.currentToken["text"])
-                if symbolKind == None:
-                    sys.exit("ERROR: could not find symbol kind for identifier " + self.currentToken)
-                
-                varName = self.currentToken["text"]
-                self.__writeIdentifier(self.currentToken["text"], symbolKind) # varName
-                self.__setThatToArrayItem(varName)
-                self.vmWriter.writePush("THAT",0)
-        else:   
-            self.__regressToken() # backtrack after looking forward
+            elif nextToken.text == "[" :
+                varName = self.currentToken.text
+                symbol = self.__resolveVariable(varName)
+                self.__writeIdentifier(self.currentToken.text, "variable") # varName
+                indexStart, indexValue = self.__compileArrayIndex()
+                self.__arrays.writeLoad(symbol, indexStart, indexValue)
+        else:
             if self.__isConstant(self.currentToken):
-                constantTag = self.currentToken["tag"]
-                constantValue = self.currentToken["text"]
+                constantKind = self.currentToken.kind
+                constantValue = self.currentToken.text
                 self.__advanceToken() 
-                self.__compileConstant(constantTag, constantValue) # integerConstant | stringConstant | keywordConstant
+                self.__compileConstant(constantKind, constantValue) # integerConstant | stringConstant | keywordConstant
+                if constantKind == INT_CONST:
+                    value = int(constantValue)
+                elif constantValue == "true":
+                    value = -1
+                elif constantValue == "false" or constantValue == "null":
+                    value = 0
                  
-            elif self.currentToken["tag"] == "identifier":
-                currentIdentifier = self.currentToken["text"]
-                symbolKind = self.__findSymbolKind(currentIdentifier)
-                if symbolKind == None:
-                    symbolKind = "class"
-                    self.__writeIdentifier(currentIdentifier, symbolKind)
+            elif self.currentToken.kind == IDENTIFIER:
+                currentIdentifier = self.currentToken.text
+                symbol = self.__resolve(currentIdentifier)
+                if symbol is None:
+                    self.__writeIdentifier(currentIdentifier, "class")
                 else:
-                    self.__writeIdentifier(currentIdentifier, symbolKind) # varName | className
-                    self.vmWriter.writePush(symbolKind,self.__findSymbolIdx(currentIdentifier))
+                    self.__writeIdentifier(currentIdentifier, "variable") # varName | className
+                    self.vmWriter.writePush(symbol.segment, symbol.index)
             elif self.__isUnaryOp(self.currentToken):
-                unaryOp = self.currentToken["text"]
+                unaryOp = self.currentToken.text
                 self.__advanceToken() # unaryOp
-                self.compileTerm()
+                termValue = self.compileTerm()
                 self.vmWriter.writeArithmetic(self.__convertToUnaryVmCommand(unaryOp))
+                if termValue is not None:
+                    value = VMWriter.toWord(-termValue) if unaryOp == "-" else ~termValue
 
             
-            elif self.currentToken["tag"] == "symbol" and self.currentToken["text"] == "(":
+            elif self.currentToken.kind == SYMBOL and self.currentToken.text == "(":
                 self.__advanceToken() # (
-                self.compileExpression()
+                value = self.compileExpression()
                 self.__advanceToken() # )
 
             elif self.__isTerm(self.currentToken):
-                self.compileTerm()
+                value = self.compileTerm()
+
+        return value
 
 
     def __compileSubroutineCall(self):
-        self.__advanceToken() # lookahead for dot or open paren
-        if self.currentToken["tag"] == "symbol":
+        nextToken = self.peek() # lookahead for dot or open paren
+        if nextToken.kind == SYMBOL:
             # method
-            if self.currentToken["text"] == "(":
-                self.__regressToken() # ok go back
-                routineName = self.__className + "." + self.currentToken["text"]
-                self.__writeIdentifier(self.currentToken["text"], "subroutine") # subroutineName
+            if nextToken.text == "(":
+                routineName = self.__className + "." + self.currentToken.text
+                self.__writeIdentifier(self.currentToken.text, "subroutine") # subroutineName
                 self.__advanceToken() # (
                 self.vmWriter.writePush("POINTER",0)
                 nArgs = self.compileExpressionList()
                 self.__advanceToken() # )
                 self.vmWriter.writeCall(routineName, nArgs + 1)
-            elif self.currentToken["text"] == ".":
-                self.__regressToken() # ok go back
-                symbolKind = self.__findSymbolKind(self.currentToken["text"])
+            elif nextToken.text == ".":
+                symbol = self.__resolve(self.currentToken.text)
                 nArgs = 0
-                methodMemberClass = None
-                if symbolKind == None:
-                    symbolKind = "class"
 
-                # if symbolKind == class => function, else it is a method (I THINK)
-                # routineName = self.currentToken["text"]
-                if symbolKind != "class":
+                # if the name is not a variable it is a class => function, else it is a method call on the variable
+                if symbol is not None:
                     nArgs = 1
-                    self.vmWriter.writePush(self.__findSymbolKind(self.currentToken["text"]), self.__findSymbolIdx(self.currentToken["text"]))
-                    methodMemberClass = self.__findSymbolType(self.currentToken["text"])
+                    self.vmWriter.writePush(symbol.segment, symbol.index)
+                    methodMemberClass = symbol.type
                     if methodMemberClass == None:
-                        sys.exit("ERROR: cannot find object for type " + self.currentToken["text"])
-                    self.__writeIdentifier(self.currentToken["text"], symbolKind) # varName
+                        sys.exit("ERROR: cannot find object for type " + self.currentToken.text)
+                    self.__writeIdentifier(self.currentToken.text, "variable") # varName
                     self.__advanceToken() # .
-                    routineName = methodMemberClass + "." + self.currentToken["text"]
+                    routineName = methodMemberClass + "." + self.currentToken.text
 
                 else:
-                    routineName = self.currentToken["text"]
-                    self.__writeIdentifier(self.currentToken["text"], symbolKind) # className 
+                    routineName = self.currentToken.text
+                    self.__writeIdentifier(self.currentToken.text, "class") # className 
                     self.__advanceToken() # .
-                    routineName = routineName + "." + self.currentToken["text"]
+                    routineName = routineName + "." + self.currentToken.text
 
-                self.__writeIdentifier(self.currentToken["text"], "subroutine") # subRoutineName
+                self.__writeIdentifier(self.currentToken.text, "subroutine") # subRoutineName
                 self.__advanceToken() # (
                 nArgs += self.compileExpressionList()
                 self.__advanceToken() # )
@@ -0,0 +1,251 @@
+import sys, os, io, json, socket, tempfile, hashlib, threading, argparse, time
+import socketserver
+from collections import OrderedDict
+
+# Compile server: keeps a warm compiler process listening on a local Unix socket, so editor
+# integrations and test loops don't pay for interpreter startup and cold caches on every build.
+#   python3 CompileServer.py serve &
+#   python3 CompileServer.py compile -O Project11/Pong
+#   python3 CompileServer.py source Main.jack > Main.vm
+#   python3 CompileServer.py stop
+# The client side only needs this module; the compiler is imported when the server starts.
+#
+# Protocol: the client sends one JSON request per line and gets one JSON response line back:
+#   {"command": "compile", "paths": [...], "options": {...}} -> {"results": [...]}
+#   {"command": "source", "source": "...", "name": "Main", "options": {...}} -> {"error": ..., "vm": "..."}
+#   {"command": "status"} -> {"pid", "requests", "cached", "hits", "misses"}
+#   {"command": "stop"} -> {"stopped": true}
+# Failed requests get {"error": "..."}. options has the keys of JackCompiler.compileOptions.
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "jackcompiler-" + str(os.getuid()) + ".sock")
+
+# Compiled classes shared by all requests of a server, least recently used dropped first
+# Keyed by the hash of the source and the compile options, so edits are picked up automatically
+class ClassCache:
+    def __init__(self, maxEntries=4096):
+        self.maxEntries = maxEntries
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def key(source, options):
+        return hashlib.sha256(source.encode("utf-8")).hexdigest() + " " + options
+
+    # Returns (instructions, stats, tokens) of a compiled class, or None
+    def get(self, key):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.__entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self.__lock:
+            self.__entries[key] = entry
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.maxEntries:
+                self.__entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.__entries)
+
+# Options of a request, missing keys default to off
+def requestOptions(options):
+    result = {"xml": False, "optimize": False, "poolStrings": False, "wholeProgram": False, "profile": False, "stream": False, "ast": False}
+    for key in ("optimize", "poolStrings", "wholeProgram", "ast"):
+        result[key] = bool((options or {}).get(key, False))
+    result["multiplyCost"] = int((options or {}).get("multiplyCost", StrengthReduction.DEFAULT_MAX_COST))
+    result["inlineBudget"] = int((options or {}).get("inlineBudget", Inliner.DEFAULT_BUDGET))
+    return result
+
+class CompileServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socketPath, maxEntries=4096):
+        # imported here so the client doesn't pay for loading the compiler (about 100 ms)
+        global JackCompiler, JackAPI, VMWriter, StrengthReduction, Inliner
+        import JackCompiler, JackAPI, VMWriter, StrengthReduction, Inliner
+        self.classes = ClassCache(maxEntries)
+        self.requests = 0
+        self.socketPath = socketPath
+        # .vm files of one project can be requested by several clients at once
+        self.__writeLock = threading.Lock()
+        socketserver.UnixStreamServer.__init__(self, socketPath, CompileRequestHandler)
+
+    # Compiles source text, using the shared cache
+    # Returns (instructions, stats, tokens), compile errors exit (SystemExit)
+    def compileSource(self, source, sourceName, options):
+        key = ClassCache.key(source, JackCompiler.cacheOptions(options))
+        entry = self.classes.get(key)
+        if entry is None:
+            tokens = JackCompiler.tokenize(io.StringIO(source))
+            compilationEngine = JackAPI.compileTokens(tokens, "", sourceName, options)
+            entry = (compilationEngine.vmWriter.instructions, compilationEngine.stats, len(tokens))
+            self.classes.put(key, entry)
+        instructions, stats, tokens = entry
+        # callers may add to the stats (e.g. tree shaking), the cached counters stay as they are
+        return list(instructions), dict(stats), tokens
+
+    # Compiles .jack files (or directories) and writes their .vm files, like JackCompiler.py
+    # Returns a result per file, in the format of JackCompiler.compileFile
+    def compilePaths(self, paths, options):
+        results = []
+        for item in JackCompiler.findJackFiles(paths):
+            result = {"path": item, "error": None, "tokens": 0, "lexTime": 0.0, "time": 0.0, "stats": {}}
+            start = time.perf_counter()
+            try:
+                with open(item, "r", encoding="utf-8") as file:
+                    source = file.read()
+                instructions, result["stats"], result["tokens"] = self.compileSource(source, item, options)
+                result["instructions"] = instructions
+            except SystemExit as e:
+                result["error"] = str(e.code)
+            except Exception as e:
+                result["error"] = "ERROR: " + item + ": " + type(e).__name__ + ": " + str(e)
+            result["time"] = time.perf_counter() - start
+            results.append(result)
+
+        with self.__writeLock:
+            if options["wholeProgram"]:
+                JackCompiler.linkProjects(results, inlineBudget=options["inlineBudget"])
+            else:
+                for result in results:
+                    if result["error"] is None:
+                        vmWriter = VMWriter.VMWriter(JackCompiler.vmPathFor(result["path"]))
+                        vmWriter.writeInstructions(result["instructions"])
+                        vmWriter.close()
+        for result in results:
+            result.pop("instructions", None)
+        return results
+
+    def handle(self, request):
+        self.requests += 1
+        command = request.get("command")
+        options = requestOptions(request.get("options"))
+        if command == "compile":
+            return {"results": self.compilePaths(request.get("paths", []), options)}
+        elif command == "source":
+            name = request.get("name", "source")
+            try:
+                instructions, stats, tokens = self.compileSource(request.get("source", ""), name, options)
+            except SystemExit as e:
+                return {"error": str(e.code), "vm": None}
+            return {"error": None, "vm": VMWriter.formatInstructions(instructions), "stats": stats}
+        elif command == "status":
+            return {"pid": os.getpid(), "requests": self.requests, "cached": len(self.classes), "hits": self.classes.hits, "misses": self.classes.misses}
+        elif command == "stop":
+            # shutdown blocks until serve_forever returns, so it can't run on the request's thread
+            threading.Thread(target=self.shutdown).start()
+            return {"stopped": True}
+        return {"error": "ERROR: unknown command " + str(command)}
+
+class CompileRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.handle(json.loads(line))
+            except Exception as e:
+                response = {"error": "ERROR: " + type(e).__name__ + ": " + str(e)}
+            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+# Runs a server on socketPath until a stop request, refuses to start if one is already running
+def serve(socketPath, maxEntries=4096):
+    if os.path.exists(socketPath):
+        try:
+            request(socketPath, {"command": "status"})
+            sys.exit("ERROR: a compile server is already running on " + socketPath)
+        except OSError:
+            # left behind by a server that didn't stop cleanly
+            os.unlink(socketPath)
+    server = CompileServer(socketPath, maxEntries)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socketPath):
+            os.unlink(socketPath)
+
+# Sends one request to the server on socketPath and returns its response
+# Raises OSError when no server is listening
+def request(socketPath, message):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socketPath)
+        connection.sendall((json.dumps(message) + "\n").encode("utf-8"))
+        with connection.makefile("rb") as reply:
+            line = reply.readline()
+    if not line:
+        raise ConnectionError("compile server closed the connection")
+    return json.loads(line)
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description="Compile server for Jack files on a local Unix socket, and its client")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="socket path (default: " + DEFAULT_SOCKET + ")")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serveParser = commands.add_parser("serve", help="run the server in the foreground until stopped")
+    serveParser.add_argument("--cache-size", type=int, default=4096, help="maximum number of compiled classes kept in memory (default: 4096)")
+    compileParser = commands.add_parser("compile", help="compile .jack files or directories into .vm files")
+    compileParser.add_argument("paths", nargs="+", metavar="path")
+    sourceParser = commands.add_parser("source", help="compile one class and print its VM code")
+    sourceParser.add_argument("file", nargs="?", default="-", help=".jack file, - for standard input (default)")
+    sourceParser.add_argument("--name", help="class name used in error messages (default: the file name)")
+    for subParser in (compileParser, sourceParser):
+        subParser.add_argument("-O", "--optimize", action="store_true", help="as in JackCompiler.py")
+        subParser.add_argument("--pool-strings", action="store_true", help="as in JackCompiler.py")
+        subParser.add_argument("--multiply-cost", type=int, metavar="N", help="as in JackCompiler.py")
+    compileParser.add_argument("--whole-program", action="store_true", help="as in JackCompiler.py")
+    compileParser.add_argument("--inline-budget", type=int, metavar="N", help="as in JackCompiler.py")
+    commands.add_parser("status", help="print the server's request and cache counters")
+    commands.add_parser("stop", help="stop the server")
+    return parser.parse_args(argv)
+
+def main():
+    args = parseArgs(sys.argv[1:])
+    if args.command == "serve":
+        serve(args.socket, args.cache_size)
+        return
+
+    message = {"command": args.command}
+    if args.command in ("compile", "source"):
+        message["options"] = {"optimize": args.optimize, "poolStrings": args.pool_strings,
+                              "wholeProgram": getattr(args, "whole_program", False)}
+        if args.multiply_cost is not None:
+            message["options"]["multiplyCost"] = args.multiply_cost
+        if getattr(args, "inline_budget", None) is not None:
+            message["options"]["inlineBudget"] = args.inline_budget
+    if args.command == "compile":
+        # the server may run in another directory
+        message["paths"] = [os.path.abspath(path) for path in args.paths]
+    elif args.command == "source":
+        if args.file == "-":
+            message["source"] = sys.stdin.read()
+        else:
+            with open(args.file, "r", encoding="utf-8") as file:
+                message["source"] = file.read()
+        message["name"] = args.name or args.file
+
+    try:
+        response = request(args.socket, message)
+    except OSError as e:
+        sys.exit("ERROR: no compile server on " + args.socket + " (" + str(e) + "), start one with: python3 CompileServer.py serve")
+
+    if args.command == "compile" and "results" in response:
+        errors = [result["error"] for result in response["results"] if result["error"] is not None]
+        for error in errors:
+            print(error, file=sys.stderr)
+        if len(errors) > 0:
+            sys.exit("ERROR: " + str(len(errors)) + " of " + str(len(response["results"])) + " files failed to compile")
+    elif args.command == "source" and response.get("vm") is not None:
+        sys.stdout.write(response["vm"])
+    elif response.get("error") is not None:
+        sys.exit(response["error"])
+    else:
+        print(json.dumps(response))
+
+if __name__ == "__main__":
+    main()
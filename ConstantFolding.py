@@ -0,0 +1,119 @@
+import VMWriter
+from JackAST import NodeTransformer, Expression, IntegerConstant, KeywordConstant, UnaryOp, FoldedConstant
+
+# Constant folding (-O)
+# CompilationEngine computes the value of every term and expression it writes when it is known at
+# compile time, and replaces the code of a constant (sub)expression by a push of its value
+# (foldConstant). On the --ast path the same folding is a tree pass (foldTree) that runs before
+# CodeGenerator, with the same results and stats.
+
+# Evaluates a binary op on two constant operands the way the Hack VM and OS would
+# Returns None if either operand isn't constant or the result can't be known at compile time
+def foldBinary(opSymbol, left, right):
+    if left is None or right is None:
+        return None
+    if opSymbol == "+":
+        return VMWriter.toWord(left + right)
+    elif opSymbol == "-":
+        return VMWriter.toWord(left - right)
+    elif opSymbol == "*":
+        return VMWriter.toWord(left * right)
+    elif opSymbol == "/":
+        # Math.divide truncates towards zero, dividing by zero is a runtime error
+        if right == 0 or left == -32768:
+            return None
+        quotient = abs(left) // abs(right)
+        return quotient if (left < 0) == (right < 0) else -quotient
+    elif opSymbol == "&":
+        return left & right
+    elif opSymbol == "|":
+        return left | right
+    elif opSymbol == "<":
+        return -1 if left < right else 0
+    elif opSymbol == ">":
+        return -1 if left > right else 0
+    elif opSymbol == "=":
+        return -1 if left == right else 0
+    else:
+        return None
+
+# Replaces the code written to vmWriter since start with the push of value, if value is a constant
+# and that is shorter
+# stats: dict, counts the instructions and Math calls removed
+def foldConstant(vmWriter, start, value, stats):
+    if value is None:
+        return
+    replacement = VMWriter.constantInstructions(value)
+    if replacement is None or len(replacement) >= vmWriter.position() - start:
+        return
+    dropped = vmWriter.truncate(start)
+    vmWriter.writeInstructions(replacement)
+    stats["constant folding instructions removed"] = stats.get("constant folding instructions removed", 0) + len(dropped) - len(replacement)
+    for instruction in dropped:
+        if instruction.op == VMWriter.Op.CALL:
+            stats["constant folding calls removed"] = stats.get("constant folding calls removed", 0) + 1
+
+# Binary operators written as a call to the OS
+OS_OPERATORS = ("*", "/")
+
+NOT_CONSTANT = (None, 0, 0)
+
+# Folds the constant (sub)expressions of a class's tree into FoldedConstant nodes, a PassManager pass.
+# An expression's constant prefix is folded exactly where foldConstant would fold the code
+# CodeGenerator writes for it, so the code is the same as CompilationEngine's
+class TreeFolder(NodeTransformer):
+    def __init__(self, stats):
+        self.stats = stats
+        self.__expressionCode = {} # id of a visited Expression -> its __constantCode
+
+    # (value, instructions, calls) of the code CodeGenerator writes for a term: its value, None when it
+    # isn't a compile time constant, and for constants the number of instructions and of calls
+    def __constantCode(self, node):
+        kind = type(node)
+        if kind is IntegerConstant:
+            return (node.value, 1, 0)
+        elif kind is FoldedConstant:
+            return (node.value, len(VMWriter.constantInstructions(node.value)), 0)
+        elif kind is KeywordConstant:
+            if node.value == "true":
+                return (-1, 2, 0)
+            return NOT_CONSTANT if node.value == "this" else (0, 1, 0)
+        elif kind is UnaryOp:
+            value, length, calls = self.__constantCode(node.term)
+            if value is None:
+                return NOT_CONSTANT
+            return (VMWriter.toWord(-value) if node.op == "-" else ~value, length + 1, calls)
+        elif kind is Expression:
+            return self.__expressionCode.get(id(node), NOT_CONSTANT)
+        return NOT_CONSTANT
+
+    # Jack has no operator precedence, so the value is folded left to right like the generated code
+    def visitExpression(self, node):
+        self.genericVisit(node)
+        value, length, calls = self.__constantCode(node.terms[0])
+        foldedTerms = 0
+        for k in range(len(node.terms)):
+            if k > 0:
+                termValue, termLength, termCalls = self.__constantCode(node.terms[k])
+                op = node.ops[k - 1]
+                length += termLength + 1
+                calls += termCalls + (1 if op in OS_OPERATORS else 0)
+                value = foldBinary(op, value, termValue)
+            if value is None:
+                break
+            replacement = VMWriter.constantInstructions(value)
+            if replacement is not None and len(replacement) < length:
+                self.stats["constant folding instructions removed"] = self.stats.get("constant folding instructions removed", 0) + length - len(replacement)
+                if calls > 0:
+                    self.stats["constant folding calls removed"] = self.stats.get("constant folding calls removed", 0) + calls
+                length, calls = len(replacement), 0
+                foldedTerms = k + 1
+                foldedValue = value
+        if foldedTerms > 0:
+            node.terms[:foldedTerms] = [FoldedConstant(foldedValue)]
+            del node.ops[:foldedTerms - 1]
+        self.__expressionCode[id(node)] = NOT_CONSTANT if value is None else (value, length, calls)
+        return node
+
+def foldTree(classNode, stats):
+    return TreeFolder(stats).visit(classNode)
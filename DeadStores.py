@@ -0,0 +1,211 @@
+from VMWriter import Op, Segment, Instruction
+
+# Dead store elimination (-O)
+# A liveness analysis over a function's control flow graph (its labels and jumps) finds the pops
+# into a variable whose value is never read: the variable is popped again or the function returns
+# first, on every path. Such a pop goes, together with the code computing its value when that code
+# has no calls. The variables are locals, arguments, fields (this) and statics. Fields and statics
+# outlive the function and may be read by any call, so calls, returns, reads through pointer 1
+# (that) and changes of pointer 0 count as reading all of them.
+# The VM 'function f n' command already sets the n locals to 0, so a second analysis finds the
+# 'push constant 0; pop local k' pairs (the var initializations) run while local k can only be 0.
+# Code before a class's first function (its static initializations) is never run and goes as well.
+
+VARIABLE_SEGMENTS = (Segment.ARGUMENT, Segment.LOCAL, Segment.STATIC, Segment.THIS)
+
+BINARY_OPS = (Op.ADD, Op.SUB, Op.EQ, Op.GT, Op.LT, Op.AND, Op.OR)
+UNARY_OPS = (Op.NEG, Op.NOT)
+
+PUSH_ZERO = Instruction(Op.PUSH, Segment.CONSTANT, 0)
+
+# Splits a function's instructions into basic blocks
+# Returns (blocks, successors): a list of (start, end) ranges and, per block, the indexes of the
+# blocks control can go to next
+def basicBlocks(code):
+    starts = [0]
+    for i, instruction in enumerate(code):
+        if instruction.op == Op.LABEL and i > 0:
+            starts.append(i)
+        elif instruction.op in (Op.GOTO, Op.IF_GOTO, Op.RETURN) and i + 1 < len(code):
+            starts.append(i + 1)
+    starts = sorted(set(starts))
+    blocks = [(start, starts[n + 1] if n + 1 < len(starts) else len(code)) for n, start in enumerate(starts)]
+    labels = dict((code[start].arg1, n) for n, (start, end) in enumerate(blocks) if code[start].op == Op.LABEL)
+
+    successors = []
+    for n, (start, end) in enumerate(blocks):
+        last = code[end - 1]
+        following = [n + 1] if n + 1 < len(blocks) else []
+        if last.op == Op.GOTO:
+            successors.append([labels[last.arg1]] if last.arg1 in labels else [])
+        elif last.op == Op.IF_GOTO:
+            successors.append(([labels[last.arg1]] if last.arg1 in labels else []) + following)
+        elif last.op == Op.RETURN:
+            successors.append([])
+        else:
+            successors.append(following)
+    return blocks, successors
+
+# The fields and statics a function uses, what a call or return may read
+def memoryVariables(code):
+    return tuple(set((segment, index) for op, segment, index in code
+                     if (op == Op.PUSH or op == Op.POP) and (segment == Segment.THIS or segment == Segment.STATIC)))
+
+# Variables an instruction reads
+# memory: see memoryVariables
+def reads(instruction, memory):
+    op, segment, index = instruction
+    if op == Op.PUSH and segment in VARIABLE_SEGMENTS:
+        return ((segment, index),)
+    if op == Op.CALL or op == Op.RETURN or (op == Op.PUSH and segment == Segment.THAT) \
+            or (op == Op.POP and segment == Segment.POINTER and index == 0):
+        return memory
+    return ()
+
+# Live variables at the end of every block
+def liveAtEnd(code, blocks, successors, memory):
+    uses = []
+    kills = []
+    for start, end in blocks:
+        used = set()
+        killed = set()
+        for instruction in reversed(code[start:end]):
+            if instruction.op == Op.POP and instruction.arg1 in VARIABLE_SEGMENTS:
+                killed.add((instruction.arg1, instruction.arg2))
+                used.discard((instruction.arg1, instruction.arg2))
+            used.update(reads(instruction, memory))
+        uses.append(used)
+        kills.append(killed)
+
+    liveIn = [set() for block in blocks]
+    liveOut = [set() for block in blocks]
+    changed = True
+    while changed:
+        changed = False
+        for n in reversed(range(len(blocks))):
+            out = set()
+            for successor in successors[n]:
+                out |= liveIn[successor]
+            live = uses[n] | (out - kills[n])
+            if live != liveIn[n] or out != liveOut[n]:
+                liveIn[n], liveOut[n] = live, out
+                changed = True
+    return liveOut
+
+# Start of the code computing the value popped at code[end], if it only pushes and computes
+# (no calls, no jumps) so that it can go with the pop. None otherwise
+def valueStart(code, end):
+    needed = 1
+    i = end
+    while needed > 0:
+        i -= 1
+        if i < 0:
+            return None
+        op = code[i].op
+        if op == Op.PUSH:
+            needed -= 1
+        elif op in BINARY_OPS:
+            needed += 1
+        elif op not in UNARY_OPS:
+            return None
+    return i
+
+# Indexes of the dead stores (pops and the code of their values) of a function
+def deadStores(code):
+    blocks, successors = basicBlocks(code)
+    memory = memoryVariables(code)
+    liveOut = liveAtEnd(code, blocks, successors, memory)
+    dead = set()
+    for n, (start, end) in enumerate(blocks):
+        live = set(liveOut[n])
+        for i in reversed(range(start, end)):
+            instruction = code[i]
+            if instruction.op == Op.POP and instruction.arg1 in VARIABLE_SEGMENTS:
+                if (instruction.arg1, instruction.arg2) not in live:
+                    first = valueStart(code, i)
+                    if first is not None and first >= start:
+                        dead.update(range(first, i + 1))
+                live.discard((instruction.arg1, instruction.arg2))
+            live.update(reads(instruction, memory))
+    return dead
+
+# Indexes of the 'push constant 0; pop local k' pairs run while local k can only be 0
+def redundantZeroInitializations(code):
+    blocks, successors = basicBlocks(code)
+    predecessors = [[] for block in blocks]
+    for n, following in enumerate(successors):
+        for successor in following:
+            predecessors[successor].append(n)
+
+    # locals that are 0 at the start and the end of every block, None while no path to it is known
+    zeroIn = [None for block in blocks]
+    zeroOut = [None for block in blocks]
+    zeroIn[0] = set(range(code[0].arg2))
+
+    def run(n, zero, redundant=None):
+        start, end = blocks[n]
+        for i in range(start, end):
+            instruction = code[i]
+            if instruction.op == Op.POP and instruction.arg1 == Segment.LOCAL:
+                if i > start and code[i - 1] == PUSH_ZERO:
+                    if redundant is not None and instruction.arg2 in zero:
+                        redundant.update((i - 1, i))
+                    zero.add(instruction.arg2)
+                else:
+                    zero.discard(instruction.arg2)
+        return zero
+
+    changed = True
+    while changed:
+        changed = False
+        for n in range(len(blocks)):
+            if n > 0:
+                known = [zeroOut[predecessor] for predecessor in predecessors[n] if zeroOut[predecessor] is not None]
+                if len(known) == 0:
+                    continue
+                zeroIn[n] = set.intersection(*known)
+            zero = run(n, set(zeroIn[n]))
+            if zero != zeroOut[n]:
+                zeroOut[n] = zero
+                changed = True
+
+    redundant = set()
+    for n in range(len(blocks)):
+        if zeroIn[n] is not None:
+            run(n, set(zeroIn[n]), redundant)
+    return redundant
+
+# Removes the dead stores and redundant zero initializations of one function, or of the code
+# before a class's first function
+# stats: dict, "dead store instructions removed" counts the instructions removed, with a count per
+#   function ("dead store instructions removed in Class.name"), and "dead store zero
+#   initializations removed" the local initializations among them
+# Returns the new instruction list
+def eliminate(code, stats):
+    if len(code) == 0:
+        return code
+    if code[0].op != Op.FUNCTION:
+        # static initializations, never run
+        stats["dead store instructions removed"] = stats.get("dead store instructions removed", 0) + len(code)
+        return []
+
+    name = code[0].arg1
+    removed = 0
+    while True:
+        # one kind of removal at a time: a dead 'pop local k' may be the one that makes a later
+        # initialization of k redundant
+        remove = redundantZeroInitializations(code)
+        if len(remove) > 0:
+            stats["dead store zero initializations removed"] = stats.get("dead store zero initializations removed", 0) + len(remove) // 2
+        else:
+            remove = deadStores(code)
+            if len(remove) == 0:
+                break
+        code = [instruction for i, instruction in enumerate(code) if i not in remove]
+        removed += len(remove)
+
+    if removed > 0:
+        stats["dead store instructions removed"] = stats.get("dead store instructions removed", 0) + removed
+        key = "dead store instructions removed in " + name
+        stats[key] = stats.get(key, 0) + removed
+    return code
@@ -0,0 +1,127 @@
+from VMWriter import Op, Segment, Instruction
+from TreeShaker import splitFunctions, joinFunctions
+
+# Whole-program inlining of small leaf subroutines (getters, setters, constant functions)
+# A call to a subroutine whose body is straight-line code without calls is replaced by the body:
+# the arguments are popped into temps, argument and local accesses go to those temps, and the
+# object's fields are reached through pointer 1 (that) instead of pointer 0 (this), so the
+# caller's this is left alone. The code generator never relies on pointer 1 across a call, and
+# a real call would not keep its temps either.
+
+# Default maximum number of instructions of an inlined body, function and return excluded
+DEFAULT_BUDGET = 8
+
+# Temps an inlined body may use for its arguments and locals. temp 0 and temp 1 are left to the
+# code generator (do statements, array stores)
+INLINE_TEMPS = [2, 3, 4, 5, 6, 7]
+
+# Returns the body of a function if it can be inlined: straight-line code without calls ending in
+# return, no more than budget instructions, leaving exactly the return value on the stack and only
+# reaching this after setting pointer 0 itself. None otherwise
+def inlinableBody(code, budget):
+    body = code[1:]
+    if len(body) == 0 or body[-1].op != Op.RETURN:
+        return None
+    body = body[:-1]
+    if len(body) > budget:
+        return None
+    depth = 0
+    thisSet = False
+    for instruction in body:
+        op, segment, index = instruction
+        if op in (Op.CALL, Op.FUNCTION, Op.RETURN, Op.LABEL, Op.GOTO, Op.IF_GOTO):
+            return None
+        if op == Op.PUSH or op == Op.POP:
+            if segment == Segment.THAT or (segment == Segment.POINTER and index == 1):
+                return None
+            if segment == Segment.THIS or (segment == Segment.POINTER and op == Op.PUSH):
+                if not thisSet:
+                    return None
+            if segment == Segment.POINTER and op == Op.POP:
+                thisSet = True
+        if op == Op.PUSH:
+            depth += 1
+        elif op == Op.POP or op in (Op.ADD, Op.SUB, Op.EQ, Op.GT, Op.LT, Op.AND, Op.OR):
+            depth -= 1
+        if depth < 0:
+            return None
+    if depth != 1:
+        return None
+    return body
+
+# Instructions replacing 'call name nArgs' with the body, or None if it doesn't fit in the temps
+def inlinedCall(body, nArgs, nLocals):
+    usedTemps = set(index for op, segment, index in body if segment == Segment.TEMP)
+    temps = [temp for temp in INLINE_TEMPS if temp not in usedTemps]
+    if nArgs + nLocals > len(temps) or any(segment == Segment.ARGUMENT and index >= nArgs for op, segment, index in body):
+        return None
+
+    code = []
+    # the last argument is on top of the stack
+    for argument in reversed(range(nArgs)):
+        code.append(Instruction(Op.POP, Segment.TEMP, temps[argument]))
+    for local in range(nLocals):
+        code += [Instruction(Op.PUSH, Segment.CONSTANT, 0), Instruction(Op.POP, Segment.TEMP, temps[nArgs + local])]
+    for op, segment, index in body:
+        if segment == Segment.ARGUMENT:
+            segment, index = Segment.TEMP, temps[index]
+        elif segment == Segment.LOCAL:
+            segment, index = Segment.TEMP, temps[nArgs + index]
+        elif segment == Segment.THIS:
+            segment = Segment.THAT
+        elif segment == Segment.POINTER:
+            index = 1
+        code.append(Instruction(op, segment, index))
+
+    # pop temp t; push temp t => nothing, when nothing else reads temp t
+    private = set(temps[:nArgs + nLocals])
+    i = 0
+    while i + 1 < len(code):
+        pop, push = code[i], code[i + 1]
+        if pop.op == Op.POP and pop.arg1 == Segment.TEMP and pop.arg2 in private and push == Instruction(Op.PUSH, Segment.TEMP, pop.arg2) \
+                and not any(instruction.arg1 == Segment.TEMP and instruction.arg2 == pop.arg2 for instruction in code[i + 2:]):
+            del code[i:i + 2]
+            i = max(0, i - 1)
+        else:
+            i += 1
+    return code
+
+# Replaces calls to small leaf subroutines with their bodies
+# classes: dict path -> instruction list for every class of one program
+# stats: dict updated with the call sites inlined and the subroutines they belonged to
+# budget: maximum body size, see DEFAULT_BUDGET, 0 to inline nothing
+# Returns a dict path -> instruction list. Subroutines no longer called are left to TreeShaker
+def inline(classes, stats, budget=DEFAULT_BUDGET):
+    split = {}
+    bodies = {} # name -> (path, body, nLocals)
+    for path, instructions in classes.items():
+        split[path] = splitFunctions(instructions)
+        for name, code in split[path][1]:
+            body = inlinableBody(code, budget)
+            if body is not None:
+                bodies[name] = (path, body, code[0].arg2)
+    if len(bodies) == 0:
+        return classes
+
+    inlined = {}
+    inlinedNames = set()
+    for path, (prefix, functions) in split.items():
+        rewritten = []
+        for name, code in functions:
+            newCode = []
+            for instruction in code:
+                callee = bodies.get(instruction.arg1) if instruction.op == Op.CALL else None
+                # statics belong to the callee's file
+                if callee is not None and (callee[0] == path or not any(segment == Segment.STATIC for op, segment, index in callee[1])):
+                    replacement = inlinedCall(callee[1], instruction.arg2, callee[2])
+                    if replacement is not None:
+                        newCode.extend(replacement)
+                        inlinedNames.add(instruction.arg1)
+                        stats["inlining call sites inlined"] = stats.get("inlining call sites inlined", 0) + 1
+                        continue
+                newCode.append(instruction)
+            rewritten.append((name, newCode))
+        inlined[path] = joinFunctions(prefix, rewritten)
+    if len(inlinedNames) > 0:
+        stats["inlining subroutines inlined"] = stats.get("inlining subroutines inlined", 0) + len(inlinedNames)
+    return inlined
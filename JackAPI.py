@@ -0,0 +1,99 @@
+import io
+import JackTokenizer, CompilationEngine, PeepholeOptimizer, VMWriter, TreeShaker, Inliner, JackAST, AstParser, CodeGenerator, StrengthReduction, ConstantFolding
+
+# In-process compiler API for tools that compile many snippets (test generators, fuzzers,
+# graders). Everything happens in memory: no files are read or written, nothing is printed,
+# and compile errors are raised as CompileError (or returned as diagnostics by compileMany)
+# instead of exiting. Importing it only loads the compiler itself.
+#   import JackAPI
+#   vm = JackAPI.compileSource("class Main { function void main() { return; } }", "Main")
+#   results = JackAPI.compileMany([("Main", mainText), ("Ball", ballText)], optimize=True)
+
+class CompileError(Exception):
+    # message: the compiler's error message
+    # className: name of the class being compiled
+    def __init__(self, message, className=""):
+        Exception.__init__(self, message)
+        self.className = className
+
+# Compile options, as in JackCompiler.compileOptions
+def defaultOptions(optimize=False, poolStrings=False, wholeProgram=False, ast=False, multiplyCost=StrengthReduction.DEFAULT_MAX_COST,
+                   inlineBudget=Inliner.DEFAULT_BUDGET):
+    return {"xml": False, "optimize": optimize, "poolStrings": poolStrings, "wholeProgram": wholeProgram, "profile": False, "stream": False, "ast": ast,
+            "multiplyCost": multiplyCost, "inlineBudget": inlineBudget}
+
+# Passes run over the tree with options["ast"] and optimize, see JackAST.PassManager
+AST_PASSES = [("constant folding", ConstantFolding.foldTree)]
+
+# Compiles a class from its tokens (a list or an iterator), nothing is written yet
+# With options["stream"] each subroutine is written out as it is compiled, vmWriter.close() finishes the file.
+# With options["ast"] the class is parsed into a JackAST tree, the passes run over it and
+# CodeGenerator generates the code
+# Returns the CompilationEngine (or CodeGenerator), its vmWriter holds the generated code. Compile errors exit (SystemExit)
+def compileTokens(tokens, compiledFilePath, sourceName, options):
+    optimizer = PeepholeOptimizer.PeepholeOptimizer() if options["optimize"] else None
+    # a negative cost turns strength reduction off
+    multiplyCost = options.get("multiplyCost", StrengthReduction.DEFAULT_MAX_COST)
+    if not options["optimize"] or multiplyCost < 0:
+        multiplyCost = None
+    if options.get("ast", False):
+        classNode = AstParser.AstParser(tokens, sourceName).parseClass()
+        # constant folding is done by its tree pass
+        generator = CodeGenerator.CodeGenerator(compiledFilePath, sourceName, optimizer, poolStrings=options["poolStrings"],
+                                                multiplyCost=multiplyCost, optimizeBranches=options["optimize"], optimizeArrays=options["optimize"])
+        classNode = JackAST.PassManager(AST_PASSES if options["optimize"] else []).run(classNode, generator.stats)
+        generator.generate(classNode, writeOutput=False)
+        return generator
+    compilationEngine = CompilationEngine.CompilationEngine(tokens, compiledFilePath, sourceName, optimizer, foldConstants=options["optimize"],
+                                                            poolStrings=options["poolStrings"], streaming=options.get("stream", False),
+                                                            multiplyCost=multiplyCost, optimizeBranches=options["optimize"], optimizeArrays=options["optimize"])
+    compilationEngine.compileClass(writeOutput=False)
+    return compilationEngine
+
+# Compiles the source of one class
+# Returns (instructions, stats), raises CompileError
+def _compileClass(text, className, options):
+    try:
+        tokenizer = JackTokenizer.JackTokenizer(io.StringIO(text))
+        compilationEngine = compileTokens(tokenizer.tokens(), className + ".vm", className + ".jack", options)
+    except SystemExit as e:
+        raise CompileError(str(e.code), className) from None
+    except Exception as e:
+        # the parser trips over some malformed inputs instead of reporting them
+        raise CompileError("ERROR: " + className + ".jack: " + type(e).__name__ + ": " + str(e), className) from e
+    return compilationEngine.vmWriter.instructions, compilationEngine.stats
+
+# Compiles the Jack source of one class
+# className: name of the class, used in error messages
+# ast: compile through the syntax tree (see JackAST), the code is the same
+# multiplyCost: with optimize, see StrengthReduction, negative to always call Math.multiply
+# Returns the VM code as text, raises CompileError
+def compileSource(text, className="Main", optimize=False, poolStrings=False, ast=False, multiplyCost=StrengthReduction.DEFAULT_MAX_COST):
+    instructions, stats = _compileClass(text, className, defaultOptions(optimize, poolStrings, ast=ast, multiplyCost=multiplyCost))
+    return VMWriter.formatInstructions(instructions)
+
+# Compiles several classes, a failing class doesn't stop the others
+# sources: iterable of (className, text) pairs, e.g. dict.items()
+# wholeProgram: treat the classes as one program, inline small subroutines (see Inliner, at most
+#   inlineBudget instructions) and drop unreachable ones (see TreeShaker), skipped when any class failed
+# Returns a list of {"className", "vm", "error", "stats"} in input order, vm is None and error
+# the message when the class failed to compile
+def compileMany(sources, optimize=False, poolStrings=False, wholeProgram=False, ast=False, multiplyCost=StrengthReduction.DEFAULT_MAX_COST,
+                inlineBudget=Inliner.DEFAULT_BUDGET):
+    options = defaultOptions(optimize, poolStrings, wholeProgram, ast, multiplyCost, inlineBudget)
+    results = []
+    classes = {}
+    for className, text in sources:
+        result = {"className": className, "vm": None, "error": None, "stats": {}}
+        try:
+            classes[len(results)], result["stats"] = _compileClass(text, className, options)
+        except CompileError as e:
+            result["error"] = str(e)
+        results.append(result)
+
+    if wholeProgram and len(classes) == len(results) and len(results) > 0:
+        classes = Inliner.inline(classes, results[0]["stats"], inlineBudget)
+        classes = TreeShaker.shake(classes, results[0]["stats"])
+    for idx, instructions in classes.items():
+        results[idx]["vm"] = VMWriter.formatInstructions(instructions)
+    return results
@@ -0,0 +1,138 @@
+# Syntax tree of a Jack class, built by AstParser and turned into VM code by CodeGenerator.
+# Nodes only have __slots__ (no per-node dict), so whole programs of thousands of classes
+# fit in memory. Passes run over the tree between parsing and code generation (see PassManager).
+
+class Node:
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return type(self).__name__ + "(" + ", ".join(name + "=" + repr(getattr(self, name)) for name in self.__slots__) + ")"
+
+# name: class name
+# classVarDecs: list of VarDec (static and field)
+# subroutines: list of SubroutineNode
+class ClassNode(Node):
+    __slots__ = ("name", "classVarDecs", "subroutines")
+
+# kind: "static", "field" or "var"
+# type: type name (int, char, boolean or a class name)
+# names: list of variable names
+class VarDec(Node):
+    __slots__ = ("kind", "type", "names")
+
+# kind: "constructor", "function" or "method"
+# parameters: list of (type, name)
+# varDecs: list of VarDec (var)
+# statements: list of statements
+class SubroutineNode(Node):
+    __slots__ = ("kind", "returnType", "name", "parameters", "varDecs", "statements")
+
+# index: Expression for let a[index] = value, None for a plain variable
+class LetStatement(Node):
+    __slots__ = ("name", "index", "value")
+
+# elseStatements: None when there is no else branch
+class IfStatement(Node):
+    __slots__ = ("condition", "statements", "elseStatements")
+
+class WhileStatement(Node):
+    __slots__ = ("condition", "statements")
+
+# call: SubroutineCall
+class DoStatement(Node):
+    __slots__ = ("call",)
+
+# value: Expression, None for a plain return
+class ReturnStatement(Node):
+    __slots__ = ("value",)
+
+# terms[0] ops[0] terms[1] ops[1] ... evaluated left to right, Jack has no operator precedence.
+# A parenthesized expression is an Expression in the place of a term
+class Expression(Node):
+    __slots__ = ("terms", "ops")
+
+class IntegerConstant(Node):
+    __slots__ = ("value",)
+
+class StringConstant(Node):
+    __slots__ = ("value",)
+
+# value: "true", "false", "null" or "this"
+class KeywordConstant(Node):
+    __slots__ = ("value",)
+
+# A variable, or a class name when no variable of that name exists
+class VarRef(Node):
+    __slots__ = ("name",)
+
+class ArrayAccess(Node):
+    __slots__ = ("name", "index")
+
+# receiver: None for name(...) (a method of this), else the variable or class before the dot
+# arguments: list of Expression
+class SubroutineCall(Node):
+    __slots__ = ("receiver", "name", "arguments")
+
+# op: "-" or "~"
+class UnaryOp(Node):
+    __slots__ = ("op", "term")
+
+# A constant (sub)expression replaced by its value, any 16 bit value (see ConstantFolding)
+class FoldedConstant(Node):
+    __slots__ = ("value",)
+
+# Calls visit<NodeClass>(node) for every node visited, genericVisit when there is no such method
+class NodeVisitor:
+    def visit(self, node):
+        return getattr(self, "visit" + type(node).__name__, self.genericVisit)(node)
+
+    # Visits the children of node (nodes and lists of nodes in its slots)
+    def genericVisit(self, node):
+        for name in node.__slots__:
+            value = getattr(node, name)
+            if isinstance(value, Node):
+                self.visit(value)
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, Node):
+                        self.visit(item)
+
+# A NodeVisitor whose visit methods return the node to put in place of the visited one
+# (the node itself to keep it, None to remove it from a list)
+class NodeTransformer(NodeVisitor):
+    def genericVisit(self, node):
+        for name in node.__slots__:
+            value = getattr(node, name)
+            if isinstance(value, Node):
+                setattr(node, name, self.visit(value))
+            elif isinstance(value, list):
+                replaced = []
+                for item in value:
+                    if isinstance(item, Node):
+                        item = self.visit(item)
+                        if item is None:
+                            continue
+                    replaced.append(item)
+                value[:] = replaced
+        return node
+
+# Runs passes over a class's tree between parsing and code generation
+class PassManager:
+    # passes: list of (name, fn) pairs, fn(classNode, stats) returns the (possibly new) ClassNode
+    #   and may add counters to stats. JackAPI.AST_PASSES are the compiler's own
+    def __init__(self, passes=None):
+        self.passes = [] if passes is None else list(passes)
+
+    def add(self, name, fn):
+        self.passes.append((name, fn))
+
+    # Runs every pass in order
+    # Returns the transformed ClassNode
+    def run(self, classNode, stats):
+        for name, fn in self.passes:
+            classNode = fn(classNode, stats)
+        return classNode
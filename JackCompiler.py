@@ -1,72 +1,372 @@
-import sys, os, re
-import JackTokenizer, CompilationEngine
+import sys, os, re, argparse, time
+from concurrent.futures import ProcessPoolExecutor
+import JackTokenizer, BuildCache, VMWriter, TreeShaker, Inliner, Profiler, Watcher, JackAPI, StrengthReduction
 from xml.sax.saxutils import escape
 
-def main():
+# Runs the tokenizer over an open jack file
+# Returns a list of JackTokenizer.Token records, in source order
+def tokenize(file):
+    tokens = []
+    tokenizer = JackTokenizer.JackTokenizer(file)
+    while tokenizer.hasMoreTokens():
+        tokenizer.advance()
+        if tokenizer.tokenType() != "EOF":
+            tokens.append(tokenizer.token())
+    return tokens
 
-    # Initialize environment
-    if len(sys.argv) < 2:
-        sys.exit("ERROR: No Jack file specified")
+# Writes the token list to a *T.xml file (debugging aid only, the compiler does not read it back)
+def writeTokenXml(tokens, symbolFilePath):
+    symbolFile = open(symbolFilePath, 'w', encoding="utf-8")
+    symbolFile.write("<tokens>" + os.linesep)
+    for token in tokens:
+        tag = JackTokenizer.TAG_NAMES[token.kind]
+        symbolFile.write("<" + tag + "> " + escape(token.text) + " </" + tag + ">" + os.linesep)
+    symbolFile.write("</tokens>" + os.linesep)
+    symbolFile.close()
+
+CACHE_FILE_NAME = ".jackcache.json"
+
+# Characters the tokenizer reads at a time with --stream
+STREAM_CHUNK_SIZE = 65536
+
+# Path of the .vm file compiled from a .jack file
+def vmPathFor(item):
+    return re.sub('.jack$', '.vm', item)
+
+# Options passed to compileFile (and on to worker processes)
+def compileOptions(args):
+    return {"xml": args.xml, "optimize": args.optimize, "poolStrings": args.pool_strings, "wholeProgram": args.whole_program,
+            "profile": args.profile, "stream": args.stream, "ast": args.ast, "multiplyCost": args.multiply_cost,
+            "inlineBudget": args.inline_budget, "lexStats": args.lex_stats}
+
+# Compile options that change the generated code, so they are part of the build cache key
+def cacheOptions(options):
+    return "optimize=" + str(options["optimize"]) + " poolStrings=" + str(options["poolStrings"]) + " multiplyCost=" + str(options["multiplyCost"])
+
+# Tokenizes and compiles one jack file into a .vm file next to it
+# Runs in a worker process when compiling with --jobs, so errors are returned instead of exiting
+# options: dict from compileOptions
+# Returns {"path", "error", "tokens", "lexTime", "time", "stats"}, error is None when the file compiled.
+# In whole-program mode nothing is written, the code is returned in result["instructions"] instead.
+# With options["profile"] the result also has "profile", the Profiler records of every phase
+
+def compileFile(item, options):
+    result = {"path": item, "error": None, "tokens": 0, "lexTime": 0.0, "time": 0.0, "stats": {}}
+    profiler = Profiler.Profiler(item, traceMemory=options["profile"])
+    start = time.perf_counter()
+    try:
+        if options["stream"]:
+            streamFile(item, options, profiler, result)
+            return result
 
-    workingDirectory = os.getcwd()
-    filePath = sys.argv[1]
+        # Tokenize
+        with profiler.phase("tokenize") as phase:
+            file = open(item, 'r', encoding="utf-8")
+            tokens = tokenize(file)
+            file.close()
+            phase["tokens"] = result["tokens"] = len(tokens)
+        result["lexTime"] = profiler.seconds("tokenize")
+        if options["xml"]:
+            with profiler.phase("xml"):
+                writeTokenXml(tokens, re.sub('.jack$','T.xml', item))
+
+        #compile
+        with profiler.phase("compile") as phase:
+            compilationEngine = JackAPI.compileTokens(tokens, vmPathFor(item), item, options)
+            phase["tokens"] = len(tokens)
+            phase["instructions"] = len(compilationEngine.vmWriter.instructions)
+        result["stats"] = compilationEngine.stats
+        if options["wholeProgram"]:
+            result["instructions"] = compilationEngine.vmWriter.instructions
+        else:
+            with profiler.phase("write") as phase:
+                compilationEngine.vmWriter.close()
+                phase["instructions"] = len(compilationEngine.vmWriter.instructions)
+    except SystemExit as e:
+        result["error"] = str(e.code)
+    except Exception as e:
+        result["error"] = "ERROR: " + item + ": " + type(e).__name__ + ": " + str(e)
+    finally:
+        result["time"] = time.perf_counter() - start
+        if options["profile"]:
+            result["profile"] = profiler.records
+    return result
+
+# compileFile with --stream: tokens are read and compiled one subroutine at a time and every
+# subroutine is written out when done, so memory doesn't grow with the size of the file
+# With options["lexStats"] the time spent in the tokenizer is measured token by token
+def streamFile(item, options, profiler, result):
+    with profiler.phase("compile") as phase:
+        with open(item, 'r', encoding="utf-8") as file:
+            tokenizer = JackTokenizer.JackTokenizer(file, STREAM_CHUNK_SIZE)
+            tokens = timedTokens(tokenizer.tokens(), result) if options.get("lexStats", False) else tokenizer.tokens()
+            compilationEngine = JackAPI.compileTokens(tokens, vmPathFor(item), item, options)
+            compilationEngine.vmWriter.close()
+        phase["tokens"] = result["tokens"] = tokenizer.tokenCount()
+        phase["instructions"] = compilationEngine.vmWriter.instructionCount()
+    result["stats"] = compilationEngine.stats
+
+# Yields the tokens of a token iterator, adding the time spent producing them to result["lexTime"]
+def timedTokens(tokens, result):
+    clock = time.perf_counter
+    lexTime = 0.0
+    try:
+        while True:
+            start = clock()
+            token = next(tokens, None)
+            lexTime += clock() - start
+            if token is None:
+                return
+            yield token
+    finally:
+        result["lexTime"] += lexTime
+
+# Compiles all files, spreading them over a process pool when jobs > 1
+# Returns results in the same order as jackFiles
+def compileFiles(jackFiles, jobs, options):
+    if jobs <= 1 or len(jackFiles) <= 1:
+        return [compileFile(item, options) for item in jackFiles]
+
+    # Largest files first so a big class doesn't start last and hold up the whole build
+    schedule = sorted(jackFiles, key=os.path.getsize, reverse=True)
+    results = {}
+    with ProcessPoolExecutor(max_workers=min(jobs, len(jackFiles))) as pool:
+        futures = [(item, pool.submit(compileFile, item, options)) for item in schedule]
+        for item, future in futures:
+            results[item] = future.result()
+    return [results[item] for item in jackFiles]
+
+# Runs the whole-program passes over every project (directory) and writes the .vm files
+# A project with a file that failed to compile is not written at all
+# profile: list the Profiler records of the link phases are added to, or None
+# inlineBudget: maximum size of the subroutines inlined at their call sites (see Inliner)
+def linkProjects(results, profile=None, inlineBudget=Inliner.DEFAULT_BUDGET):
+    projects = {}
+    for result in results:
+        projects.setdefault(os.path.dirname(result["path"]), []).append(result)
+    for directory, projectResults in projects.items():
+        if any(result["error"] is not None for result in projectResults):
+            continue
+        classes = {}
+        for result in projectResults:
+            classes[result["path"]] = result["instructions"]
+        # project-wide counters are reported with the project's first file
+        stats = projectResults[0]["stats"]
+        profiler = Profiler.Profiler(directory, traceMemory=profile is not None)
+        with profiler.phase("link") as phase:
+            classes = Inliner.inline(classes, stats, inlineBudget)
+            classes = TreeShaker.shake(classes, stats)
+            phase["instructions"] = sum(len(instructions) for instructions in classes.values())
+        for result in projectResults:
+            with profiler.phase("write") as phase:
+                vmWriter = VMWriter.VMWriter(vmPathFor(result["path"]))
+                vmWriter.writeInstructions(classes[result["path"]])
+                vmWriter.close()
+                phase["file"] = result["path"]
+                phase["instructions"] = len(classes[result["path"]])
+            del result["instructions"]
+        if profile is not None:
+            profile.extend(profiler.records)
+
+# Collects the .jack files named by paths, descending into sub-directories
+# Returns absolute paths, sorted within each directory and without duplicates
+def findJackFiles(paths):
     jackFiles = []
-    symbolFiles = []
-    # Get jack files
-    if os.path.isdir(filePath):
-        dirContents = os.listdir(filePath)
-        for file in dirContents:
-            if file.endswith(".jack"):
-                jackFiles.append(os.path.join(workingDirectory, filePath, file))
-        
-    else:
-        jackFiles.append(os.path.join(workingDirectory, filePath))
-    
-    
-    # Tokenize
+    seen = set()
+    for path in paths:
+        path = os.path.normpath(os.path.abspath(path))
+        if os.path.isdir(path):
+            found = []
+            for directory, subDirectories, files in os.walk(path):
+                subDirectories[:] = sorted(name for name in subDirectories if not name.startswith("."))
+                for file in sorted(files):
+                    if file.endswith(".jack"):
+                        found.append(os.path.join(directory, file))
+        else:
+            found = [path]
+        for item in found:
+            if item not in seen:
+                seen.add(item)
+                jackFiles.append(item)
+    return jackFiles
+
+# Prints files, tokens and compile time for every project (directory of sources)
+def printSummary(jackFiles, results):
+    projects = {}
     for item in jackFiles:
-        file = open(item, 'r', encoding="utf-8")
-        symbolFilePath = re.sub('.jack$','T.xml', item)
-        symbolFile = open(symbolFilePath, 'w', encoding="utf-8")
-        symbolFiles.append(symbolFilePath)
-        symbolFile.write("<tokens>" + os.linesep)
-        tokenizer = JackTokenizer.JackTokenizer(file)
-        symbolFilePath.split(os.pathsep)
-        while tokenizer.hasMoreTokens():
-            tag = ""
-            value = ""
-            tokenizer.advance()
-            if tokenizer.tokenType() == "SYMBOL":
-                tag = "symbol"
-                value = tokenizer.symbol()
-            elif tokenizer.tokenType() == "STRING_CONST":
-                tag = "stringConstant"
-                value = tokenizer.stringVal()
-            elif tokenizer.tokenType() == "INT_CONST":
-                tag = "integerConstant"
-                value = str(tokenizer.intVal())
-            elif tokenizer.tokenType() == "KEYWORD":
-                tag = "keyword"
-                value = tokenizer.keyword()
-            elif tokenizer.tokenType() == "IDENTIFIER":
-                tag = "identifier"
-                value = tokenizer.identifier()
-            elif tokenizer.tokenType() == "EOF":
+        projects.setdefault(os.path.dirname(item), {"files": 0, "compiled": 0, "failed": 0, "tokens": 0, "time": 0.0})["files"] += 1
+    for result in results:
+        project = projects[os.path.dirname(result["path"])]
+        project["compiled"] += 1
+        project["tokens"] += result["tokens"]
+        project["time"] += result["time"]
+        if result["error"] is not None:
+            project["failed"] += 1
+
+    names = {}
+    for directory in projects:
+        names[directory] = os.path.relpath(directory)
+        if names[directory].startswith(".."):
+            names[directory] = directory
+    totalName = "total (" + str(len(projects)) + " projects)"
+    width = max([len(name) for name in names.values()] + [len(totalName)]) + 2
+
+    print(format("project", "<" + str(width)) + format("files", ">7") + format("compiled", ">10") + format("failed", ">8") + format("tokens", ">10") + format("ms", ">10"))
+    total = {"files": 0, "compiled": 0, "failed": 0, "tokens": 0, "time": 0.0}
+    for directory in sorted(projects):
+        project = projects[directory]
+        for key in total:
+            total[key] += project[key]
+        print(format(names[directory], "<" + str(width)) + format(project["files"], ">7") + format(project["compiled"], ">10")
+              + format(project["failed"], ">8") + format(project["tokens"], ">10") + format(project["time"] * 1000, ">10.1f"))
+    print(format(totalName, "<" + str(width)) + format(total["files"], ">7") + format(total["compiled"], ">10")
+          + format(total["failed"], ">8") + format(total["tokens"], ">10") + format(total["time"] * 1000, ">10.1f"))
+
+# Prints the optimization counters of all files, summed
+def printReport(results):
+    totals = {}
+    for result in results:
+        for key, count in result["stats"].items():
+            totals[key] = totals.get(key, 0) + count
+    if len(totals) == 0:
+        print("optimizations: nothing to report")
+        return
+    width = max(len(key) for key in totals) + 2
+    for key in sorted(totals):
+        print(format(key, "<" + str(width)) + format(totals[key], ">8"))
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description="Compiles Jack files into VM files")
+    parser.add_argument("paths", nargs="*", metavar="path", help=".jack files or directories, directories are searched recursively")
+    parser.add_argument("--xml", action="store_true", help="also write a *T.xml token file next to each source (debugging)")
+    parser.add_argument("--lex-stats", action="store_true", help="print tokenizer throughput (tokens per second) for each file")
+    parser.add_argument("-O", "--optimize", action="store_true", help="fold constant expressions and run the peephole optimizer over the generated VM code")
+    parser.add_argument("--multiply-cost", type=int, default=StrengthReduction.DEFAULT_MAX_COST, metavar="N", help="-O: replace x * constant with adds when that takes at most N more VM instructions than calling Math.multiply, -1 to never (default: " + str(StrengthReduction.DEFAULT_MAX_COST) + ")")
+    parser.add_argument("--pool-strings", action="store_true", help="build each distinct string literal of a class once and reuse it (literals then share one mutable String object)")
+    parser.add_argument("--whole-program", action="store_true", help="treat each directory as one program and drop subroutines that Main.main can never call")
+    parser.add_argument("--inline-budget", type=int, default=Inliner.DEFAULT_BUDGET, metavar="N", help="--whole-program: replace calls to subroutines of at most N straight-line VM instructions without calls (getters, setters) with their code, 0 to never (default: " + str(Inliner.DEFAULT_BUDGET) + ")")
+    parser.add_argument("--report", action="store_true", help="print what the optimizations did (e.g. instructions removed per peephole rule)")
+    parser.add_argument("--no-cache", action="store_true", help="recompile every file, ignoring and not updating the " + CACHE_FILE_NAME + " build manifest")
+    parser.add_argument("--cache-size", type=int, default=4096, help="maximum number of entries kept in each build manifest (default: 4096)")
+    parser.add_argument("--summary", action="store_true", help="print files, tokens and time per project (on by default when several projects are compiled)")
+    parser.add_argument("--profile", action="store_true", help="print time, tokens, instructions and peak memory of every phase of every file, slowest first")
+    parser.add_argument("--profile-output", metavar="FILE", help="also write the profile to FILE as JSON, or as a Chrome trace if FILE ends in .trace.json")
+    parser.add_argument("--stream", action="store_true", help="read, compile and write each file one subroutine at a time, so memory use is bounded by the largest subroutine rather than the file")
+    parser.add_argument("--ast", action="store_true", help="parse each class into a syntax tree and generate the code from it, running tree passes in between (same output)")
+    parser.add_argument("--watch", action="store_true", help="keep running and recompile .jack files whenever their content changes")
+    parser.add_argument("--debounce", type=int, default=200, help="--watch: milliseconds without changes to wait before compiling a burst of saves (default: 200)")
+    parser.add_argument("--poll-interval", type=int, default=500, help="--watch: milliseconds between scans when inotify isn't available (default: 500)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="number of files to compile in parallel (default: number of CPUs)")
+    return parser.parse_args(argv)
+
+# Compiles the out of date files among jackFiles and prints the requested reports
+# caches: build manifests per directory, missing ones are created (and kept for the next build)
+# Returns (number of files that failed, number of files compiled)
+def build(args, options, jackFiles, caches):
+    # One build manifest per source directory, unchanged classes are skipped entirely
+    # A class's code depends on the rest of the program in whole-program mode, so it is not cached
+    if not args.no_cache and not options["wholeProgram"]:
+        for item in jackFiles:
+            directory = os.path.dirname(item)
+            if directory not in caches:
+                caches[directory] = BuildCache.BuildCache(os.path.join(directory, CACHE_FILE_NAME), args.cache_size, cacheOptions(options))
+    staleFiles = []
+    # source keys of the stale files, taken before they are compiled
+    sourceKeys = {}
+    for item in jackFiles:
+        cache = caches.get(os.path.dirname(item))
+        key = cache.sourceKey(item) if cache is not None else None
+        if args.xml or cache is None or not cache.isUpToDate(item, vmPathFor(item), key):
+            staleFiles.append(item)
+            sourceKeys[item] = key
+        elif args.lex_stats:
+            print(os.path.basename(item) + ": up to date")
+
+    errors = 0
+    results = compileFiles(staleFiles, args.jobs, options)
+    # profile records come back from the worker processes with the results
+    profile = [record for result in results for record in result.get("profile", [])] if args.profile else None
+    if options["wholeProgram"]:
+        linkProjects(results, profile, options["inlineBudget"])
+    for result in results:
+        if args.lex_stats:
+            lexTime = result["lexTime"]
+            print(os.path.basename(result["path"]) + ": " + str(result["tokens"]) + " tokens in " + format(lexTime * 1000, ".2f") + " ms ("
+                  + format(result["tokens"] / lexTime if lexTime > 0 else 0, ".0f") + " tokens/s)")
+        if result["error"] is not None:
+            errors += 1
+            print(result["error"], file=sys.stderr)
+        elif os.path.dirname(result["path"]) in caches:
+            caches[os.path.dirname(result["path"])].record(result["path"], vmPathFor(result["path"]), sourceKeys[result["path"]])
+
+    for cache in caches.values():
+        try:
+            cache.save()
+        except OSError as e:
+            print("WARNING: could not write build manifest " + cache.manifestPath + ": " + str(e), file=sys.stderr)
+
+    if args.summary or len(set(os.path.dirname(item) for item in jackFiles)) > 1:
+        printSummary(jackFiles, results)
+    if args.report:
+        printReport(results)
+    if args.profile:
+        Profiler.printProfile(profile)
+        if args.profile_output is not None:
+            try:
+                Profiler.writeProfile(profile, args.profile_output, chromeTrace=args.profile_output.endswith(".trace.json"))
+            except OSError as e:
+                print("WARNING: could not write profile " + args.profile_output + ": " + str(e), file=sys.stderr)
+    return errors, len(staleFiles)
+
+# Rebuilds whenever .jack files under args.paths change, until interrupted (Ctrl-C)
+# Only the changed files are compiled (their whole projects in whole-program mode), and of
+# those only the ones whose content differs from the last build
+def watch(args, options, caches):
+    watcher = Watcher.createWatcher(args.paths, args.poll_interval / 1000)
+    mode = "inotify" if isinstance(watcher, Watcher.InotifyWatcher) else "polling"
+    print("watching " + ", ".join(args.paths) + " for changes (" + mode + "), press Ctrl-C to stop", flush=True)
+    try:
+        while True:
+            changed = Watcher.waitForChanges(watcher, args.debounce / 1000)
+            jackFiles = findJackFiles(args.paths)
+            if options["wholeProgram"]:
+                directories = set(os.path.dirname(item) for item in changed)
+                changed = set(item for item in jackFiles if os.path.dirname(item) in directories)
+            targets = [item for item in jackFiles if item in changed]
+            if len(targets) == 0:
                 continue
-            else:
-                sys.exit("ERROR: unknown token type " + tokenizer.tokenType())
-
-            symbolFile.write("<" + tag + "> " + escape(value) + " </" + tag + ">" + os.linesep)
-        file.close()
-        symbolFile.write("</tokens>" + os.linesep)
-        symbolFile.close()
-
-    #compile
-    for tempFile in symbolFiles:
-        tokenFile = open(tempFile, 'r', encoding="utf-8")
-        compiledFilePath = re.sub('T.xml$', '.vm', tempFile)
-        compilationEngine = CompilationEngine.CompilationEngine(tokenFile, compiledFilePath)
-        compilationEngine.compileClass()
-        file.close()
-
-main()
+            errors, compiled = build(args, options, targets, caches)
+            print(time.strftime("%H:%M:%S") + " compiled " + str(compiled) + " of " + str(len(targets)) + " changed files, "
+                  + str(errors) + " failed", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+def main():
+
+    # Initialize environment
+    args = parseArgs(sys.argv[1:])
+    if len(args.paths) == 0:
+        sys.exit("ERROR: No Jack file specified")
+
+    # Get jack files, every project found goes into the same work queue
+    jackFiles = findJackFiles(args.paths)
+    if len(jackFiles) == 0 and not args.watch:
+        sys.exit("ERROR: No Jack files found in " + ", ".join(args.paths))
+
+    if args.profile_output is not None:
+        args.profile = True
+    if args.stream and (args.xml or args.whole_program or args.ast):
+        sys.exit("ERROR: --stream can't be combined with --xml, --whole-program or --ast, they need every token, class or tree at once")
+    options = compileOptions(args)
+
+    caches = {}
+    errors, compiled = build(args, options, jackFiles, caches)
+    if args.watch:
+        watch(args, options, caches)
+    elif errors > 0:
+        sys.exit("ERROR: " + str(errors) + " of " + str(compiled) + " files failed to compile")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import os, sys, random, argparse
+
+# Deterministic generator of valid Jack programs for benchmarking the compiler.
+# The same settings always give the same program. Every class C<i> has a constructor, a method
+# and a number of functions with arithmetic, arrays, strings, ifs, whiles and calls to other
+# classes; Main.main calls into C0.
+#   python3 JackGenerator.py outDir --classes 100 --depth 8 --string-length 200 --comments 3
+
+# Settings of a corpus, see parseArgs for what they mean
+DEFAULT_SETTINGS = {
+    "classes": 10,
+    "functions": 4,
+    "statements": 12,
+    "depth": 3,
+    "stringLength": 20,
+    "comments": 0,
+    "seed": 1
+}
+
+VARIABLES = ["a", "b", "x", "y"]
+OPERATORS = ["+", "-", "*", "/", "&", "|", "<", ">", "="]
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "jack", "hack", "nand", "tetris", "stack", "heap", "frame"]
+
+class JackGenerator:
+    # settings: dict with the keys of DEFAULT_SETTINGS, missing keys use the defaults
+    def __init__(self, settings=None):
+        self.settings = dict(DEFAULT_SETTINGS)
+        if settings is not None:
+            self.settings.update(settings)
+
+    # Words of filler text, used for comments and string literals
+    def __text(self, rng, length):
+        words = []
+        size = 0
+        while size < length:
+            word = rng.choice(WORDS)
+            words.append(word)
+            size += len(word) + 1
+        return " ".join(words)[:length]
+
+    def __comment(self, rng, indent):
+        lines = []
+        for x in range(self.settings["comments"]):
+            if rng.random() < 0.5:
+                lines.append(indent + "// " + self.__text(rng, 60))
+            else:
+                lines.append(indent + "/* " + self.__text(rng, 60) + " * " + self.__text(rng, 40) + " */")
+        return lines
+
+    def __leaf(self, rng):
+        choice = rng.random()
+        if choice < 0.4:
+            return rng.choice(VARIABLES)
+        elif choice < 0.8:
+            return str(rng.randint(0, 32767))
+        elif choice < 0.9:
+            return "arr[" + str(rng.randint(0, 7)) + "]"
+        else:
+            return rng.choice(["true", "false"])
+
+    # An expression nested depth levels deep. One side of every operator is kept small,
+    # so the size grows linearly with depth
+    def expression(self, rng, depth):
+        if depth <= 0:
+            return self.__leaf(rng)
+        choice = rng.random()
+        inner = self.expression(rng, depth - 1)
+        if choice < 0.15:
+            return rng.choice(["-", "~"]) + "(" + inner + ")"
+        side = self.expression(rng, min(depth - 1, 1))
+        operator = rng.choice(OPERATORS)
+        if rng.random() < 0.5:
+            return "(" + inner + " " + operator + " " + side + ")"
+        return "(" + side + " " + operator + " " + inner + ")"
+
+    def __statements(self, rng, classIdx, count, indent, nesting):
+        settings = self.settings
+        lines = []
+        for x in range(count):
+            lines.extend(self.__comment(rng, indent))
+            choice = rng.random()
+            if choice < 0.35:
+                lines.append(indent + "let " + rng.choice(VARIABLES[2:]) + " = " + self.expression(rng, settings["depth"]) + ";")
+            elif choice < 0.45:
+                lines.append(indent + "let arr[" + self.expression(rng, 1) + " & 7] = " + self.expression(rng, settings["depth"]) + ";")
+            elif choice < 0.55:
+                lines.append(indent + "let s = \"" + self.__text(rng, settings["stringLength"]) + "\";")
+                lines.append(indent + "do s.dispose();")
+            elif choice < 0.7 and nesting < 2:
+                lines.append(indent + "if (" + self.expression(rng, settings["depth"]) + ") {")
+                lines.extend(self.__statements(rng, classIdx, 2, indent + "    ", nesting + 1))
+                lines.append(indent + "} else {")
+                lines.extend(self.__statements(rng, classIdx, 2, indent + "    ", nesting + 1))
+                lines.append(indent + "}")
+            elif choice < 0.8 and nesting < 2:
+                lines.append(indent + "let x = " + str(rng.randint(0, 20)) + ";")
+                lines.append(indent + "while (x > 0) {")
+                lines.extend(self.__statements(rng, classIdx, 2, indent + "    ", nesting + 1))
+                lines.append(indent + "let x = x - 1;")
+                lines.append(indent + "}")
+            elif choice < 0.9:
+                # call a function of a later class, so the call graph has no cycles
+                target = rng.randint(classIdx + 1, settings["classes"]) if classIdx + 1 < settings["classes"] else None
+                if target is None or target >= settings["classes"]:
+                    lines.append(indent + "let y = Math.max(x, " + self.expression(rng, 1) + ");")
+                else:
+                    lines.append(indent + "let y = C" + str(target) + ".f" + str(rng.randint(0, settings["functions"] - 1)) + "(x, y);")
+            else:
+                lines.append(indent + "do obj.set(" + self.expression(rng, 2) + ");")
+                lines.append(indent + "let y = obj.get();")
+        return lines
+
+    # Source code of class C<classIdx>
+    def classSource(self, classIdx):
+        settings = self.settings
+        rng = random.Random(settings["seed"] * 1000003 + classIdx)
+        name = "C" + str(classIdx)
+        lines = []
+        lines.extend(self.__comment(rng, ""))
+        lines.append("class " + name + " {")
+        lines.append("    field int value, count;")
+        lines.append("    static int instances;")
+        lines.append("")
+        lines.append("    constructor " + name + " new(int start) {")
+        lines.append("        let value = start;")
+        lines.append("        let count = 0;")
+        lines.append("        let instances = instances + 1;")
+        lines.append("        return this;")
+        lines.append("    }")
+        lines.append("")
+        lines.append("    method int get() {")
+        lines.append("        let count = count + 1;")
+        lines.append("        return value;")
+        lines.append("    }")
+        lines.append("")
+        lines.append("    method void set(int newValue) {")
+        lines.append("        let value = newValue;")
+        lines.append("        return;")
+        lines.append("    }")
+        lines.append("")
+        lines.append("    method void dispose() {")
+        lines.append("        do Memory.deAlloc(this);")
+        lines.append("        return;")
+        lines.append("    }")
+        for functionIdx in range(settings["functions"]):
+            lines.append("")
+            lines.extend(self.__comment(rng, "    "))
+            lines.append("    function int f" + str(functionIdx) + "(int a, int b) {")
+            lines.append("        var int x, y;")
+            lines.append("        var Array arr;")
+            lines.append("        var String s;")
+            lines.append("        var " + name + " obj;")
+            lines.append("        let x = a;")
+            lines.append("        let y = b;")
+            lines.append("        let arr = Array.new(8);")
+            lines.append("        let obj = " + name + ".new(a);")
+            lines.extend(self.__statements(rng, classIdx, settings["statements"], "        ", 0))
+            lines.append("        do arr.dispose();")
+            lines.append("        do obj.dispose();")
+            lines.append("        return x + y;")
+            lines.append("    }")
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+    def mainSource(self):
+        return "\n".join([
+            "class Main {",
+            "    function void main() {",
+            "        do Output.printInt(C0.f0(1, 2));",
+            "        return;",
+            "    }",
+            "}"
+        ]) + "\n"
+
+    # Yields (fileName, source) for every class of the program, Main first
+    def files(self):
+        yield ("Main.jack", self.mainSource())
+        for classIdx in range(self.settings["classes"]):
+            yield ("C" + str(classIdx) + ".jack", self.classSource(classIdx))
+
+    # Writes the program into directory, returns the paths written
+    def write(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for fileName, source in self.files():
+            path = os.path.join(directory, fileName)
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(source)
+            paths.append(path)
+        return paths
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description="Generates a deterministic Jack program for benchmarks")
+    parser.add_argument("directory", help="directory to write the .jack files to")
+    parser.add_argument("--classes", type=int, default=DEFAULT_SETTINGS["classes"], help="number of classes besides Main")
+    parser.add_argument("--functions", type=int, default=DEFAULT_SETTINGS["functions"], help="functions per class")
+    parser.add_argument("--statements", type=int, default=DEFAULT_SETTINGS["statements"], help="top level statements per function")
+    parser.add_argument("--depth", type=int, default=DEFAULT_SETTINGS["depth"], help="nesting depth of expressions")
+    parser.add_argument("--string-length", type=int, default=DEFAULT_SETTINGS["stringLength"], help="length of string literals")
+    parser.add_argument("--comments", type=int, default=DEFAULT_SETTINGS["comments"], help="comment lines before every statement and declaration")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SETTINGS["seed"], help="random seed")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parseArgs(sys.argv[1:])
+    generator = JackGenerator({
+        "classes": args.classes, "functions": args.functions, "statements": args.statements, "depth": args.depth,
+        "stringLength": args.string_length, "comments": args.comments, "seed": args.seed
+    })
+    paths = generator.write(args.directory)
+    print("wrote " + str(len(paths)) + " files to " + args.directory)
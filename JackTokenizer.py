@@ -1,15 +1,50 @@
-import os, sys, re
+import sys, re
+
+# Token kinds
+KEYWORD = 0
+SYMBOL = 1
+IDENTIFIER = 2
+INT_CONST = 3
+STRING_CONST = 4
+EOF = 5
+
+# Tag used for each token kind in *T.xml files
+TAG_NAMES = ("keyword", "symbol", "identifier", "integerConstant", "stringConstant", "eof")
+
+# One token. Tokens are never modified once made, so the tokenizer hands out one shared
+# record per distinct (kind, text) and its text is interned
+class Token:
+    __slots__ = ("kind", "text")
+
+    def __init__(self, kind, text):
+        self.kind = kind
+        self.text = text
+
+    def __repr__(self):
+        return "Token(" + TAG_NAMES[self.kind] + ", " + repr(self.text) + ")"
+
+EOF_TOKEN = Token(EOF, "")
 
 class JackTokenizer:
-    def __init__(self, file):
+    # Whitespace and comments, skipped in one match between tokens
+    __skipRegex = re.compile(r'(?:\s+|//[^\n]*|/\*.*?(?:\*/|\Z))*', re.DOTALL)
+    # Master token regex, the matching group name gives the token type
+    __tokenRegex = re.compile(r'(?P<INT_CONST>[0-9]+)'
+                              r'|"(?P<STRING_CONST>[^"\n]*)(?:"|\n|\Z)'
+                              r'|(?P<WORD>[A-Za-z_][0-9A-Za-z_]*)'
+                              r'|(?P<SYMBOL>[{}()\[\].,;+\-*/&|<>=~])')
+
+    # file: open text file containing the jack source. By default the whole source is read into
+    # memory and scanned by index, the file is not touched again after construction.
+    # chunkSize: read the file this many characters at a time instead, so only the unscanned
+    # rest of the current chunk (and any token or comment longer than it) is held in memory
+    def __init__(self, file, chunkSize=None):
         self.file = file
+        self.__chunkSize = chunkSize
+        self.__source = file.read() if chunkSize is None else ""
+        self.__atEndOfFile = chunkSize is None
+        self.__pos = 0
         self.__keywords = set(["class","constructor","function","method","field","static","var","int","char","boolean","void","true","false","null","this","let","do","if","else","while","return"])
-        self.__symbols = set(["{","}","(",")","[","]",".",",",";","+","-","*","/","&","|","<",">","=","~"])
-        self.__integerRegex = re.compile('[0-9]')
-        self.__identifierRegex = re.compile('[0-9A-Za-z_]')
-        self.__keywordRegex = re.compile('[a-z]')
-        self.__firstChar = ""
-        self.__restChars = ""
 
         self.__symbol = None
         self.__stringVal = None
@@ -17,12 +52,25 @@ class JackTokenizer:
         self.__keyword = None
         self.__identifier = None
         self.__tokenType = ""
+        self.__token = None
+        self.__tokenRecords = {}
+        self.__tokenCount = 0
 
         self.__hasMoreTokens = True
 
+    # Shared Token record for kind and text. String constants rarely repeat, they get their own record
+    def __record(self, kind, text):
+        if kind == STRING_CONST:
+            return Token(kind, text)
+        key = (kind, text)
+        token = self.__tokenRecords.get(key)
+        if token is None:
+            token = Token(kind, sys.intern(text))
+            self.__tokenRecords[key] = token
+        return token
+
     def __resetState(self):
-        self.__firstChar = ""
-        self.__restChars = ""
+        self.__token = None
         self.__symbol = None
         self.__stringVal = None
         self.__intVal = None
@@ -30,191 +78,113 @@ class JackTokenizer:
         self.__identifier = None
         self.__tokenType = ""
 
-    def __isSymbol(self):
-        if self.__firstChar in self.__symbols:
-            return True
-
-    def __isStringConstant(self):
-        if self.__firstChar == "\"":
-            return True
-        
-    def __isIntConstant(self):
-        return self.__integerRegex.match(self.__firstChar)
-    
-    def __isKeyword(self):
-        keywordFound = False
-        keyword = self.__firstChar + self.__restChars
-
-        # 11 is length of longest keyword
-        while len(keyword) < 12:
-            next = self.file.read(1)
-            if self.__keywordRegex.match(next):
-                self.__restChars = self.__restChars + next
-                keyword = keyword + next
-                if keyword in self.__keywords:
-                    nextNext = self.file.read(1)
-                    if not self.__identifierRegex.match(nextNext):
-                        self.file.seek(self.file.tell() - 1,0)
-                        keywordFound = True
-                        break
-                    self.file.seek(self.file.tell() - 1,0)
-                        
-            else:
-                self.file.seek(self.file.tell() - 1,0)
-                break
-
-        return keywordFound
+    def hasMoreTokens(self):
+        return self.__hasMoreTokens
 
-    def __isIdentifier(self):
-        if self.__integerRegex.match(self.__firstChar):
+    # Reads the next chunk of the file, dropping the part of the buffer already scanned
+    # Returns False at the end of the file
+    def __readChunk(self):
+        chunk = self.file.read(self.__chunkSize)
+        if not chunk:
+            self.__atEndOfFile = True
             return False
-        elif self.__identifierRegex.match(self.__firstChar): # Will return true only for [a-zA-Z_]
-            return True
+        self.__source = self.__source[self.__pos:] + chunk
+        self.__pos = 0
+        return True
+
+    # Matches regex at the current position. A match that reaches the end of the buffer
+    # (or the character before it, e.g. a '/' that may start a comment) may continue in the
+    # part of the file not read yet, so it is retried after reading more
+    def __match(self, regex):
+        while True:
+            match = regex.match(self.__source, self.__pos)
+            end = self.__pos if match is None else match.end()
+            if self.__atEndOfFile or end + 1 < len(self.__source) or not self.__readChunk():
+                return match
 
-
-    def __getStringFromFile(self):
-        stringLiteral = ""
-        for char in self.__restChars:
-            if char == "\"" or char == os.linesep:
-                return stringLiteral
-            else:
-                stringLiteral = stringLiteral + char
-        
-        next = self.file.read(1)
-        self.__restChars = self.__restChars + next
-        while next != "\"" and next != os.linesep:
-            stringLiteral = stringLiteral + next
-            next = self.file.read(1)
-            self.__restChars = self.__restChars + next
-
-        return stringLiteral
-
-    def __getIntFromFile(self):
-        numberLiteral = self.__firstChar
-        for char in self.__restChars:
-            if not self.__integerRegex.match(char):
-                return int(numberLiteral)
-            else:
-                numberLiteral = numberLiteral + char
-
-        next = self.file.read(1)
-        while self.__integerRegex.match(next):
-            numberLiteral = numberLiteral + next
-            next = self.file.read(1)
-            self.__restChars = self.__restChars + next
-
-        if int(numberLiteral) > 32767:
-            sys.exit("ERROR: " + numberLiteral + " outside bounds of acceptable integer values.")
+    def advance(self):
+        self.__resetState()
+        if self.__atEndOfFile:
+            # everything is in the buffer, no need to check for matches cut off by its end
+            source = self.__source
+            pos = self.__skipRegex.match(source, self.__pos).end()
+            match = self.__tokenRegex.match(source, pos) if pos < len(source) else None
         else:
-            self.file.seek(self.file.tell() - 1,0)
-            return int(numberLiteral)
-        
-    def __getIdentifierFromFile(self):
-        identifier = self.__firstChar + self.__restChars
-        
-        next = self.file.read(1)
-        while self.__identifierRegex.match(next):
-            identifier = identifier + next
-            self.__restChars = self.__restChars + next
-            next = self.file.read(1)
-        self.file.seek(self.file.tell() - 1,0) # Go back one
-        return identifier
-
-
-    def __setCurrentToken(self):
-        self.__tokenType = ""
-        if self.__isSymbol():
-            self.__symbol = self.__firstChar
-            self.__tokenType = "SYMBOL"
-        elif self.__isStringConstant():
-            self.__stringVal = self.__getStringFromFile()
-            self.__tokenType = "STRING_CONST"
-        elif self.__isIntConstant():
-            self.__intVal = self.__getIntFromFile()
-            self.__tokenType = "INT_CONST"
-        elif self.__isKeyword():
-            self.__keyword = self.__firstChar + self.__restChars
-            self.__tokenType = "KEYWORD"
-        elif self.__isIdentifier():
-            self.__identifier = self.__getIdentifierFromFile()
-            self.__tokenType = "IDENTIFIER"
-        elif self.__firstChar == "":
+            self.__pos = self.__match(self.__skipRegex).end()
+            match = self.__match(self.__tokenRegex) if self.__pos < len(self.__source) else None
+            # reading more moves the buffer
+            source = self.__source
+            pos = self.__pos
+
+        if pos >= len(source):
+            self.__pos = pos
             self.__tokenType = "EOF"
+            self.__token = EOF_TOKEN
             self.__hasMoreTokens = False
-        else:
+            return
+
+        if match is None:
             self.__tokenType = "UNKNOWN"
-            sys.exit("ERROR: Unknown token type: " + self.__firstChar + self.__restChars)
-
-    def __isComment(self):
-        if self.__firstChar == "/":
-            if len(self.__restChars) == 0:
-                self.__restChars = self.file.read(1)
-            
-            if self.__restChars[0] == "/":
-                return True
-            elif self.__restChars[0] == "*":
-                return True
+            sys.exit("ERROR: Unknown token type: " + source[pos])
+        self.__pos = match.end()
+        self.__tokenCount += 1
+
+        kind = match.lastgroup
+        if kind == "SYMBOL":
+            self.__token = self.__record(SYMBOL, match.group(kind))
+            self.__symbol = self.__token.text
+            self.__tokenType = "SYMBOL"
+        elif kind == "WORD":
+            word = match.group(kind)
+            if word in self.__keywords:
+                self.__token = self.__record(KEYWORD, word)
+                self.__keyword = self.__token.text
+                self.__tokenType = "KEYWORD"
             else:
-                return False
-        else:
-            return False
-        
-    def __seekPastComment(self):
-        commentBeginning = self.__firstChar + self.__restChars
-        if commentBeginning == "//":
-            next = self.file.read(1)
-            while next != os.linesep:
-                next = self.file.read(1)
-            self.file.seek(self.file.tell() - 1,0)
+                self.__token = self.__record(IDENTIFIER, word)
+                self.__identifier = self.__token.text
+                self.__tokenType = "IDENTIFIER"
+        elif kind == "INT_CONST":
+            numberLiteral = match.group(kind)
+            if int(numberLiteral) > 32767:
+                sys.exit("ERROR: " + numberLiteral + " outside bounds of acceptable integer values.")
+            self.__intVal = int(numberLiteral)
+            self.__token = self.__record(INT_CONST, str(self.__intVal))
+            self.__tokenType = "INT_CONST"
         else:
-            nextOne = self.file.read(1)
-            nextTwo = self.file.read(1)
-            endComment = False
-            while not endComment:
-                if nextOne == "*" and nextTwo == "/":
-                    endComment = True
-                if nextOne == "":
-                    endComment = True # EOF condition
-                else:
-                    nextOne = nextTwo
-                    nextTwo = self.file.read(1)
-        
-
-    def hasMoreTokens(self):
-        return self.__hasMoreTokens
-
-    def advance(self):
-        self.__resetState()
-        self.__firstChar = self.file.read(1)
-
-        if self.__firstChar == "":
-            self.__hasMoreTokens = False
-
-        if self.__isComment():
-            self.__seekPastComment()
-            return self.advance()
-  
-        if self.__firstChar.isspace():
-            return self.advance()
+            self.__token = self.__record(STRING_CONST, match.group(kind))
+            self.__stringVal = self.__token.text
+            self.__tokenType = "STRING_CONST"
 
-        self.__setCurrentToken()
+    # Yields the remaining tokens as Token records, in source order, without EOF
+    def tokens(self):
+        while self.__hasMoreTokens:
+            self.advance()
+            if self.__hasMoreTokens:
+                yield self.__token
 
+    # Number of tokens produced so far (not counting EOF)
+    def tokenCount(self):
+        return self.__tokenCount
 
+    # The current token as a Token record
+    def token(self):
+        return self.__token
 
     def tokenType(self):
         return self.__tokenType
-    
+
     def keyword(self):
         return self.__keyword
-    
+
     def symbol(self):
         return self.__symbol
-    
+
     def identifier(self):
         return self.__identifier
-    
+
     def intVal(self):
         return self.__intVal
-    
+
     def stringVal(self):
-        return self.__stringVal
\ No newline at end of file
+        return self.__stringVal
@@ -0,0 +1,182 @@
+import sys, os, tempfile, argparse
+import VMInterpreter
+
+# Regression check for the optimizations that change what a program does at run time if they
+# are wrong (dead stores, inlining, branch layout, array and string code). Every program is compiled in memory
+# without and with each option set and run by VMInterpreter.compare, which fails when the two
+# builds print or draw something different or stop differently. The small programs below also
+# have to print what they print without options.
+#   python3 OptimizerCheck.py
+#   python3 OptimizerCheck.py --project test_jack_files/Project11
+
+OPTION_SETS = [
+    {"optimize": True},
+    {"optimize": True, "ast": True},
+    {"optimize": True, "poolStrings": True, "wholeProgram": True}
+]
+
+# Keyboard input of the Project11 programs that read some, as text and key codes
+PROJECT_INPUT = {
+    "Average": ("3\n10\n20\n30\n", []),
+    "Square": ("", [81]),
+    "Pong": ("", [0, 130, 0, 131, 0, 140])
+}
+
+# name -> ({className: Jack source}, expected output)
+CASES = {
+    # The first stores to x are overwritten before any read in the constructor, except through
+    # the method call in between, which has to see 7
+    "constructor field overwrite": ({
+        "Main": """
+class Main {
+    function void main() {
+        var Point p;
+        let p = Point.new(3, 4);
+        do Output.printInt(p.sum());
+        do Output.println();
+        return;
+    }
+}""",
+        "Point": """
+class Point {
+    field int x, y;
+    constructor Point new(int a, int b) {
+        let x = 1;
+        let x = 7;
+        let y = getX();
+        let x = a;
+        let y = y + b;
+        return this;
+    }
+    method int getX() { return x; }
+    method int sum() { return x + y; }
+}"""}, "14\n"),
+    # t is dead at the end of each iteration but s and i are read by the next one, k is only
+    # read after the loop and last is overwritten on every iteration
+    "dead stores in loops": ({
+        "Main": """
+class Main {
+    function void main() {
+        var int i, s, t, k, last;
+        let i = 0;
+        let s = 0;
+        while (i < 5) {
+            let t = i * 3;
+            let s = s + t;
+            let t = 0;
+            let last = i;
+            let last = last + 100;
+            if (i = 2) { let k = s; }
+            let i = i + 1;
+        }
+        do Output.printInt(s);
+        do Output.printChar(32);
+        do Output.printInt(k);
+        do Output.printChar(32);
+        do Output.printInt(last);
+        do Output.println();
+        return;
+    }
+}"""}, "30 9 104\n"),
+    # Stores to statics before a call are read by the callee, stores before a return by the caller
+    "statics read by callees": ({
+        "Main": """
+class Main {
+    static int count;
+    function void main() {
+        let count = 10;
+        do Main.bump();
+        let count = count + 5;
+        do Main.show();
+        do Counter.set(40);
+        let count = 1;
+        do Counter.show();
+        do Output.printInt(count);
+        do Output.println();
+        return;
+    }
+    function void bump() { let count = count + 1; return; }
+    function void show() { do Output.printInt(count); do Output.printChar(32); return; }
+}""",
+        "Counter": """
+class Counter {
+    static int value;
+    function void set(int v) { let value = 0; let value = v; let value = value + 2; return; }
+    function void show() { do Output.printInt(value); do Output.printChar(32); return; }
+}"""}, "16 42 1\n"),
+    # Conditions that aren't 0 or -1: the plain code runs a block only when its condition is
+    # exactly -1, so 3 and x & 1 count as false
+    "non-boolean conditions": ({
+        "Main": """
+class Main {
+    function void main() {
+        var int x, y;
+        let x = 3;
+        if (x & 1) { do Output.printInt(1); } else { do Output.printInt(2); }
+        if (x) { } else { do Output.printInt(4); }
+        while (x & 1) { let x = x - 1; }
+        do Output.printInt(x);
+        let y = -1;
+        while (y) { let y = y + 1; let x = x + 1; }
+        do Output.printInt(x);
+        do Output.println();
+        return;
+    }
+}"""}, "2434\n")
+}
+
+# Writes a case's classes to .jack files in directory
+def writeCase(directory, classes):
+    for className, source in classes.items():
+        with open(os.path.join(directory, className + ".jack"), "w", encoding="utf-8") as file:
+            file.write(source)
+
+# Checks one program directory with every option set
+# expected: output of the plain build, None to skip that check
+# Returns the number of failed checks
+def checkProgram(directory, input, maxSteps, expected=None):
+    failed = 0
+    if expected is not None:
+        plain, screen = VMInterpreter.runProgram(VMInterpreter.compileProgram(directory, {}), input, maxSteps)
+        if plain["output"] != expected:
+            print(directory + ": expected output " + repr(expected) + ", got " + repr(plain["output"]))
+            failed += 1
+    for options in OPTION_SETS:
+        print("options: " + ", ".join(sorted(options)))
+        if not VMInterpreter.compare(directory, options, input, maxSteps, False, 0):
+            failed += 1
+    return failed
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description="Checks that optimized builds of the Project11 programs and of small test programs behave like plain builds")
+    parser.add_argument("--project", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_jack_files", "Project11"),
+                        help="directory of program directories (default: test_jack_files/Project11)")
+    parser.add_argument("--max-steps", type=int, default=2000000, help="VM instructions run per program and build (default: 2000000)")
+    return parser.parse_args(argv)
+
+def main():
+    args = parseArgs(sys.argv[1:])
+    if not os.path.isdir(args.project):
+        sys.exit("ERROR: " + args.project + " is not a directory")
+    failed = 0
+    checks = 0
+    for name in sorted(os.listdir(args.project)):
+        directory = os.path.join(args.project, name)
+        if not os.path.isdir(directory):
+            continue
+        text, keys = PROJECT_INPUT.get(name, ("", []))
+        failed += checkProgram(directory, VMInterpreter.keyCodes(text) + keys, args.max_steps)
+        checks += len(OPTION_SETS)
+    for name, (classes, expected) in CASES.items():
+        with tempfile.TemporaryDirectory() as root:
+            directory = os.path.join(root, name.replace(" ", "-"))
+            os.mkdir(directory)
+            writeCase(directory, classes)
+            failed += checkProgram(directory, [], args.max_steps, expected)
+            checks += len(OPTION_SETS) + 1
+    if failed > 0:
+        sys.exit("ERROR: " + str(failed) + " of " + str(checks) + " checks failed")
+    print("all " + str(checks) + " checks passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import sys, os, io, time, tempfile, tracemalloc, argparse
+import JackCompiler, JackAPI, CompilationEngine, JackTokenizer
+
+# Measures the parser/code generator (CompilationEngine) on a large single class, scaled per 100k tokens.
+# The class is one of the test programs with its subroutines repeated until it has enough tokens.
+# --check-stream also checks the memory guarantee of --stream: the peak memory of streaming a
+# class must not grow with its size, it is measured at N and 4N tokens.
+#   python3 ParserBenchmark.py [--tokens N] [--source file.jack] [--check-stream]
+
+DEFAULT_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_jack_files", "Project11", "Pong", "Ball.jack")
+
+# Builds a class with the subroutines of source repeated until it has at least minTokens tokens
+def buildSource(sourcePath, minTokens):
+    with open(sourcePath, "r", encoding="utf-8") as file:
+        text = file.read()
+    bodyStart = text.index("{") + 1
+    bodyEnd = text.rindex("}")
+    body = text[bodyStart:bodyEnd]
+    # the class variable declarations may only appear once, repeat from the first subroutine on
+    firstSubroutine = min(body.find(keyword) for keyword in ("constructor", "function", "method") if body.find(keyword) >= 0)
+    declarations = body[:firstSubroutine]
+    subroutines = body[firstSubroutine:]
+
+    tokensPerCopy = len(JackCompiler.tokenize(io.StringIO(subroutines)))
+    copies = max(1, -(-minTokens // tokensPerCopy))
+    return text[:bodyStart] + declarations + subroutines * copies + "}"
+
+def run(minTokens, sourcePath):
+    source = buildSource(sourcePath, minTokens)
+    tokens = JackCompiler.tokenize(io.StringIO(source))
+    scale = 100000 / len(tokens)
+
+    # memory held by the token list itself
+    tracemalloc.start()
+    tokens = JackCompiler.tokenize(io.StringIO(source))
+    tokenMemory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # time and peak memory of parsing and code generation (nothing is written)
+    start = time.perf_counter()
+    engine = CompilationEngine.CompilationEngine(tokens, os.devnull, "<benchmark>")
+    engine.compileClass(writeOutput=False)
+    parseTime = time.perf_counter() - start
+
+    tracemalloc.start()
+    engine = CompilationEngine.CompilationEngine(tokens, os.devnull, "<benchmark>")
+    engine.compileClass(writeOutput=False)
+    parsePeak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print("tokens:                  " + str(len(tokens)))
+    print("token list KiB/100k:     " + format(tokenMemory * scale / 1024, ".1f"))
+    print("parse ms/100k:           " + format(parseTime * scale * 1000, ".1f"))
+    print("parse peak KiB/100k:     " + format(parsePeak * scale / 1024, ".1f"))
+
+# Peak memory (bytes) of compiling source with --stream, from reading the file to closing the output
+def streamPeak(source):
+    directory = tempfile.mkdtemp(prefix="jackstream-")
+    sourcePath = os.path.join(directory, "Ball.jack")
+    try:
+        with open(sourcePath, "w", encoding="utf-8") as file:
+            file.write(source)
+        del source
+        options = {"optimize": False, "poolStrings": False, "stream": True}
+        tracemalloc.start()
+        with open(sourcePath, "r", encoding="utf-8") as file:
+            tokenizer = JackTokenizer.JackTokenizer(file, JackCompiler.STREAM_CHUNK_SIZE)
+            engine = JackAPI.compileTokens(tokenizer.tokens(), JackCompiler.vmPathFor(sourcePath), sourcePath, options)
+            engine.vmWriter.close()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+    finally:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+# Streams classes of minTokens and 4 * minTokens tokens
+# Returns False if the larger one needed noticeably more memory
+def checkStream(minTokens, sourcePath):
+    small = streamPeak(buildSource(sourcePath, minTokens))
+    large = streamPeak(buildSource(sourcePath, 4 * minTokens))
+    print("stream peak KiB (N):     " + format(small / 1024, ".1f"))
+    print("stream peak KiB (4N):    " + format(large / 1024, ".1f"))
+    return large <= small * 1.25
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks CompilationEngine per 100k tokens")
+    parser.add_argument("--tokens", type=int, default=100000, help="minimum number of tokens to parse (default: 100000)")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="jack class whose subroutines are repeated")
+    parser.add_argument("--check-stream", action="store_true", help="fail if the memory used by --stream grows with the size of the class")
+    args = parser.parse_args()
+    run(args.tokens, args.source)
+    if args.check_stream and not checkStream(args.tokens, args.source):
+        sys.exit("ERROR: --stream peak memory grows with the size of the source")
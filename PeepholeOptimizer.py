@@ -0,0 +1,242 @@
+from VMWriter import Op, Segment, Instruction, toWord, constantInstructions
+import DeadStores
+
+# Peephole rules
+# Every rule is called as rule(code, i, jumps) on a function's instruction list and either returns
+# None (no match at i) or (length, replacement): the instructions code[i:i+length] are replaced by
+# the list replacement, which must behave the same and be no longer. jumps is the function's
+# JumpIndex, kept up to date by the optimizer, for rules that look at labels and jumps elsewhere
+# in the function.
+
+BINARY_FOLDS = {
+    Op.ADD: lambda a, b: a + b,
+    Op.SUB: lambda a, b: a - b,
+    Op.AND: lambda a, b: a & b,
+    Op.OR: lambda a, b: a | b,
+    Op.EQ: lambda a, b: -1 if a == b else 0,
+    Op.GT: lambda a, b: -1 if a > b else 0,
+    Op.LT: lambda a, b: -1 if a < b else 0
+}
+
+UNARY_FOLDS = {
+    Op.NEG: lambda a: -a,
+    Op.NOT: lambda a: ~a
+}
+
+# Recognizes a constant operand at code[i]: 'push constant c' or 'push constant c; neg'
+# Returns (value, length) or None
+def constantAt(code, i):
+    if i >= len(code) or code[i].op != Op.PUSH or code[i].arg1 != Segment.CONSTANT:
+        return None
+    if i + 1 < len(code) and code[i + 1].op == Op.NEG:
+        return (-code[i].arg2, 2)
+    return (code[i].arg2, 1)
+
+# push S i; pop S i => nothing
+def pushPop(code, i, jumps):
+    if i + 1 < len(code) and code[i].op == Op.PUSH and code[i + 1].op == Op.POP:
+        if code[i].arg1 == code[i + 1].arg1 and code[i].arg2 == code[i + 1].arg2:
+            return (2, [])
+    return None
+
+# not; not => nothing, neg; neg => nothing
+def doubleUnary(code, i, jumps):
+    if i + 1 < len(code) and code[i].op in UNARY_FOLDS and code[i + 1].op == code[i].op:
+        return (2, [])
+    return None
+
+# Arithmetic on constant operands => the resulting constant, e.g. push constant 1; neg; not => push constant 0
+def constantFold(code, i, jumps):
+    first = constantAt(code, i)
+    if first is None:
+        return None
+    value, length = first
+    end = i + length
+    if end < len(code) and code[end].op in UNARY_FOLDS:
+        result = toWord(UNARY_FOLDS[code[end].op](value))
+        length += 1
+    else:
+        second = constantAt(code, end)
+        if second is None:
+            return None
+        end += second[1]
+        if end >= len(code) or code[end].op not in BINARY_FOLDS:
+            return None
+        result = toWord(BINARY_FOLDS[code[end].op](value, second[0]))
+        length += second[1] + 1
+    replacement = constantInstructions(result)
+    if replacement is None or len(replacement) >= length:
+        return None
+    return (length, replacement)
+
+# constant; if-goto L => goto L when the constant is true, nothing when it is false
+def constantBranch(code, i, jumps):
+    constant = constantAt(code, i)
+    if constant is None:
+        return None
+    value, length = constant
+    if i + length < len(code) and code[i + length].op == Op.IF_GOTO:
+        if value == 0:
+            return (length + 1, [])
+        return (length + 1, [Instruction(Op.GOTO, code[i + length].arg1, None)])
+    return None
+
+# push constant 0; eq; not; if-goto L => if-goto L, as (x = 0) is false exactly when x is non-zero
+def zeroTestBranch(code, i, jumps):
+    if i + 3 < len(code) and code[i] == Instruction(Op.PUSH, Segment.CONSTANT, 0) and code[i + 1].op == Op.EQ \
+            and code[i + 2].op == Op.NOT and code[i + 3].op == Op.IF_GOTO:
+        return (4, [code[i + 3]])
+    return None
+
+# goto L; label L => label L
+def gotoNextLabel(code, i, jumps):
+    if i + 1 < len(code) and code[i].op == Op.GOTO and code[i + 1].op == Op.LABEL and code[i].arg1 == code[i + 1].arg1:
+        return (2, [code[i + 1]])
+    return None
+
+# Instructions after a goto or return are unreachable until the next label
+def unreachable(code, i, jumps):
+    if code[i].op != Op.GOTO and code[i].op != Op.RETURN:
+        return None
+    end = i + 1
+    while end < len(code) and code[end].op != Op.LABEL and code[end].op != Op.FUNCTION:
+        end += 1
+    if end == i + 1:
+        return None
+    return (end - i, [code[i]])
+
+# push X; pop temp n => nothing, when temp n is popped again (or the function returns)
+# before anything reads it. Only straight-line code is followed.
+def deadTempStore(code, i, jumps):
+    if i + 1 >= len(code) or code[i].op != Op.PUSH or code[i + 1].op != Op.POP or code[i + 1].arg1 != Segment.TEMP:
+        return None
+    temp = code[i + 1].arg2
+    for instruction in code[i + 2:]:
+        if instruction.arg1 == Segment.TEMP and instruction.arg2 == temp:
+            if instruction.op == Op.POP:
+                return (2, [])
+            return None
+        if instruction.op == Op.RETURN:
+            return (2, [])
+        if instruction.op in (Op.LABEL, Op.GOTO, Op.IF_GOTO, Op.CALL, Op.FUNCTION):
+            return None
+    return None
+
+# goto L / if-goto L => goto M / if-goto M, when label L (and any labels after it) is followed by goto M
+def jumpThreading(code, i, jumps):
+    if code[i].op != Op.GOTO and code[i].op != Op.IF_GOTO:
+        return None
+    target = code[i].arg1
+    seen = set([target])
+    while target in jumps.labels:
+        end = jumps.labels[target] + 1
+        while end < len(code) and code[end].op == Op.LABEL:
+            end += 1
+        if end >= len(code) or code[end].op != Op.GOTO or code[end].arg1 in seen:
+            break
+        target = code[end].arg1
+        seen.add(target)
+    if target == code[i].arg1:
+        return None
+    return (1, [Instruction(code[i].op, target, None)])
+
+# label L => nothing, when no goto or if-goto jumps to L
+def unusedLabel(code, i, jumps):
+    if code[i].op != Op.LABEL:
+        return None
+    if jumps.references.get(code[i].arg1, 0) > 0:
+        return None
+    return (1, [])
+
+# Where the labels of a function are and how many gotos and if-gotos jump to each of them.
+# Built once per optimizeFunction and updated on every replacement, so rules don't rescan the
+# function
+class JumpIndex:
+    def __init__(self, code):
+        self.labels = {} # label -> position of its label command
+        self.references = {} # label -> number of jumps to it
+        self.__add(code, 0)
+
+    def __add(self, instructions, start):
+        for offset, instruction in enumerate(instructions):
+            if instruction.op == Op.LABEL:
+                self.labels[instruction.arg1] = start + offset
+            elif instruction.op == Op.GOTO or instruction.op == Op.IF_GOTO:
+                self.references[instruction.arg1] = self.references.get(instruction.arg1, 0) + 1
+
+    # Updates the index for code[i:i+length] = replacement, called before the code is changed
+    def replace(self, code, i, length, replacement):
+        for instruction in code[i:i + length]:
+            if instruction.op == Op.LABEL:
+                del self.labels[instruction.arg1]
+            elif instruction.op == Op.GOTO or instruction.op == Op.IF_GOTO:
+                self.references[instruction.arg1] -= 1
+        shift = len(replacement) - length
+        if shift != 0:
+            end = i + length
+            for label, position in self.labels.items():
+                if position >= end:
+                    self.labels[label] = position + shift
+        self.__add(replacement, i)
+
+# Rule set used by -O, in the order they are tried at each position
+DEFAULT_RULES = [
+    ("push-pop", pushPop),
+    ("double-unary", doubleUnary),
+    ("constant-fold", constantFold),
+    ("constant-branch", constantBranch),
+    ("zero-test-branch", zeroTestBranch),
+    ("goto-next-label", gotoNextLabel),
+    ("jump-threading", jumpThreading),
+    ("unused-label", unusedLabel),
+    ("unreachable", unreachable),
+    ("dead-temp-store", deadTempStore)
+]
+
+# Longest window a rule replacement can create a new match in, used to back up after a rewrite
+LOOK_BEHIND = 4
+
+class PeepholeOptimizer:
+    # rules: list of (name, rule) pairs, see the rule functions above
+    # deadStores: also remove dead stores and redundant zero initializations (see DeadStores)
+    def __init__(self, rules=None, deadStores=True):
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.deadStores = deadStores
+
+    # Rewrites one function's instructions until no rule matches
+    # stats: dict updated with the number of instructions removed per rule ("peephole <name>"), or the
+    # number of rewrites for rules that don't remove any (jump-threading)
+    def optimizeFunction(self, code, stats):
+        code = list(code)
+        jumps = JumpIndex(code)
+        i = 0
+        while i < len(code):
+            for name, rule in self.rules:
+                match = rule(code, i, jumps)
+                if match is not None:
+                    length, replacement = match
+                    jumps.replace(code, i, length, replacement)
+                    code[i:i + length] = replacement
+                    key = "peephole " + name
+                    stats[key] = stats.get(key, 0) + max(1, length - len(replacement))
+                    i = max(0, i - LOOK_BEHIND)
+                    break
+            else:
+                i += 1
+        return code
+
+    # Optimizes a whole class, each function separately
+    # Returns the new instruction list
+    def optimize(self, instructions, stats):
+        optimized = []
+        start = 0
+        for end in range(1, len(instructions) + 1):
+            if end == len(instructions) or instructions[end].op == Op.FUNCTION:
+                code = self.optimizeFunction(instructions[start:end], stats)
+                if self.deadStores:
+                    shorter = DeadStores.eliminate(code, stats)
+                    # removed stores can leave e.g. a push X; pop X behind
+                    code = self.optimizeFunction(shorter, stats) if len(shorter) < len(code) else code
+                optimized.extend(code)
+                start = end
+        return optimized
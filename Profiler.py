@@ -0,0 +1,93 @@
+import os, sys, time, json, tracemalloc
+from contextlib import contextmanager
+
+# Records wall time, counters and (optionally) tracemalloc peaks for the phases of a compile.
+# One Profiler is made per file (or project) in whichever process does the work; its records
+# are plain dicts so they can be sent back from worker processes and merged.
+class Profiler:
+    # name: file or project the phases belong to
+    # traceMemory: also measure the peak memory allocated during every phase (slower)
+    def __init__(self, name, traceMemory=False):
+        self.name = name
+        self.traceMemory = traceMemory
+        self.records = []
+        if traceMemory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    # Times the body of a with statement as one phase. The body can set counters
+    # ("tokens", "instructions") on the yielded record
+    @contextmanager
+    def phase(self, phaseName):
+        record = {"file": self.name, "phase": phaseName, "pid": os.getpid(), "start": time.time(),
+                  "seconds": 0.0, "tokens": None, "instructions": None, "peakKiB": None}
+        if self.traceMemory:
+            tracemalloc.reset_peak()
+            startMemory = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            if self.traceMemory:
+                record["peakKiB"] = round((tracemalloc.get_traced_memory()[1] - startMemory) / 1024, 1)
+            self.records.append(record)
+
+    # Seconds spent in phaseName (0 if it didn't run)
+    def seconds(self, phaseName):
+        return sum(record["seconds"] for record in self.records if record["phase"] == phaseName)
+
+# Prints the phase records sorted by time, slowest first, followed by totals per phase
+def printProfile(records, limit=20, out=sys.stdout):
+    if len(records) == 0:
+        print("profile: nothing was compiled", file=out)
+        return
+    names = {}
+    for record in records:
+        name = os.path.relpath(record["file"])
+        names[record["file"]] = name if not name.startswith("..") else record["file"]
+    width = max(len(name) for name in names.values()) + 2
+
+    def row(name, phase, seconds, tokens, instructions, peakKiB):
+        return (format(name, "<" + str(width)) + format(phase, "<10") + format(seconds * 1000, ">10.2f")
+                + format("" if tokens is None else tokens, ">10") + format("" if instructions is None else instructions, ">14")
+                + format("" if peakKiB is None else peakKiB, ">12"))
+
+    print(format("file", "<" + str(width)) + format("phase", "<10") + format("ms", ">10") + format("tokens", ">10")
+          + format("instructions", ">14") + format("peak KiB", ">12"), file=out)
+    slowest = sorted(records, key=lambda record: record["seconds"], reverse=True)
+    for record in slowest[:limit]:
+        print(row(names[record["file"]], record["phase"], record["seconds"], record["tokens"], record["instructions"], record["peakKiB"]), file=out)
+    if len(slowest) > limit:
+        print("... " + str(len(slowest) - limit) + " more", file=out)
+
+    totals = {}
+    for record in records:
+        total = totals.setdefault(record["phase"], {"seconds": 0.0, "tokens": None, "instructions": None, "peakKiB": None})
+        total["seconds"] += record["seconds"]
+        for key in ("tokens", "instructions"):
+            if record[key] is not None:
+                total[key] = (total[key] or 0) + record[key]
+        if record["peakKiB"] is not None:
+            total["peakKiB"] = max(total["peakKiB"] or 0, record["peakKiB"])
+    print("", file=out)
+    for phase in sorted(totals, key=lambda phase: totals[phase]["seconds"], reverse=True):
+        total = totals[phase]
+        print(row("total", phase, total["seconds"], total["tokens"], total["instructions"], total["peakKiB"]), file=out)
+
+# Writes the records as JSON, or in the Chrome trace event format (chrome://tracing, Perfetto)
+# when chromeTrace is set, with one row per worker process
+def writeProfile(records, path, chromeTrace=False):
+    if chromeTrace:
+        events = []
+        for record in records:
+            events.append({
+                "name": record["phase"], "cat": "compile", "ph": "X",
+                "ts": round(record["start"] * 1000000), "dur": round(record["seconds"] * 1000000),
+                "pid": 1, "tid": record["pid"],
+                "args": {"file": record["file"], "tokens": record["tokens"], "instructions": record["instructions"], "peakKiB": record["peakKiB"]}
+            })
+        data = {"traceEvents": events, "displayTimeUnit": "ms"}
+    else:
+        data = records
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=1)
@@ -0,0 +1,76 @@
+from VMWriter import Op, Segment, Instruction
+
+# Strength reduction of multiplications by a constant (-O)
+# Math.multiply loops over the 16 bits of its operand on Hack, so x * c with a constant c is
+# rewritten into adds: x * 0 => 0, x * 1 => x, x * -1 => -x, and other constants by doubling
+# (Horner's scheme over the bits of c). The result wraps to 16 bits like Math.multiply's.
+
+# Default maximum number of VM instructions a rewrite may add, compared with the
+# 'push constant c; call Math.multiply 2' it replaces
+DEFAULT_MAX_COST = 16
+
+# Temps only live inside a rewritten multiplication: the accumulator while doubling and x
+# when it has to be pushed again. temp 0 and temp 1 are used by the code generator
+ACCUMULATOR_TEMP = 2
+OPERAND_TEMP = 3
+
+# Instructions computing x * factor, replacing operand (the code that pushes x) and the multiplication
+# Returns None for -32768, whose absolute value isn't a word
+def multiplyInstructions(operand, factor):
+    if factor == 0:
+        if any(instruction.op == Op.CALL for instruction in operand):
+            # keep the side effects of x
+            return operand + [Instruction(Op.POP, Segment.TEMP, OPERAND_TEMP), Instruction(Op.PUSH, Segment.CONSTANT, 0)]
+        return [Instruction(Op.PUSH, Segment.CONSTANT, 0)]
+    if factor == -32768:
+        return None
+
+    code = list(operand)
+    bits = bin(abs(factor))[3:] # after the leading 1
+    if len(operand) == 1 and operand[0].op == Op.PUSH:
+        # a variable or this, push it again
+        pushOperand = operand[0]
+    elif "1" in bits:
+        pushOperand = Instruction(Op.PUSH, Segment.TEMP, OPERAND_TEMP)
+        code += [Instruction(Op.POP, Segment.TEMP, OPERAND_TEMP), pushOperand]
+    else:
+        pushOperand = None # a power of two only needs x once
+
+    accumulatorIsOperand = True
+    for bit in bits:
+        if accumulatorIsOperand and pushOperand is not None:
+            code += [pushOperand, Instruction(Op.ADD, None, None)]
+        else:
+            code += [Instruction(Op.POP, Segment.TEMP, ACCUMULATOR_TEMP), Instruction(Op.PUSH, Segment.TEMP, ACCUMULATOR_TEMP),
+                     Instruction(Op.PUSH, Segment.TEMP, ACCUMULATOR_TEMP), Instruction(Op.ADD, None, None)]
+        accumulatorIsOperand = False
+        if bit == "1":
+            code += [pushOperand, Instruction(Op.ADD, None, None)]
+    if factor < 0:
+        code.append(Instruction(Op.NEG, None, None))
+    return code
+
+# Rewrites the multiplication of the operands just written to vmWriter when exactly one of them is constant
+# start, termStart: positions where the left and the right operand's code start
+# leftValue, rightValue: the operands' constant values, None when not constant
+# maxCost: maximum number of instructions the rewrite may add, None to never rewrite
+# stats: dict, "strength reduction calls removed" counts the rewrites
+# Returns True if the multiplication was written, False if the caller still has to call Math.multiply
+def reduceMultiply(vmWriter, start, termStart, leftValue, rightValue, maxCost, stats):
+    if maxCost is None or (leftValue is None) == (rightValue is None):
+        return False
+    if rightValue is not None:
+        factor = rightValue
+        operand = vmWriter.instructions[start:termStart]
+    else:
+        # the constant has no side effects, so x can be computed first
+        factor = leftValue
+        operand = vmWriter.instructions[termStart:]
+    replacement = multiplyInstructions(operand, factor)
+    # the multiplication would add 'push constant c' (already written) and the call
+    if replacement is None or len(replacement) - len(operand) - 2 > maxCost:
+        return False
+    vmWriter.truncate(start)
+    vmWriter.writeInstructions(replacement)
+    stats["strength reduction calls removed"] = stats.get("strength reduction calls removed", 0) + 1
+    return True
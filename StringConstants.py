@@ -0,0 +1,36 @@
+# Code of string literals, shared by CompilationEngine and CodeGenerator
+
+# Builds a new String holding value and leaves it on the stack:
+#   push len; call String.new 1; (push c; call String.appendChar 2)*
+# appendChar returns the string, so it is ready for the next append
+def writeString(vmWriter, value):
+    vmWriter.writePush("CONST", len(value))
+    vmWriter.writeCall("String.new", 1)
+    for char in value.encode("ascii"):
+        vmWriter.writePush("CONST", char)
+        vmWriter.writeCall("String.appendChar", 2)
+
+# --pool-strings: pushes a pooled string literal. The string is built into its static slot the
+# first time this code runs, later runs only push the cached pointer:
+#   push static S; if-goto BUILT; <build>; pop static S; label BUILT; push static S
+# stringPool: dict literal -> static index of the class being compiled, new literals are added
+# firstSlot: static index of the first literal, after the class's own statics
+# builtLabel: label name unique in the class
+# stats: dict, counts the literals, use sites and what every reuse saves
+def writePooledString(vmWriter, stringPool, firstSlot, value, builtLabel, stats):
+    if value not in stringPool:
+        stringPool[value] = firstSlot + len(stringPool)
+        stats["string pool literals"] = stats.get("string pool literals", 0) + 1
+    slot = stringPool[value]
+
+    vmWriter.writePush("STATIC", slot)
+    vmWriter.writeIf(builtLabel)
+    writeString(vmWriter, value)
+    vmWriter.writePop("STATIC", slot)
+    vmWriter.writeLabel(builtLabel)
+    vmWriter.writePush("STATIC", slot)
+
+    # every evaluation after the first runs 3 instructions instead of rebuilding the string
+    stats["string pool use sites"] = stats.get("string pool use sites", 0) + 1
+    stats["string pool instructions saved per reuse"] = stats.get("string pool instructions saved per reuse", 0) + 3 * len(value)
+    stats["string pool allocations saved per reuse"] = stats.get("string pool allocations saved per reuse", 0) + 1
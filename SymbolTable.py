@@ -1,63 +1,114 @@
 import sys
+from enum import IntEnum
+from VMWriter import Segment
+
+# Symbol kinds
+class Kind(IntEnum):
+    STATIC = 0
+    FIELD = 1
+    ARG = 2
+    VAR = 3
+
+# VM segment holding each kind of symbol
+KIND_SEGMENTS = {
+    Kind.STATIC: Segment.STATIC,
+    Kind.FIELD: Segment.THIS,
+    Kind.ARG: Segment.ARGUMENT,
+    Kind.VAR: Segment.LOCAL
+}
+
+# Everything known about a symbol, resolved in one lookup. Symbols can't be changed once defined
+class Symbol:
+    __slots__ = ("name", "type", "kind", "segment", "index")
+
+    def __init__(self, name, type, kind, index):
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "type", type)
+        object.__setattr__(self, "kind", kind)
+        object.__setattr__(self, "segment", KIND_SEGMENTS[kind])
+        object.__setattr__(self, "index", index)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Symbol is immutable")
+
+    def __repr__(self):
+        return "Symbol(" + self.name + ", " + str(self.type) + ", " + self.kind.name + ", " + str(self.index) + ")"
+
 class SymbolTable :
-    def __init__(self):
+    # parent: enclosing scope searched by resolve when a name isn't defined here,
+    # e.g. the class table for a subroutine table
+    def __init__(self, parent=None):
+        self.parent = parent
         self.__table = {}
-        self.__varCounts = {            
-            "STATIC": 0,
-            "FIELD": 0,
-            "VAR": 0,
-            "ARG": 0
-        }
+        self.__varCounts = [0, 0, 0, 0] # per Kind
+
     def startSubroutine(self):
-        del self.__table
         self.__table = {}
-        self.__varCounts = {
-            "STATIC": 0,
-            "FIELD": 0,
-            "VAR": 0,
-            "ARG": 0
-        }
+        self.__varCounts = [0, 0, 0, 0]
+
+    # Converts a kind name (STATIC, FIELD, ARG, VAR in any case) to a Kind
+    def __toKind(self, kind):
+        if isinstance(kind, Kind):
+            return kind
+        try:
+            return Kind[kind.upper()]
+        except KeyError:
+            sys.exit("ERROR: Unknown symbol kind " + kind)
 
     # Add a symbol to symbol table
     # Name: name of symbol
     # type: data type (e.g. String, char, int, $className)
-    # kind: scope of symbol (e.g. STATIC, FIELD, ARG, VAR)
+    # kind: scope of symbol, a Kind or its name (e.g. STATIC, FIELD, ARG, VAR)
     def define(self, name, type, kind):
-        self.__table[name] = {
-            "type": type,
-            "kind": kind,
-            "index": self.__incCount(kind)
-        }
-
-    # Increments count for kind of var, returns incremented number
-    def __incCount(self, kind):
-        count = self.__varCounts[kind]
+        kind = self.__toKind(kind)
+        self.__table[name] = Symbol(name, type, kind, self.__varCounts[kind])
         self.__varCounts[kind] += 1
-        return count
 
     # Gets the count of the kind of variables in table
     def varCount(self, kind):
-        return self.__varCounts[kind]
-    
+        return self.__varCounts[self.__toKind(kind)]
+
+    # Finds a symbol in this scope or the enclosing ones
+    # Returns the Symbol, or None if the name isn't defined anywhere
+    def resolve(self, name):
+        table = self
+        while table is not None:
+            symbol = table.__table.get(name)
+            if symbol is not None:
+                return symbol
+            table = table.parent
+        return None
+
+    # Finds a name that must be a variable, exits with an error if it isn't defined
+    # sourceName: name of the jack source, used in the error message
+    def resolveVariable(self, name, sourceName):
+        symbol = self.resolve(name)
+        if symbol is None:
+            sys.exit("ERROR: undefined variable '" + name + "' in " + sourceName)
+        return symbol
+
     def kindOf(self, name):
-        if name in self.__table:
-            return self.__table[name]["kind"].lower()
+        symbol = self.resolve(name)
+        if symbol is not None:
+            return symbol.kind.name.lower()
         else:
             return None
-    
+
     def typeOf(self, name):
-        if name in self.__table:
-            return self.__table[name]["type"]
+        symbol = self.resolve(name)
+        if symbol is not None:
+            return symbol.type
         else:
             return None
 
     # Gets the index of the variable, indexes are separated by kind.
     # Returns -1 if symbol is not found
     def indexOf(self, name):
-        if name in self.__table:
-            return self.__table[name]["index"]
+        symbol = self.resolve(name)
+        if symbol is not None:
+            return symbol.index
         else:
             return -1
-        
+
     def printTable(self):
         print(self.__table)
@@ -0,0 +1,68 @@
+from VMWriter import Op
+
+# Subroutines a whole program starts from
+ENTRY_POINTS = ["Main.main", "Sys.init"]
+
+# Splits a class's instructions into the code before the first function and one list per function
+# Returns (prefix, [(functionName, instructions)])
+def splitFunctions(instructions):
+    prefix = []
+    functions = []
+    for instruction in instructions:
+        if instruction.op == Op.FUNCTION:
+            functions.append((instruction.arg1, [instruction]))
+        elif len(functions) == 0:
+            prefix.append(instruction)
+        else:
+            functions[-1][1].append(instruction)
+    return prefix, functions
+
+# Joins the output of splitFunctions back into one instruction list
+def joinFunctions(prefix, functions):
+    instructions = list(prefix)
+    for name, code in functions:
+        instructions.extend(code)
+    return instructions
+
+# Names of all functions reachable through call instructions from the entry points
+# functionCalls: dict functionName -> set of called function names
+def reachableFunctions(functionCalls, entryPoints=ENTRY_POINTS):
+    reachable = set()
+    pending = [name for name in entryPoints if name in functionCalls]
+    while len(pending) > 0:
+        name = pending.pop()
+        if name in reachable:
+            continue
+        reachable.add(name)
+        for callee in functionCalls[name]:
+            if callee in functionCalls and callee not in reachable:
+                pending.append(callee)
+    return reachable
+
+# Removes the functions, methods and constructors no entry point can reach
+# classes: dict path -> instruction list for every class of one program
+# stats: dict updated with the functions and instructions removed
+# Returns a dict path -> instruction list, or classes unchanged if the program has no entry point
+def shake(classes, stats):
+    split = {}
+    functionCalls = {}
+    for path, instructions in classes.items():
+        split[path] = splitFunctions(instructions)
+        for name, code in split[path][1]:
+            functionCalls[name] = set(instruction.arg1 for instruction in code if instruction.op == Op.CALL)
+
+    if not any(name in functionCalls for name in ENTRY_POINTS):
+        return classes
+
+    reachable = reachableFunctions(functionCalls)
+    shaken = {}
+    for path, (prefix, functions) in split.items():
+        kept = []
+        for name, code in functions:
+            if name in reachable:
+                kept.append((name, code))
+            else:
+                stats["tree shaking functions removed"] = stats.get("tree shaking functions removed", 0) + 1
+                stats["tree shaking instructions removed"] = stats.get("tree shaking instructions removed", 0) + len(code)
+        shaken[path] = joinFunctions(prefix, kept)
+    return shaken
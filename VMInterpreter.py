@@ -0,0 +1,778 @@
+import sys, os, math, itertools, argparse
+import VMWriter, JackAPI
+from VMWriter import Op, Segment, Instruction, toWord
+
+# Interpreter for the VM code the compiler writes, to measure and check the generated code
+# without the nand2tetris VM emulator. The instructions are decoded once into (op, a, b) tuples
+# of small ints, with labels and functions resolved to code positions and segments to RAM
+# addresses, and run by a single dispatch loop. The OS classes (Math, String, Array, Memory,
+# Output, Screen, Keyboard, Sys) are implemented in Python unless the program defines them.
+# Every run counts the VM instructions, calls and estimated Hack cycles of every function.
+#   python3 VMInterpreter.py Project11/Average --input "3\n10\n20\n30\n"
+#   python3 VMInterpreter.py Project11/Pong --keys 130 0 0 132 --max-steps 2000000 --profile
+#   python3 VMInterpreter.py --compare -O Project11/ComplexArrays Project11/Square
+
+# RAM layout of the Hack platform
+SP, LCL, ARG, THIS, THAT = 0, 1, 2, 3, 4
+TEMP_BASE = 5
+STATIC_BASE = 16
+STACK_BASE = 256
+HEAP_BASE = 2048
+SCREEN = 16384
+KEYBOARD = 24576
+RAM_SIZE = 32768
+
+DEFAULT_MAX_STEPS = 10000000
+
+# Decoded operations: (op, a, b)
+PUSH_CONSTANT = 0  # a: value
+PUSH_SEGMENT = 1   # a: register holding the segment's base (LCL, ARG, THIS, THAT), b: index
+PUSH_RAM = 2       # a: address (temp, static, pointer)
+POP_SEGMENT = 3
+POP_RAM = 4
+ADD = 5
+SUB = 6
+NEG = 7
+EQ = 8
+GT = 9
+LT = 10
+AND = 11
+OR = 12
+NOT = 13
+GOTO = 14          # a: code position
+IF_GOTO = 15
+CALL = 16          # a: code position of the function, b: number of arguments
+CALL_OS = 17       # a: function name, b: number of arguments
+FUNCTION = 18      # a: number of locals
+RETURN = 19
+
+ARITHMETIC = {Op.ADD: ADD, Op.SUB: SUB, Op.NEG: NEG, Op.EQ: EQ, Op.GT: GT, Op.LT: LT, Op.AND: AND, Op.OR: OR, Op.NOT: NOT}
+SEGMENT_REGISTERS = {Segment.LOCAL: LCL, Segment.ARGUMENT: ARG, Segment.THIS: THIS, Segment.THAT: THAT}
+
+# Estimated Hack cycles of each VM command, roughly what a textbook VM translator (nand2tetris
+# chapters 7 and 8) writes for it. function adds 7 per local, call 7 per argument is already
+# counted by the pushes before it
+HACK_CYCLES = {
+    PUSH_CONSTANT: 7, PUSH_SEGMENT: 10, PUSH_RAM: 7, POP_SEGMENT: 12, POP_RAM: 5,
+    ADD: 5, SUB: 5, AND: 5, OR: 5, NEG: 3, NOT: 3, EQ: 13, GT: 13, LT: 13,
+    GOTO: 2, IF_GOTO: 5, CALL: 50, CALL_OS: 50, FUNCTION: 0, RETURN: 45
+}
+CYCLES_PER_LOCAL = 7
+
+# Estimated Hack cycles of a call to a Python OS function, body only, in the range of the
+# nand2tetris Jack OS. Rough figures for comparing code that calls the OS with code that doesn't
+OS_CYCLES = {
+    "Math.multiply": 2500, "Math.divide": 4000, "Math.sqrt": 6000, "Math.abs": 40, "Math.min": 40, "Math.max": 40,
+    "Memory.alloc": 300, "Memory.deAlloc": 100, "Memory.peek": 20, "Memory.poke": 20,
+    "Array.new": 320, "Array.dispose": 120,
+    "String.new": 700, "String.dispose": 250, "String.appendChar": 80, "String.length": 20, "String.charAt": 60,
+    "String.setCharAt": 60, "String.eraseLastChar": 40, "String.intValue": 1500, "String.setInt": 3000,
+    "Output.printChar": 1200, "Output.println": 100, "Output.backSpace": 1200, "Output.moveCursor": 200,
+    "Screen.drawPixel": 500, "Screen.clearScreen": 50000,
+    "Keyboard.keyPressed": 20
+}
+DEFAULT_OS_CYCLES = 100
+# Per character of a printed string or number, per pixel of a line, rectangle or circle
+CYCLES_PER_CHARACTER = 1200
+CYCLES_PER_PIXEL = 60
+
+# The program's VM code can't be run: an unknown function or label, a stack overflow, an address
+# outside the RAM
+class VMError(Exception):
+    pass
+
+# The program stopped: status "halted" (Sys.halt), "error" (Sys.error, code set) or "waiting for
+# input" (Keyboard needed more input than was given)
+class ProgramExit(Exception):
+    def __init__(self, status, code=None):
+        Exception.__init__(self, status)
+        self.status = status
+        self.code = code
+
+# Key codes of typed text: characters as themselves, a newline as Enter (128)
+def keyCodes(text):
+    return [128 if char == "\n" else ord(char) for char in text]
+
+# The Jack OS in Python. Objects (strings, arrays) live in the RAM's heap like the real ones, so
+# programs can't tell the difference, but the output is collected as text and the keyboard reads
+# from a list of key codes
+class JackOS:
+    # ram: the interpreter's RAM
+    # input: key codes, each Keyboard.keyPressed call takes the next one, 0 (no key) when none are left
+    def __init__(self, ram, input=()):
+        self.ram = ram
+        self.input = list(input)
+        self.output = [] # characters printed
+        self.color = True
+        self.free = [(HEAP_BASE, SCREEN - HEAP_BASE)] # (address, size) of every free heap block
+        self.sizes = {} # address -> size of every allocated block
+        self.calls = {}
+        self.cycles = {}
+        self.current = None
+        self.functions = {}
+        for name in dir(self):
+            className, _, functionName = name.partition("_")
+            if className in ("Math", "Memory", "Array", "String", "Output", "Screen", "Keyboard", "Sys"):
+                self.functions[className + "." + functionName] = getattr(self, name)
+
+    # Calls an OS function, returns its return value (0 for void functions)
+    def call(self, name, args):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.current = name
+        self.__charge(OS_CYCLES.get(name, DEFAULT_OS_CYCLES))
+        result = self.functions[name](*args)
+        return 0 if result is None else result
+
+    # Adds estimated cycles to the OS function being called
+    def __charge(self, cycles):
+        self.cycles[self.current] = self.cycles.get(self.current, 0) + cycles
+
+    # Stops the program like the Jack OS's Sys.error
+    def error(self, code):
+        self.output.extend("ERR" + str(code))
+        raise ProgramExit("error", code)
+
+    # Python string of a Jack String
+    def text(self, string):
+        buffer = self.ram[string + 2]
+        return "".join(chr(self.ram[buffer + i]) for i in range(self.ram[string + 1]))
+
+    def __print(self, text):
+        self.output.extend(text)
+        self.__charge(CYCLES_PER_CHARACTER * len(text))
+
+    def __draw(self, x, y):
+        address = SCREEN + y * 32 + x // 16
+        word = self.ram[address] & 0xFFFF
+        mask = 1 << (x % 16)
+        self.ram[address] = toWord(word | mask if self.color else word & ~mask)
+
+    def __drawHorizontal(self, x1, x2, y):
+        for x in range(x1, x2 + 1):
+            self.__draw(x, y)
+        self.__charge(CYCLES_PER_PIXEL * (x2 - x1 + 1))
+
+    def __readKey(self):
+        while len(self.input) > 0:
+            key = self.input.pop(0)
+            if key != 0:
+                return key
+        raise ProgramExit("waiting for input")
+
+    def Math_init(self):
+        pass
+
+    def Math_abs(self, x):
+        return toWord(abs(x))
+
+    def Math_multiply(self, x, y):
+        return toWord(x * y)
+
+    def Math_divide(self, x, y):
+        if y == 0:
+            self.error(3)
+        quotient = abs(x) // abs(y)
+        return toWord(quotient if (x < 0) == (y < 0) else -quotient)
+
+    def Math_min(self, x, y):
+        return min(x, y)
+
+    def Math_max(self, x, y):
+        return max(x, y)
+
+    def Math_sqrt(self, x):
+        if x < 0:
+            self.error(4)
+        return math.isqrt(x)
+
+    def Memory_init(self):
+        pass
+
+    def Memory_peek(self, address):
+        return self.ram[address]
+
+    def Memory_poke(self, address, value):
+        self.ram[address] = value
+
+    def Memory_alloc(self, size):
+        if size <= 0:
+            self.error(5)
+        for i, (address, freeSize) in enumerate(self.free):
+            if freeSize >= size:
+                if freeSize == size:
+                    del self.free[i]
+                else:
+                    self.free[i] = (address + size, freeSize - size)
+                self.sizes[address] = size
+                return address
+        self.error(6)
+
+    def Memory_deAlloc(self, address):
+        size = self.sizes.pop(address, None)
+        if size is None:
+            return
+        self.free.append((address, size))
+        self.free.sort()
+        merged = [self.free[0]]
+        for block in self.free[1:]:
+            last = merged[-1]
+            if last[0] + last[1] == block[0]:
+                merged[-1] = (last[0], last[1] + block[1])
+            else:
+                merged.append(block)
+        self.free = merged
+
+    def Array_new(self, size):
+        if size <= 0:
+            self.error(2)
+        return self.Memory_alloc(size)
+
+    def Array_dispose(self, array):
+        self.Memory_deAlloc(array)
+
+    # A String is 3 words: maximum length, length and the address of its characters
+    def String_new(self, maxLength):
+        if maxLength < 0:
+            self.error(14)
+        string = self.Memory_alloc(3)
+        self.ram[string] = maxLength
+        self.ram[string + 1] = 0
+        self.ram[string + 2] = self.Memory_alloc(max(maxLength, 1))
+        return string
+
+    def String_dispose(self, string):
+        self.Memory_deAlloc(self.ram[string + 2])
+        self.Memory_deAlloc(string)
+
+    def String_length(self, string):
+        return self.ram[string + 1]
+
+    def String_charAt(self, string, i):
+        if i < 0 or i >= self.ram[string + 1]:
+            self.error(15)
+        return self.ram[self.ram[string + 2] + i]
+
+    def String_setCharAt(self, string, i, char):
+        if i < 0 or i >= self.ram[string + 1]:
+            self.error(16)
+        self.ram[self.ram[string + 2] + i] = char
+
+    def String_appendChar(self, string, char):
+        length = self.ram[string + 1]
+        if length >= self.ram[string]:
+            self.error(17)
+        self.ram[self.ram[string + 2] + length] = char
+        self.ram[string + 1] = length + 1
+        return string
+
+    def String_eraseLastChar(self, string):
+        if self.ram[string + 1] == 0:
+            self.error(18)
+        self.ram[string + 1] -= 1
+
+    def String_intValue(self, string):
+        text = self.text(string)
+        sign = -1 if text.startswith("-") else 1
+        value = 0
+        for char in text[1 if sign < 0 else 0:]:
+            if not char.isdigit():
+                break
+            value = value * 10 + int(char)
+        return toWord(sign * value)
+
+    def String_setInt(self, string, number):
+        text = str(number)
+        if len(text) > self.ram[string]:
+            self.error(19)
+        buffer = self.ram[string + 2]
+        for i, char in enumerate(text):
+            self.ram[buffer + i] = ord(char)
+        self.ram[string + 1] = len(text)
+
+    def String_newLine(self):
+        return 128
+
+    def String_backSpace(self):
+        return 129
+
+    def String_doubleQuote(self):
+        return 34
+
+    def Output_init(self):
+        pass
+
+    def Output_moveCursor(self, i, j):
+        if i < 0 or i > 22 or j < 0 or j > 63:
+            self.error(20)
+
+    def Output_printChar(self, char):
+        if char == 128:
+            self.output.append("\n")
+        elif char == 129:
+            self.Output_backSpace()
+        else:
+            self.output.append(chr(char))
+
+    def Output_printString(self, string):
+        self.__print(self.text(string))
+
+    def Output_printInt(self, number):
+        self.__print(str(number))
+
+    def Output_println(self):
+        self.output.append("\n")
+
+    def Output_backSpace(self):
+        if len(self.output) > 0:
+            self.output.pop()
+
+    def Screen_init(self):
+        pass
+
+    def Screen_clearScreen(self):
+        self.ram[SCREEN:KEYBOARD] = [0] * (KEYBOARD - SCREEN)
+
+    def Screen_setColor(self, color):
+        self.color = color != 0
+
+    def Screen_drawPixel(self, x, y):
+        if x < 0 or x > 511 or y < 0 or y > 255:
+            self.error(7)
+        self.__draw(x, y)
+
+    def Screen_drawLine(self, x1, y1, x2, y2):
+        if min(x1, x2) < 0 or max(x1, x2) > 511 or min(y1, y2) < 0 or max(y1, y2) > 255:
+            self.error(8)
+        if y1 == y2:
+            self.__drawHorizontal(min(x1, x2), max(x1, x2), y1)
+            return
+        # Bresenham's algorithm
+        dx, dy = abs(x2 - x1), -abs(y2 - y1)
+        stepX, stepY = (1 if x1 < x2 else -1), (1 if y1 < y2 else -1)
+        difference = dx + dy
+        pixels = 0
+        while True:
+            self.__draw(x1, y1)
+            pixels += 1
+            if x1 == x2 and y1 == y2:
+                break
+            if 2 * difference >= dy:
+                difference += dy
+                x1 += stepX
+            if 2 * difference <= dx:
+                difference += dx
+                y1 += stepY
+        self.__charge(CYCLES_PER_PIXEL * pixels)
+
+    def Screen_drawRectangle(self, x1, y1, x2, y2):
+        if x1 > x2 or y1 > y2 or x1 < 0 or x2 > 511 or y1 < 0 or y2 > 255:
+            self.error(9)
+        for y in range(y1, y2 + 1):
+            self.__drawHorizontal(x1, x2, y)
+
+    def Screen_drawCircle(self, x, y, r):
+        if x < 0 or x > 511 or y < 0 or y > 255:
+            self.error(12)
+        if r < 0 or r > 181 or x - r < 0 or x + r > 511 or y - r < 0 or y + r > 255:
+            self.error(13)
+        for dy in range(-r, r + 1):
+            half = math.isqrt(r * r - dy * dy)
+            self.__drawHorizontal(x - half, x + half, y + dy)
+
+    def Keyboard_init(self):
+        pass
+
+    def Keyboard_keyPressed(self):
+        key = self.input.pop(0) if len(self.input) > 0 else 0
+        self.ram[KEYBOARD] = key
+        return key
+
+    def Keyboard_readChar(self):
+        key = self.__readKey()
+        self.Output_printChar(key)
+        return key
+
+    def Keyboard_readLine(self, message):
+        self.Output_printString(message)
+        chars = []
+        while True:
+            key = self.Keyboard_readChar()
+            if key == 128:
+                break
+            if key == 129:
+                chars = chars[:-1]
+            else:
+                chars.append(key)
+        line = self.String_new(len(chars))
+        for char in chars:
+            self.String_appendChar(line, char)
+        return line
+
+    def Keyboard_readInt(self, message):
+        line = self.Keyboard_readLine(message)
+        value = self.String_intValue(line)
+        self.String_dispose(line)
+        return value
+
+    def Sys_init(self):
+        pass
+
+    def Sys_halt(self):
+        raise ProgramExit("halted")
+
+    def Sys_error(self, code):
+        self.error(code)
+
+    def Sys_wait(self, duration):
+        if duration < 0:
+            self.error(1)
+
+class VMInterpreter:
+    # classes: dict className -> the class's VM code, as text or an instruction list
+    # input: key codes typed on the keyboard, see JackOS and keyCodes
+    # Raises VMError if the code can't be loaded
+    def __init__(self, classes, input=()):
+        self.ram = [0] * RAM_SIZE
+        self.os = JackOS(self.ram, input)
+        self.code = []      # decoded operations
+        self.costs = []     # estimated Hack cycles of each operation
+        self.functions = [] # name of the function of each operation
+        self.__load(classes)
+
+    def __load(self, classes):
+        functions = {}
+        parsed = []
+        staticBase = STATIC_BASE
+        for className in sorted(classes):
+            instructions = classes[className]
+            if isinstance(instructions, str):
+                try:
+                    instructions = VMWriter.parseInstructions(instructions)
+                except ValueError as e:
+                    raise VMError(className + ".vm " + str(e))
+            statics = [index for op, segment, index in instructions if segment == Segment.STATIC]
+            parsed.append((instructions, staticBase))
+            staticBase += max(statics) + 1 if len(statics) > 0 else 0
+            if staticBase > STACK_BASE:
+                raise VMError("the program's statics don't fit in RAM[16..255]")
+
+        # code positions of the functions and labels, labels aren't decoded
+        labels = {}
+        position = 0
+        for instructions, staticBase in parsed:
+            function = None
+            for op, arg1, arg2 in instructions:
+                if op == Op.FUNCTION:
+                    if arg1 in functions:
+                        raise VMError("function " + arg1 + " is defined twice")
+                    function = arg1
+                    functions[function] = position
+                elif function is None:
+                    continue # before the first function, never run
+                if op == Op.LABEL:
+                    labels[(function, arg1)] = position
+                else:
+                    position += 1
+        self.entry = functions.get("Sys.init", functions.get("Main.main"))
+        if self.entry is None:
+            raise VMError("the program has neither Sys.init nor Main.main")
+
+        for instructions, staticBase in parsed:
+            function = None
+            for op, arg1, arg2 in instructions:
+                if op == Op.FUNCTION:
+                    function = arg1
+                if function is None or op == Op.LABEL:
+                    continue
+                if op == Op.PUSH or op == Op.POP:
+                    if arg1 == Segment.CONSTANT:
+                        operation = (PUSH_CONSTANT, arg2, None)
+                    elif arg1 in SEGMENT_REGISTERS:
+                        operation = (PUSH_SEGMENT if op == Op.PUSH else POP_SEGMENT, SEGMENT_REGISTERS[arg1], arg2)
+                    else:
+                        if (arg1 == Segment.TEMP and arg2 > 7) or (arg1 == Segment.POINTER and arg2 > 1):
+                            raise VMError(function + ": no " + VMWriter.formatInstruction(Instruction(op, arg1, arg2)))
+                        address = {Segment.TEMP: TEMP_BASE, Segment.STATIC: staticBase, Segment.POINTER: THIS}[arg1] + arg2
+                        operation = (PUSH_RAM if op == Op.PUSH else POP_RAM, address, None)
+                    if op == Op.POP and arg1 == Segment.CONSTANT:
+                        raise VMError(function + ": pop constant")
+                elif op in ARITHMETIC:
+                    operation = (ARITHMETIC[op], None, None)
+                elif op == Op.GOTO or op == Op.IF_GOTO:
+                    if (function, arg1) not in labels:
+                        raise VMError(function + ": unknown label " + arg1)
+                    operation = (GOTO if op == Op.GOTO else IF_GOTO, labels[(function, arg1)], None)
+                elif op == Op.CALL:
+                    # the program's own OS classes come first
+                    operation = (CALL, functions[arg1], arg2) if arg1 in functions else (CALL_OS, arg1, arg2)
+                elif op == Op.FUNCTION:
+                    operation = (FUNCTION, arg2, None)
+                else:
+                    operation = (RETURN, None, None)
+                self.code.append(operation)
+                self.costs.append(HACK_CYCLES[operation[0]] + (CYCLES_PER_LOCAL * arg2 if op == Op.FUNCTION else 0))
+                self.functions.append(function)
+
+    # Runs the program from Sys.init (or Main.main when it has none) until it returns, stops
+    # (Sys.halt, Sys.error, out of input) or maxSteps VM instructions have run
+    # Returns {"status", "errorCode", "output", "instructions", "calls", "cycles", "functions"}:
+    #   status: "returned", "halted", "error", "waiting for input" or "step limit"
+    #   output: the text printed, "ERR<code>" for Sys.error
+    #   functions: dict name -> {"calls", "instructions", "cycles"}, the OS functions included
+    # Raises VMError when the code does something the VM can't, e.g. calls an unknown function
+    def run(self, maxSteps=DEFAULT_MAX_STEPS):
+        ram = self.ram
+        code = self.code
+        counts = [0] * len(code)
+        jackOS = self.os
+        osFunctions = jackOS.functions
+
+        # bootstrap: call the entry function with a return address that stops the run
+        ram[LCL] = ram[ARG] = ram[THIS] = ram[THAT] = 0
+        ram[STACK_BASE:STACK_BASE + 5] = [-1, 0, 0, 0, 0]
+        sp = STACK_BASE + 5
+        ram[ARG] = STACK_BASE
+        ram[LCL] = sp
+        pc = self.entry
+        status = "step limit"
+        errorCode = None
+        try:
+            for step in itertools.repeat(None, maxSteps):
+                op, a, b = code[pc]
+                counts[pc] += 1
+                pc += 1
+                if op == PUSH_SEGMENT:
+                    ram[sp] = ram[ram[a] + b]
+                    sp += 1
+                elif op == PUSH_CONSTANT:
+                    ram[sp] = a
+                    sp += 1
+                elif op == PUSH_RAM:
+                    ram[sp] = ram[a]
+                    sp += 1
+                elif op == POP_SEGMENT:
+                    sp -= 1
+                    ram[ram[a] + b] = ram[sp]
+                elif op == POP_RAM:
+                    sp -= 1
+                    ram[a] = ram[sp]
+                elif op == IF_GOTO:
+                    sp -= 1
+                    if ram[sp] != 0:
+                        pc = a
+                elif op == GOTO:
+                    pc = a
+                elif op == ADD or op == SUB:
+                    sp -= 1
+                    value = ram[sp - 1] + ram[sp] if op == ADD else ram[sp - 1] - ram[sp]
+                    ram[sp - 1] = value if -32768 <= value <= 32767 else toWord(value)
+                elif op == EQ:
+                    sp -= 1
+                    ram[sp - 1] = -1 if ram[sp - 1] == ram[sp] else 0
+                elif op == LT:
+                    sp -= 1
+                    ram[sp - 1] = -1 if ram[sp - 1] < ram[sp] else 0
+                elif op == GT:
+                    sp -= 1
+                    ram[sp - 1] = -1 if ram[sp - 1] > ram[sp] else 0
+                elif op == NOT:
+                    ram[sp - 1] = ~ram[sp - 1]
+                elif op == NEG:
+                    ram[sp - 1] = toWord(-ram[sp - 1])
+                elif op == AND:
+                    sp -= 1
+                    ram[sp - 1] = ram[sp - 1] & ram[sp]
+                elif op == OR:
+                    sp -= 1
+                    ram[sp - 1] = ram[sp - 1] | ram[sp]
+                elif op == CALL:
+                    if sp >= HEAP_BASE - 5:
+                        raise VMError("stack overflow calling " + self.functions[a])
+                    ram[sp:sp + 5] = [pc, ram[LCL], ram[ARG], ram[THIS], ram[THAT]]
+                    ram[ARG] = sp - b
+                    sp += 5
+                    ram[LCL] = sp
+                    pc = a
+                elif op == FUNCTION:
+                    ram[sp:sp + a] = [0] * a
+                    sp += a
+                elif op == RETURN:
+                    frame = ram[LCL]
+                    returnAddress = ram[frame - 5]
+                    ram[ram[ARG]] = ram[sp - 1]
+                    sp = ram[ARG] + 1
+                    ram[LCL:THAT + 1] = ram[frame - 4:frame]
+                    if returnAddress < 0:
+                        status = "returned"
+                        break
+                    pc = returnAddress
+                else: # CALL_OS
+                    if a not in osFunctions:
+                        raise VMError(self.functions[pc - 1] + " calls unknown function " + a)
+                    sp -= b
+                    ram[SP] = sp
+                    ram[sp] = jackOS.call(a, ram[sp:sp + b])
+                    sp += 1
+        except ProgramExit as e:
+            status = e.status
+            errorCode = e.code
+        except IndexError:
+            raise VMError(self.functions[pc - 1] + ": address outside the RAM")
+        except TypeError:
+            raise VMError(self.functions[pc - 1] + ": wrong number of arguments for " + str(code[pc - 1][1]))
+        ram[SP] = sp
+        return self.__result(counts, status, errorCode)
+
+    def __result(self, counts, status, errorCode):
+        functions = {}
+        for pc, count in enumerate(counts):
+            if count == 0:
+                continue
+            record = functions.setdefault(self.functions[pc], {"calls": 0, "instructions": 0, "cycles": 0})
+            record["instructions"] += count
+            record["cycles"] += count * self.costs[pc]
+            if self.code[pc][0] == FUNCTION:
+                record["calls"] += count
+        for name, calls in self.os.calls.items():
+            functions[name] = {"calls": calls, "instructions": 0, "cycles": self.os.cycles.get(name, 0)}
+        return {
+            "status": status,
+            "errorCode": errorCode,
+            "output": "".join(self.os.output),
+            "instructions": sum(record["instructions"] for record in functions.values()),
+            "calls": sum(record["calls"] for record in functions.values()),
+            "cycles": sum(record["cycles"] for record in functions.values()),
+            "functions": functions
+        }
+
+# Reads the .vm files of a directory
+# Returns dict className -> VM code text
+def readProgram(directory):
+    classes = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".vm"):
+            with open(os.path.join(directory, name), "r", encoding="utf-8") as file:
+                classes[name[:-3]] = file.read()
+    return classes
+
+# Compiles the .jack files of a directory in memory
+# options: keyword arguments of JackAPI.compileMany
+# Returns dict className -> VM code text, exits if a class fails to compile
+def compileProgram(directory, options):
+    sources = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".jack"):
+            with open(os.path.join(directory, name), "r", encoding="utf-8") as file:
+                sources.append((name[:-5], file.read()))
+    if len(sources) == 0:
+        sys.exit("ERROR: No Jack files found in " + directory)
+    classes = {}
+    for result in JackAPI.compileMany(sources, **options):
+        if result["error"] is not None:
+            sys.exit(result["error"])
+        classes[result["className"]] = result["vm"]
+    return classes
+
+# Runs a program, see VMInterpreter.run
+# Returns (result, the screen's RAM at the end)
+def runProgram(classes, input, maxSteps):
+    interpreter = VMInterpreter(classes, input)
+    result = interpreter.run(maxSteps)
+    return result, interpreter.ram[SCREEN:KEYBOARD]
+
+def summary(result):
+    status = result["status"] if result["errorCode"] is None else "error " + str(result["errorCode"])
+    return (status + ": " + str(result["instructions"]) + " VM instructions, " + str(result["calls"]) + " calls, "
+            + str(result["cycles"]) + " estimated Hack cycles")
+
+# Prints the functions that took the most estimated cycles
+def printFunctions(result, limit=20, out=sys.stdout):
+    functions = result["functions"]
+    width = max([len(name) for name in functions] + [len("function")]) + 2
+    print(format("function", "<" + str(width)) + format("calls", ">10") + format("instructions", ">14") + format("cycles", ">14")
+          + format("%", ">8"), file=out)
+    ranked = sorted(functions, key=lambda name: (-functions[name]["cycles"], name))
+    for name in ranked[:limit]:
+        record = functions[name]
+        share = 100.0 * record["cycles"] / result["cycles"] if result["cycles"] > 0 else 0.0
+        print(format(name, "<" + str(width)) + format(record["calls"], ">10") + format(record["instructions"], ">14")
+              + format(record["cycles"], ">14") + format(share, ">8.1f"), file=out)
+    if len(ranked) > limit:
+        print("... " + str(len(ranked) - limit) + " more", file=out)
+
+# Compiles a directory's Jack program without and with options, runs both and compares what they
+# printed, how they stopped and what they left on the screen
+# Returns True if both behave the same
+def compare(directory, options, input, maxSteps, profile, limit):
+    plain, plainScreen = runProgram(compileProgram(directory, {}), input, maxSteps)
+    optimized, optimizedScreen = runProgram(compileProgram(directory, options), input, maxSteps)
+    print(directory + ":")
+    print("  plain:     " + summary(plain))
+    print("  optimized: " + summary(optimized))
+    if plain["cycles"] > 0:
+        print("  optimized/plain: " + format(optimized["instructions"] / max(plain["instructions"], 1), ".3f") + " instructions, "
+              + format(optimized["cycles"] / plain["cycles"], ".3f") + " cycles")
+    differences = []
+    if plain["status"] == "step limit" or optimized["status"] == "step limit":
+        # the two builds stop at different points of the program
+        print("  WARNING: step limit reached, only the output so far is compared")
+        length = min(len(plain["output"]), len(optimized["output"]))
+        if plain["output"][:length] != optimized["output"][:length]:
+            differences.append("output")
+    else:
+        for key, name in (("status", "status"), ("errorCode", "error code"), ("output", "output")):
+            if plain[key] != optimized[key]:
+                differences.append(name)
+        if plainScreen != optimizedScreen:
+            differences.append("screen")
+    if profile:
+        printFunctions(optimized, limit)
+    if len(differences) > 0:
+        print("  DIFFERENT: " + ", ".join(differences))
+        return False
+    print("  same behavior")
+    return True
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description="Runs the VM code of Jack programs and counts VM instructions, calls and estimated Hack cycles per function")
+    parser.add_argument("paths", nargs="+", metavar="directory", help="program directories: their .vm files, or with --compare their .jack files")
+    parser.add_argument("--input", default="", help="text typed on the keyboard, \\n for Enter")
+    parser.add_argument("--keys", type=int, nargs="+", default=[], metavar="CODE", help="key codes typed after --input, one per Keyboard.keyPressed call (0 for no key, 130 left arrow, 132 right arrow)")
+    parser.add_argument("--max-steps", type=int, default=DEFAULT_MAX_STEPS, help="stop after this many VM instructions (default: " + str(DEFAULT_MAX_STEPS) + ")")
+    parser.add_argument("--profile", action="store_true", help="print the calls, VM instructions and estimated Hack cycles of the most expensive functions")
+    parser.add_argument("--top", type=int, default=20, help="--profile: number of functions printed (default: 20)")
+    parser.add_argument("--compare", action="store_true", help="compile each directory in memory without and with the options below, run both and check they behave the same")
+    parser.add_argument("-O", "--optimize", action="store_true", help="--compare: optimize the second build (the default when no other option is given)")
+    parser.add_argument("--pool-strings", action="store_true", help="--compare: pool the string literals of the second build")
+    parser.add_argument("--whole-program", action="store_true", help="--compare: compile the second build as a whole program")
+    return parser.parse_args(argv)
+
+def main():
+    args = parseArgs(sys.argv[1:])
+    input = keyCodes(args.input.replace("\\n", "\n")) + args.keys
+    failed = 0
+    for directory in args.paths:
+        if not os.path.isdir(directory):
+            sys.exit("ERROR: " + directory + " is not a directory")
+        try:
+            if args.compare:
+                options = {"optimize": args.optimize or not (args.pool_strings or args.whole_program),
+                           "poolStrings": args.pool_strings, "wholeProgram": args.whole_program}
+                if not compare(directory, options, input, args.max_steps, args.profile, args.top):
+                    failed += 1
+                continue
+            classes = readProgram(directory)
+            if len(classes) == 0:
+                sys.exit("ERROR: No VM files found in " + directory)
+            result, screen = runProgram(classes, input, args.max_steps)
+        except VMError as e:
+            sys.exit("ERROR: " + directory + ": " + str(e))
+        print(result["output"], end="" if result["output"].endswith("\n") or result["output"] == "" else "\n")
+        print(directory + ": " + summary(result), file=sys.stderr)
+        if args.profile:
+            printFunctions(result, args.top, sys.stderr)
+    if failed > 0:
+        sys.exit("ERROR: " + str(failed) + " of " + str(len(args.paths)) + " programs behave differently when optimized")
+
+if __name__ == "__main__":
+    main()
@@ -1,102 +1,273 @@
-import os, sys
+import os, sys, filecmp
+from collections import namedtuple
+from enum import IntEnum
+
+# VM command opcodes
+class Op(IntEnum):
+    PUSH = 0
+    POP = 1
+    ADD = 2
+    SUB = 3
+    NEG = 4
+    EQ = 5
+    GT = 6
+    LT = 7
+    AND = 8
+    OR = 9
+    NOT = 10
+    LABEL = 11
+    GOTO = 12
+    IF_GOTO = 13
+    CALL = 14
+    FUNCTION = 15
+    RETURN = 16
+
+# VM memory segments
+class Segment(IntEnum):
+    CONSTANT = 0
+    ARGUMENT = 1
+    LOCAL = 2
+    STATIC = 3
+    THIS = 4
+    THAT = 5
+    POINTER = 6
+    TEMP = 7
+
+# One VM command
+# op: Op
+# arg1: Segment for push/pop, label for label/goto/if-goto, name for call/function, None otherwise
+# arg2: index for push/pop, nArgs/nLocals for call/function, None otherwise
+Instruction = namedtuple("Instruction", ["op", "arg1", "arg2"])
+
+OP_TEXT = {
+    Op.PUSH: "push", Op.POP: "pop",
+    Op.ADD: "add", Op.SUB: "sub", Op.NEG: "neg", Op.EQ: "eq", Op.GT: "gt", Op.LT: "lt",
+    Op.AND: "and", Op.OR: "or", Op.NOT: "not",
+    Op.LABEL: "label", Op.GOTO: "goto", Op.IF_GOTO: "if-goto",
+    Op.CALL: "call", Op.FUNCTION: "function", Op.RETURN: "return"
+}
+
+SEGMENT_TEXT = {
+    Segment.CONSTANT: "constant", Segment.ARGUMENT: "argument", Segment.LOCAL: "local", Segment.STATIC: "static",
+    Segment.THIS: "this", Segment.THAT: "that", Segment.POINTER: "pointer", Segment.TEMP: "temp"
+}
+
+# Segment names accepted by writePush/writePop, symbol table kinds included
+SEGMENT_NAMES = {
+    "CONST": Segment.CONSTANT, "ARG": Segment.ARGUMENT, "LOCAL": Segment.LOCAL, "VAR": Segment.LOCAL,
+    "STATIC": Segment.STATIC, "FIELD": Segment.THIS, "THAT": Segment.THAT, "POINTER": Segment.POINTER,
+    "TEMP": Segment.TEMP
+}
+
+ARITHMETIC_NAMES = {
+    "ADD": Op.ADD, "SUB": Op.SUB, "NEG": Op.NEG, "EQ": Op.EQ, "GT": Op.GT, "LT": Op.LT,
+    "AND": Op.AND, "OR": Op.OR, "NOT": Op.NOT
+}
+
+# Wraps an int to a signed 16 bit value, the Hack word size
+def toWord(value):
+    value = value & 0xFFFF
+    if value >= 0x8000:
+        value -= 0x10000
+    return value
+
+# Instructions that leave the 16 bit constant value on the stack, or None if it can't be done cheaply
+def constantInstructions(value):
+    if 0 <= value <= 32767:
+        return [Instruction(Op.PUSH, Segment.CONSTANT, value)]
+    elif -32767 <= value < 0:
+        return [Instruction(Op.PUSH, Segment.CONSTANT, -value), Instruction(Op.NEG, None, None)]
+    else:
+        return None
+
+# Formats one instruction as a line of VM code (without line separator)
+def formatInstruction(instruction):
+    op, arg1, arg2 = instruction
+    if op == Op.PUSH or op == Op.POP:
+        return OP_TEXT[op] + " " + SEGMENT_TEXT[arg1] + " " + str(arg2)
+    elif op == Op.CALL or op == Op.FUNCTION:
+        return OP_TEXT[op] + " " + arg1 + " " + str(arg2)
+    elif arg1 is not None:
+        return OP_TEXT[op] + " " + arg1
+    else:
+        return OP_TEXT[op]
+
+# Formats a list of instructions as VM code
+def formatInstructions(instructions):
+    if len(instructions) == 0:
+        return ""
+    return os.linesep.join([formatInstruction(instruction) for instruction in instructions]) + os.linesep
+
+TEXT_OPS = dict((text, op) for op, text in OP_TEXT.items())
+TEXT_SEGMENTS = dict((text, segment) for segment, text in SEGMENT_TEXT.items())
+
+# Parses VM code (formatInstructions's output or handwritten code with // comments) into instructions
+# Raises ValueError naming the line of a command that isn't valid
+def parseInstructions(text):
+    instructions = []
+    for lineNumber, line in enumerate(text.splitlines(), 1):
+        words = line.split("//")[0].split()
+        if len(words) == 0:
+            continue
+        op = TEXT_OPS.get(words[0])
+        try:
+            if op == Op.PUSH or op == Op.POP:
+                instruction = Instruction(op, TEXT_SEGMENTS[words[1]], int(words[2]))
+            elif op == Op.CALL or op == Op.FUNCTION:
+                instruction = Instruction(op, words[1], int(words[2]))
+            elif op in (Op.LABEL, Op.GOTO, Op.IF_GOTO):
+                instruction = Instruction(op, words[1], None)
+            elif op is not None:
+                instruction = Instruction(op, None, None)
+            if op is None or len(words) != len(formatInstruction(instruction).split()):
+                raise ValueError()
+        except (KeyError, IndexError, ValueError):
+            raise ValueError("line " + str(lineNumber) + ": invalid VM command '" + line.strip() + "'")
+        instructions.append(instruction)
+    return instructions
 
 class VMWriter:
-    
-    # Creates a new VM file and prepares it for writing
-    def __init__(self, outFilePath):
-        self.outFile = open(outFilePath,"w",encoding="utf-8")
+
+    # Prepares a VM file for writing. Commands are kept as Instruction records in
+    # self.instructions and only written to outFilePath on close()
+    # streaming: flush() writes the buffered instructions out early (to a temporary file that
+    # replaces outFilePath on close), so the buffer only holds what was written since
+    def __init__(self, outFilePath, streaming=False):
+        self.outFilePath = outFilePath
+        self.instructions = []
+        self.streaming = streaming
+        self.__flushedCount = 0
+        self.__tempFile = None
 
 
     def __segmentDecoder(self, segment):
-        segment = segment.upper()
-        if segment == "CONST":
-            return "constant"
-        elif segment == "ARG":
-            return "argument"
-        elif segment == "LOCAL" or segment == "VAR":
-            return "local"
-        elif segment == "STATIC":
-            return "static"
-        elif segment == "FIELD":
-            return "this"
-        elif segment == "THAT":
-            return "that"
-        elif segment == "POINTER":
-            return "pointer"
-        elif segment == "TEMP":
-            return "temp"
-        else:
+        if isinstance(segment, Segment):
+            return segment
+        decoded = SEGMENT_NAMES.get(segment.upper())
+        if decoded is None:
             sys.exit("ERROR: Unknown segment " + segment)
-        
+        return decoded
+
     # Writes a VM Push command
-    # segment: (CONST, ARG, LOCAL, STATIC, THIS, THAT, POINTER, TEMP)
+    # segment: Segment or (CONST, ARG, LOCAL, STATIC, THIS, THAT, POINTER, TEMP)
     # index: int
     def writePush(self, segment, index):
-        self.outFile.write("push " + self.__segmentDecoder(segment) + " " + str(index) + os.linesep)
+        self.instructions.append(Instruction(Op.PUSH, self.__segmentDecoder(segment), int(index)))
 
     # Writes a VM Pop command
-    # segment: (CONST, ARG, LOCAL, STATIC, THIS, THAT, POINTER, TEMP)
+    # segment: Segment or (CONST, ARG, LOCAL, STATIC, THIS, THAT, POINTER, TEMP)
     # index: int
     def writePop(self, segment, index):
-        self.outFile.write("pop " + self.__segmentDecoder(segment) + " " + str(index) + os.linesep)
+        self.instructions.append(Instruction(Op.POP, self.__segmentDecoder(segment), int(index)))
 
     # Writes a VM Arithmetic command
     # command: (ADD, SUB, NEG, EQ, GT, LR, AND, OR, NOT)
     def writeArithmetic(self, command):
-        command = command.upper()
-        if command == "ADD":
-            self.outFile.write("add" + os.linesep)
-        elif command == "LT":
-            self.outFile.write("lt" + os.linesep)
-        elif command == "GT":
-            self.outFile.write("gt" + os.linesep)
-        elif command == "AND":
-            self.outFile.write("and" + os.linesep)
-        elif command == "NEG":
-            self.outFile.write("neg" + os.linesep)
-        elif command == "SUB":
-            self.outFile.write("sub" + os.linesep)
-        elif command == "NOT":
-            self.outFile.write("not" + os.linesep)
-        elif command == "EQ":
-            self.outFile.write("eq" + os.linesep)
-        elif command == "OR":
-            self.outFile.write("or" + os.linesep)
-        else:
+        op = ARITHMETIC_NAMES.get(command.upper())
+        if op is None:
             print("implement writeArithmetic for " + command)
+        else:
+            self.instructions.append(Instruction(op, None, None))
 
     # Writes a VM label command
     # label: String
     def writeLabel(self, label):
-        self.outFile.write("label " + label.upper() + os.linesep)
+        self.instructions.append(Instruction(Op.LABEL, label.upper(), None))
 
     # Writes a VM goto command
     # label: String
     def writeGoto(self, label):
-        self.outFile.write("goto " + label.upper() + os.linesep)
+        self.instructions.append(Instruction(Op.GOTO, label.upper(), None))
 
     # Writes a VM if-goto command
     # label: String
     def writeIf(self, label):
-        self.outFile.write("if-goto " + label.upper() + os.linesep)
+        self.instructions.append(Instruction(Op.IF_GOTO, label.upper(), None))
 
     # Writes a vm call command
     # name: String
     # nArgs: int
     def writeCall(self, name, nArgs):
-        self.outFile.write("call " + name + " " + str(nArgs) + os.linesep)
+        self.instructions.append(Instruction(Op.CALL, name, int(nArgs)))
 
-    # Writes a vm call command
+    # Writes a vm function command
     # name: String
     # nLocals: int
-    # Writes a vm function command
     def writeFunction(self, name, nLocals):
-        self.outFile.write("function " + name + " " + str(nLocals) + os.linesep)
+        self.instructions.append(Instruction(Op.FUNCTION, name, int(nLocals)))
 
     # Writes a vm return command
     def writeReturn(self):
-        self.outFile.write("return" + os.linesep)
+        self.instructions.append(Instruction(Op.RETURN, None, None))
 
-    # closes output file
+    # Current end of the instruction buffer, to be passed to truncate
+    def position(self):
+        return len(self.instructions)
+
+    # Drops every instruction written since position, returns the dropped instructions
+    def truncate(self, position):
+        dropped = self.instructions[position:]
+        del self.instructions[position:]
+        return dropped
+
+    # Number of instructions written so far, including the ones already flushed
+    def instructionCount(self):
+        return self.__flushedCount + len(self.instructions)
+
+    # Streaming mode: writes the buffered instructions out and empties the buffer.
+    # Does nothing otherwise, the instructions stay buffered until close()
+    def flush(self):
+        if not self.streaming or len(self.instructions) == 0:
+            return
+        if self.__tempFile is None:
+            self.__tempFile = open(self.outFilePath + ".tmp", "w", encoding="utf-8")
+        self.__tempFile.write(formatInstructions(self.instructions))
+        self.__flushedCount += len(self.instructions)
+        self.instructions = []
+
+    # Streaming mode: throws away what was flushed (e.g. after a compile error), outFilePath is untouched
+    def discard(self):
+        if self.__tempFile is not None:
+            self.__tempFile.close()
+            os.remove(self.__tempFile.name)
+            self.__tempFile = None
+
+    # Appends already built Instruction records
+    def writeInstructions(self, instructions):
+        self.instructions.extend(instructions)
+
+    # Serializes the buffered instructions and writes them to the output file in one go.
+    # The file is left untouched (keeping its mtime) when it already holds exactly the same code
+    # Returns True if the file was written
     def close(self):
-        self.outFile.close()
\ No newline at end of file
+        if self.streaming:
+            return self.__closeStream()
+        code = formatInstructions(self.instructions)
+        try:
+            with open(self.outFilePath, "r", encoding="utf-8", newline="") as existing:
+                if existing.read() == code:
+                    return False
+        except (OSError, UnicodeDecodeError):
+            pass
+        with open(self.outFilePath, "w", encoding="utf-8") as outFile:
+            outFile.write(code)
+        return True
+
+    # close() in streaming mode: the temporary file replaces outFilePath unless they are identical
+    def __closeStream(self):
+        try:
+            self.flush()
+            if self.__tempFile is None:
+                # nothing was written at all
+                self.__tempFile = open(self.outFilePath + ".tmp", "w", encoding="utf-8")
+            self.__tempFile.close()
+        except BaseException:
+            self.discard()
+            raise
+        tempPath = self.__tempFile.name
+        self.__tempFile = None
+        if os.path.exists(self.outFilePath) and filecmp.cmp(tempPath, self.outFilePath, shallow=False):
+            os.remove(tempPath)
+            return False
+        os.replace(tempPath, self.outFilePath)
+        return True
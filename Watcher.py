@@ -0,0 +1,175 @@
+import os, sys, time, select, struct
+
+# File watchers for JackCompiler.py --watch. Both report the .jack files that were written,
+# created, moved or deleted under the watched paths since the last call to wait().
+# InotifyWatcher uses Linux inotify (through ctypes, no extra packages) and sleeps until the
+# kernel reports a change; PollingWatcher compares file sizes and modification times instead.
+
+# Paths to watch: directories recursively, files through their directory
+def watchRoots(paths):
+    roots = []
+    for path in paths:
+        path = os.path.normpath(os.path.abspath(path))
+        if os.path.isdir(path):
+            roots.append((path, True))
+        else:
+            roots.append((os.path.dirname(path), False))
+    return roots
+
+class PollingWatcher:
+    # interval: seconds between two scans of the watched trees
+    def __init__(self, paths, interval=0.5):
+        self.roots = watchRoots(paths)
+        self.interval = interval
+        self.__snapshot = self.__scan()
+
+    # (size, mtime) of every .jack file under the roots; only stats, files aren't read
+    def __scan(self):
+        snapshot = {}
+        for root, recursive in self.roots:
+            pending = [root]
+            while len(pending) > 0:
+                try:
+                    entries = list(os.scandir(pending.pop()))
+                except OSError:
+                    continue
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    try:
+                        if entry.is_dir():
+                            if recursive:
+                                pending.append(entry.path)
+                        elif entry.name.endswith(".jack"):
+                            stat = entry.stat()
+                            snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+                    except OSError:
+                        pass
+        return snapshot
+
+    # Waits up to timeout seconds (forever if None) for changes
+    # Returns the set of changed .jack paths, empty if nothing changed in time
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self.__scan()
+            changed = set(path for path in snapshot.keys() | self.__snapshot.keys() if snapshot.get(path) != self.__snapshot.get(path))
+            self.__snapshot = snapshot
+            if len(changed) > 0:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return changed
+            time.sleep(self.interval if deadline is None else max(0, min(self.interval, deadline - time.monotonic())))
+
+    def close(self):
+        pass
+
+# inotify event flags, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ISDIR = 0x40000000
+IN_IGNORED = 0x00008000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+
+class InotifyWatcher:
+    # Raises OSError when inotify isn't available (not Linux, no libc, out of watches)
+    def __init__(self, paths):
+        import ctypes, ctypes.util
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self.__libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.__fd = self.__libc.inotify_init1(os.O_CLOEXEC)
+        if self.__fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.__directories = {} # watch descriptor -> (directory, recursive)
+        try:
+            for root, recursive in watchRoots(paths):
+                self.__watchTree(root, recursive)
+        except OSError:
+            self.close()
+            raise
+
+    def __watch(self, directory, recursive):
+        import ctypes
+        wd = self.__libc.inotify_add_watch(self.__fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed for " + directory)
+        self.__directories[wd] = (directory, recursive)
+
+    def __watchTree(self, root, recursive):
+        self.__watch(root, recursive)
+        if recursive:
+            for directory, subDirectories, files in os.walk(root):
+                subDirectories[:] = [name for name in subDirectories if not name.startswith(".")]
+                for name in subDirectories:
+                    self.__watch(os.path.join(directory, name), True)
+
+    # Reads the pending events, returns the changed .jack paths
+    def __readEvents(self):
+        changed = set()
+        data = os.read(self.__fd, 65536)
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0"))
+            offset += EVENT_HEADER.size + length
+            if mask & IN_IGNORED:
+                self.__directories.pop(wd, None)
+                continue
+            directory, recursive = self.__directories.get(wd, (None, False))
+            if directory is None or name.startswith("."):
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    # a new sub-directory, its files may already be there
+                    try:
+                        self.__watchTree(path, True)
+                    except OSError:
+                        pass
+                    for subDirectory, subDirectories, files in os.walk(path):
+                        changed.update(os.path.join(subDirectory, file) for file in files if file.endswith(".jack"))
+            elif name.endswith(".jack") and not mask & IN_CREATE:
+                # a created file is reported again when it is closed after writing
+                changed.add(path)
+        return changed
+
+    # Waits up to timeout seconds (forever if None) for changes
+    # Returns the set of changed .jack paths, empty if nothing changed in time
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            ready, unused, unused = select.select([self.__fd], [], [], remaining)
+            if len(ready) == 0:
+                return set()
+            changed = self.__readEvents()
+            if len(changed) > 0:
+                return changed
+
+    def close(self):
+        if self.__fd >= 0:
+            os.close(self.__fd)
+            self.__fd = -1
+
+# Returns an InotifyWatcher where inotify works, a PollingWatcher otherwise
+def createWatcher(paths, interval=0.5):
+    try:
+        return InotifyWatcher(paths)
+    except (OSError, AttributeError):
+        return PollingWatcher(paths, interval)
+
+# Waits for a change, then keeps collecting until no change arrived for delay seconds,
+# so a burst of saves (or a checkout) is compiled once
+# Returns the set of changed .jack paths
+def waitForChanges(watcher, delay=0.2):
+    changed = watcher.wait()
+    while True:
+        more = watcher.wait(delay)
+        if len(more) == 0:
+            return changed
+        changed |= more